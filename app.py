@@ -2,6 +2,13 @@ from flask import Flask
 from flask_cors import CORS
 from flask_apscheduler import APScheduler
 from config import configure_app, db
+from utils.schema import sync_schema
+from utils.scheduler import init_scheduler
+from utils.fulltext import fulltext_backend
+from utils.auth import init_auth
+from utils.summary_cache import summary_cache
+from utils.routine_cache import routine_cache
+from utils.report_jobs import init_report_workers, prune_report_jobs
 from blueprints.auth.auth_bp import auth_bp
 from blueprints.user.user_bp import user_bp
 from blueprints.ai.ai_bp import ai_bp
@@ -10,15 +17,20 @@ from blueprints.doctor.doctor_bp import doctor_bp
 from blueprints.prescription.prescription_bp import prescription_bp
 from blueprints.appointment.appointment_bp import appointment_bp
 from blueprints.hospital.hospital_bp import hospital_bp
+from blueprints.patient.patient_bp import patient_bp
 from blueprints.management.management_bp import (parking_bp, garbage_sensor_bp,fire_sensor_bp, energy_usage_bp, water_usage_bp,sensor_bp)
-from models import Appointment
+from models import Appointment, AppointmentEvent, Prescription, CacheInvalidation, EXPIRY_EXEMPT_STATUSES
+from blueprints.appointment.events import record_events
 from blueprints.hospital.models import Hospital
 from blueprints.management.models import (ParkingLot, Sensor, Garbage,EmergencyReport, EnergyUsage, WaterUsage)
-from datetime import datetime
+from sqlalchemy import select, update, delete
+from datetime import datetime, timedelta
+import time
 
 app = Flask(__name__)
 configure_app(app)
 CORS(app, resources={r"/*": {"origins": "*"}})
+init_auth(app)
 
 app.register_blueprint(auth_bp, url_prefix="/auth")
 app.register_blueprint(user_bp, url_prefix="/user")
@@ -28,6 +40,7 @@ app.register_blueprint(doctor_bp, url_prefix='/doctor')
 app.register_blueprint(prescription_bp, url_prefix='/prescription')
 app.register_blueprint(appointment_bp, url_prefix='/appointment')
 app.register_blueprint(hospital_bp,url_prefix='/hospital')
+app.register_blueprint(patient_bp, url_prefix='/patient')
 app.register_blueprint(parking_bp, url_prefix='/parking')
 app.register_blueprint(garbage_sensor_bp, url_prefix='/garbage')
 app.register_blueprint(fire_sensor_bp, url_prefix='/fire')
@@ -38,18 +51,95 @@ app.register_blueprint(sensor_bp,url_prefix='/sensor')
 # APScheduler setup
 scheduler = APScheduler()
 
+# Expires overdue appointments with set-based UPDATEs of at most EXPIRY_SWEEP_CHUNK_SIZE rows,
+# each committed on its own so row locks are only held for one chunk at a time
 def update_expired_appointments():
-    now = datetime.now()
-    expired_appointments = Appointment.query.filter(Appointment.appointment_date < now, Appointment.status != 'completed', Appointment.status != 'expired').all()
-    for appointment in expired_appointments:
-        appointment.status = 'expired'
-    db.session.commit()
+    with app.app_context():
+        started = time.perf_counter()
+        now = datetime.now()
+        chunk_size = app.config['EXPIRY_SWEEP_CHUNK_SIZE']
+        total = 0
+        chunks = 0
+
+        while True:
+            overdue_ids = (
+                select(Appointment.id)
+                .where(Appointment.appointment_date < now, Appointment.status.notin_(EXPIRY_EXEMPT_STATUSES))
+                .limit(chunk_size)
+                .with_for_update(skip_locked=True)
+            )
+            expired = db.session.execute(
+                update(Appointment)
+                .where(Appointment.id.in_(overdue_ids), Appointment.status.notin_(EXPIRY_EXEMPT_STATUSES))
+                .values(status='expired', version=Appointment.version + 1)
+                .returning(Appointment.id, Appointment.doctor_clerkid, Appointment.patient_clerkid, Appointment.appointment_date, Appointment.status)
+                .execution_options(synchronize_session=False)
+            ).all()
+            record_events('expired', expired)
+            db.session.commit()
+
+            total += len(expired)
+            chunks += 1
+            if len(expired) < chunk_size:
+                break
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        app.logger.info("Expired %d appointments in %d chunk(s) in %.1f ms", total, chunks, elapsed_ms)
+        return {'rows': total, 'chunks': chunks, 'elapsed_ms': round(elapsed_ms, 1)}
+
+# Trims the appointment change log that backs /appointment/stream and /appointment/changes
+def prune_appointment_events():
+    with app.app_context():
+        cutoff = datetime.now() - timedelta(days=app.config['APPOINTMENT_EVENT_RETENTION_DAYS'])
+        result = db.session.execute(delete(AppointmentEvent).where(AppointmentEvent.created_at < cutoff))
+        db.session.commit()
+        app.logger.info("Pruned %d appointment events", result.rowcount)
+
+# Trims the cache invalidation log; workers only read its recent tail
+def prune_cache_invalidations():
+    with app.app_context():
+        cutoff = datetime.now() - timedelta(hours=app.config['CACHE_INVALIDATION_RETENTION_HOURS'])
+        result = db.session.execute(delete(CacheInvalidation).where(CacheInvalidation.created_at < cutoff))
+        db.session.commit()
+        app.logger.info("Pruned %d cache invalidations", result.rowcount)
+
+# Keeps the report summary cache within its age and size limits
+def prune_summary_cache():
+    with app.app_context():
+        expired, overflow = summary_cache.prune()
+        app.logger.info("Pruned %d expired and %d overflow report summaries", expired, overflow)
+
+# Keeps the shared routine cache within its size limit and decays goal popularity
+def prune_routine_cache():
+    with app.app_context():
+        idle, overflow = routine_cache.prune()
+        app.logger.info("Pruned %d idle and %d unpopular cached routines", idle, overflow)
+
+# Drops finished report jobs once clients no longer poll them
+def prune_finished_report_jobs():
+    with app.app_context():
+        app.logger.info("Pruned %d finished report jobs", prune_report_jobs(app))
 
 with app.app_context():
     db.create_all()
+    sync_schema(app)
+    try:
+        fulltext_backend(Prescription, 'prescription_text', app.config['FULLTEXT_BACKEND']).ensure()
+    except Exception as e:
+        app.logger.warning("Could not set up prescription full-text search: %s", e)
     scheduler.add_job(id='update_expired_appointments', func=update_expired_appointments, trigger='interval', minutes=45)
-    scheduler.init_app(app)
-    scheduler.start()
+    scheduler.add_job(id='prune_appointment_events', func=prune_appointment_events, trigger='interval', hours=6)
+    scheduler.add_job(id='prune_cache_invalidations', func=prune_cache_invalidations, trigger='interval', hours=6)
+    scheduler.add_job(id='prune_summary_cache', func=prune_summary_cache, trigger='interval', hours=6)
+    scheduler.add_job(id='prune_routine_cache', func=prune_routine_cache, trigger='interval', hours=24)
+    scheduler.add_job(id='prune_finished_report_jobs', func=prune_finished_report_jobs, trigger='interval', hours=6)
+
+# Only the elected leader process runs the jobs, see utils/scheduler.py for SCHEDULER_MODE
+leader_elector = init_scheduler(app, scheduler)
+
+# Report uploads are processed off the request threads, see utils/report_jobs.py for REPORT_WORKER_MODE
+report_workers = init_report_workers(app)
+app.extensions['report_workers'] = report_workers
 
 # Default Route
 @app.route('/')
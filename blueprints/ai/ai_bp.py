@@ -1,29 +1,55 @@
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, request, jsonify, current_app, url_for, Response, stream_with_context
 from flasgger import swag_from
-from utils.file_upload import handle_file_upload
-from utils.gemini import summarize_text, routine_generator
-from models import db, TextReport, User, Routine
+from utils.gemini import routine_generator, ROUTINE_PROMPT
+from utils.ai_gateway import ai_gateway, AIGatewayBusy, AIGatewayTimeout
+from models import db, TextReport, Routine, ReportJob
+from sqlalchemy import select
+from sqlalchemy.orm import defer
+from werkzeug.exceptions import RequestEntityTooLarge
+from utils.identity import resolve_user
+from utils.summary_cache import summary_cache, file_key
+from utils.report_jobs import enqueue_report_job, finished_report_job, serialize_report_job
+from utils.routine_cache import routine_cache, routine_key
 
 
 ai_bp = Blueprint('ai_bp', __name__)
 
+# Room in an upload request for the multipart framing and the clerkid/file_url fields
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+
 @ai_bp.route('/upload', methods=['POST'])
 @swag_from({
     'summary': 'Upload a File to extract text and generate Summary',
+    'description': 'Text extraction and summarization run in a background job; poll the returned status_url. Uploads whose summary is already cached are answered at once.',
     'tags': ['Reports'],
     'responses': {
         200: {
-            'description': 'Text extracted and summarized successfully',
-            'examples': {'application/json': {'summarized_text': 'Summarized result here'}}
+            'description': 'Summary served from the cache, no job needed',
+            'examples': {'application/json': {'job_id': '6f1c...', 'status': 'done', 'summarized_text': 'Summarized result here'}}
+        },
+        202: {
+            'description': 'Upload stored and queued for processing',
+            'examples': {'application/json': {'job_id': '6f1c...', 'status': 'queued', 'status_url': '/ai/jobs/6f1c...'}}
         },
         400: {
             'description': 'File upload error or unsupported format',
             'examples': {'application/json': {'error': 'File not supported'}}
+        },
+        413: {
+            'description': 'File larger than REPORT_UPLOAD_MAX_BYTES',
+            'examples': {'application/json': {'error': 'File is too large'}}
         }
     }
 })
 def upload_and_process():
-    file = request.files.get('file')  # Get the uploaded file from form-data
+    # Oversized bodies are refused while parsing, before they are spooled or read
+    max_bytes = current_app.config['REPORT_UPLOAD_MAX_BYTES']
+    request.max_content_length = max_bytes + UPLOAD_FORM_OVERHEAD_BYTES
+    try:
+        file = request.files.get('file')  # Get the uploaded file from form-data
+    except RequestEntityTooLarge:
+        return jsonify({"error": "File is too large"}), 413
     if not file:
         return jsonify({"error": "No file uploaded"}), 400
 
@@ -31,12 +57,6 @@ def upload_and_process():
     if file_extension not in ['pdf', 'jpg', 'jpeg', 'png']:
         return jsonify({"error": "Unsupported file format. Only PDF, JPG, JPEG, and PNG are allowed."}), 400
 
-    # Save file and extract text
-    text = handle_file_upload(file)
-
-    # Summarize or analyze the extracted text using Gemini API
-    summarized_text = summarize_text(text)
-
     # Get clerkid and file_url from form-data
     clerkid = request.form.get('clerkid')  # Use request.form for form-data
     file_url = request.form.get('file_url')
@@ -46,23 +66,89 @@ def upload_and_process():
         return jsonify({"error": "File URL is missing from the request"}), 400
 
     # Query the User table to find the user based on clerkid
-    user = User.query.filter_by(clerkid=clerkid).first()
+    user = resolve_user(clerkid)
     if not user:
         return jsonify({"error": "User not found"}), 400
 
-    # Save summarized text and file URL to the database
-    text_report = TextReport(
-        clerkid=clerkid,
-        summarized_text=summarized_text,
-        file_url=file_url
-    )
+    data = file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        return jsonify({"error": "File is too large"}), 413
+
+    # A byte-identical re-upload is answered from the summary cache without a job
+    summarized_text = summary_cache.get(file_key(data))
+    if summarized_text is not None:
+        text_report = TextReport(clerkid=clerkid, summarized_text=summarized_text, file_url=file_url)
+        db.session.add(text_report)
+        db.session.flush()
+        job = finished_report_job(clerkid, file_url, file_extension, text_report.id)
+        db.session.commit()
+        return jsonify({"job_id": job.id, "status": job.status, "summarized_text": summarized_text}), 200
 
-    db.session.add(text_report)
+    # Otherwise extraction and summarization run on the report worker pool
+    job = enqueue_report_job(clerkid, file_url, file_extension, data)
     db.session.commit()
+    report_workers = current_app.extensions.get('report_workers')
+    if report_workers is not None:
+        report_workers.wake()
 
-    # Return summarized text
-    return jsonify({"summarized_text": summarized_text}), 200
+    status_url = url_for('ai_bp.get_report_job', job_id=job.id)
+    return jsonify({"job_id": job.id, "status": job.status, "status_url": status_url}), 202, {'Location': status_url}
 
+@ai_bp.route('/jobs/<job_id>', methods=['GET'])
+@swag_from({
+    'summary': 'Progress and result of a report upload job',
+    'tags': ['Reports'],
+    'parameters': [
+        {
+            'name': 'job_id',
+            'in': 'path',
+            'required': True,
+            'description': 'The job_id returned by /ai/upload',
+            'schema': {'type': 'string'}
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Job status; summarized_text is set once status is done',
+            'examples': {
+                'application/json': {
+                    'job_id': '6f1c...',
+                    'status': 'running',
+                    'stage': 'summarizing',
+                    'attempts': 1,
+                    'error': None,
+                    'report_id': None,
+                    'summarized_text': None,
+                    'created_at': '2025-01-17T18:30:00',
+                    'started_at': '2025-01-17T18:30:01',
+                    'finished_at': None
+                }
+            }
+        },
+        404: {
+            'description': 'No such job',
+            'examples': {'application/json': {'error': 'Job not found'}}
+        }
+    }
+})
+def get_report_job(job_id):
+    # The upload bytes are deferred, polling never loads them
+    job = db.session.execute(
+        select(ReportJob).options(defer(ReportJob.data)).where(ReportJob.id == job_id)
+    ).scalar()
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    summarized_text = None
+    if job.text_report_id is not None:
+        summarized_text = db.session.execute(
+            select(TextReport.summarized_text).where(TextReport.id == job.text_report_id)
+        ).scalar()
+
+    response = jsonify(serialize_report_job(job, summarized_text))
+    if job.status in ('queued', 'running'):
+        response.headers['Retry-After'] = '2'
+    return response, 200
 
 @ai_bp.route('/get-reports/<clerkid>', methods=['GET'])
 @swag_from({
@@ -108,7 +194,7 @@ def upload_and_process():
 })
 def get_reports(clerkid):
     # Query the User table to find the user based on clerkid
-    user = User.query.filter_by(clerkid=clerkid).first()
+    user = resolve_user(clerkid)
     if not user:
         return jsonify({"error": "User not found"}), 400
 
@@ -200,11 +286,14 @@ def generate_routine():
     if not clerkid:
         return jsonify({'error': 'Clerk ID is required'}), 400
 
-    query = f"generate me a 30 days plan for {goal} in md format without any extra description. only answer the question if the goal is health or wellness related because this is for a hospital website, if its not health related then return that the goal is not health related."
-
     try:
-        routine = routine_generator(query)
-        
+        # Goals that canonicalize the same ('Lose weight.', 'i want to lose weight') share one generated routine
+        key = routine_key(goal)
+        routine = routine_cache.get(key, goal)
+        if routine is None:
+            routine = routine_generator(ROUTINE_PROMPT.format(goal=goal))
+            routine_cache.put(key, goal, routine)
+
         # Save the routine to the database
         new_routine = Routine(
             clerkid=clerkid,
@@ -215,9 +304,122 @@ def generate_routine():
         db.session.commit()
 
         return jsonify({'routine': routine}), 200
+    except AIGatewayBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    except AIGatewayTimeout as e:
+        return jsonify({'error': str(e)}), 504
     except Exception as e:
         return jsonify({'error': f'An error occurred during routine generation: {str(e)}'}), 500
 
+@ai_bp.route('/routine/stream', methods=['POST'])
+@swag_from({
+    'summary': 'Generate a health-related routine, streamed as server-sent events',
+    'description': 'Same body as /ai/routine. The plan arrives as "chunk" events while the model writes it; '
+                   'the "done" event follows once it has been saved as a Routine. A failure mid-stream ends with an "error" event.',
+    'tags': ['Routine'],
+    'produces': ['text/event-stream'],
+    'requestBody': {
+        'required': True,
+        'content': {
+            'application/json': {
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'goal': {'type': 'string', 'description': 'The health-related goal for the routine generation'},
+                        'clerkid': {'type': 'string', 'description': 'The unique clerk ID of the user'}
+                    },
+                    'required': ['goal', 'clerkid']
+                },
+                'example': {
+                    'goal': 'lose weight through healthy eating and exercise',
+                    'clerkid': '12345'
+                }
+            }
+        }
+    },
+    'responses': {
+        200: {
+            'description': 'Event stream of routine text',
+            'examples': {
+                'text/event-stream': 'event: chunk\ndata: {"text": "## Day 1\\n- Morning walk "}\n\nevent: done\ndata: {"routine_id": 12, "cached": false}'
+            }
+        },
+        400: {
+            'description': 'Validation error',
+            'examples': {'application/json': {'error': 'Goal is required'}}
+        },
+        503: {
+            'description': 'Too many AI calls in flight, retry later',
+            'examples': {'application/json': {'error': 'The AI service is busy, please retry shortly.'}}
+        },
+        504: {
+            'description': 'The model did not start answering in time',
+            'examples': {'application/json': {'error': 'Model did not answer within 60s'}}
+        }
+    }
+})
+def stream_routine():
+    data = request.json or {}
+    goal = data.get('goal')
+    clerkid = data.get('clerkid')
+
+    if not goal:
+        return jsonify({'error': 'Goal is required'}), 400
+
+    if not clerkid:
+        return jsonify({'error': 'Clerk ID is required'}), 400
+
+    # Checked up front: once the stream has started, errors can no longer change the status code
+    if not resolve_user(clerkid):
+        return jsonify({'error': 'User not found'}), 400
+
+    key = routine_key(goal)
+    cached = routine_cache.get(key, goal)
+    if cached is not None:
+        chunks = (chunk for chunk in ())
+        first = cached
+    else:
+        # Wait for the first chunk before answering, so a busy or unresponsive model still gets a proper status
+        chunks = ai_gateway.stream(ROUTINE_PROMPT.format(goal=goal))
+        try:
+            first = next(chunks, '')
+        except AIGatewayBusy as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+        except AIGatewayTimeout as e:
+            return jsonify({'error': str(e)}), 504
+        except Exception as e:
+            return jsonify({'error': f'An error occurred during routine generation: {str(e)}'}), 500
+
+    def generate():
+        parts = [first]
+        try:
+            yield f"event: chunk\ndata: {json.dumps({'text': first})}\n\n"
+            for chunk in chunks:
+                parts.append(chunk)
+                yield f"event: chunk\ndata: {json.dumps({'text': chunk})}\n\n"
+        except Exception as e:
+            db.session.rollback()
+            yield f"event: error\ndata: {json.dumps({'error': f'An error occurred during routine generation: {str(e)}'})}\n\n"
+            return
+        finally:
+            # Also runs when the client disconnects, which frees the gateway slot at once
+            chunks.close()
+
+        # Only complete plans are saved; a client that disconnects early gets nothing persisted
+        routine = ''.join(parts)
+        if cached is None:
+            routine_cache.put(key, goal, routine)
+        new_routine = Routine(clerkid=clerkid, goal=goal, routine=routine)
+        db.session.add(new_routine)
+        db.session.commit()
+        yield f"event: done\ndata: {json.dumps({'routine_id': new_routine.id, 'cached': cached is not None})}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @ai_bp.route('/get-routines/<clerkid>', methods=['GET'])
 @swag_from({
     'summary': 'Fetch all routines for a user by clerkid',
@@ -262,7 +464,7 @@ def generate_routine():
 })
 def get_routines(clerkid):
     # Query the User table to find the user based on clerkid
-    user = User.query.filter_by(clerkid=clerkid).first()
+    user = resolve_user(clerkid)
     if not user:
         return jsonify({"error": "User not found"}), 400
 
@@ -279,4 +481,33 @@ def get_routines(clerkid):
         for routine in routines
     ]
 
-    return jsonify({"routines": response_data}), 200
\ No newline at end of file
+    return jsonify({"routines": response_data}), 200
+
+@ai_bp.route('/gateway-stats', methods=['GET'])
+@swag_from({
+    'summary': 'Queueing and latency metrics of this worker\'s AI gateway',
+    'tags': ['Reports'],
+    'responses': {
+        200: {
+            'description': 'Gateway metrics',
+            'examples': {
+                'application/json': {
+                    'backend': 'gemini',
+                    'max_concurrency': 4,
+                    'in_flight': 1,
+                    'waiting': 0,
+                    'calls': 120,
+                    'completed': 117,
+                    'failed': 1,
+                    'timed_out': 1,
+                    'rejected': 1,
+                    'avg_wait_ms': 12.5,
+                    'max_wait_ms': 840.0,
+                    'avg_call_ms': 4210.3
+                }
+            }
+        }
+    }
+})
+def get_gateway_stats():
+    return jsonify(ai_gateway.stats()), 200
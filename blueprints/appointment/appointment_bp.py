@@ -1,13 +1,47 @@
-from flask import Blueprint, request, jsonify, current_app as app
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app as app, g
 from flasgger import swag_from
-from flask_apscheduler import APScheduler
 from config import db
-from models import Appointment, User
+from models import Appointment, DoctorDetails
 from blueprints.hospital.models import Hospital # Import Hospital model
-from datetime import datetime
+from blueprints.appointment.events import record_events, appointment_feed, parse_event_cursor, format_event_cursor
+from blueprints.appointment.slots import (slot_length, weekly_template, doctor_template, is_within_availability, is_slot_taken, booked_index, booked_indexes, free_slots)
+from utils.pagination import encode_cursor, decode_cursor, parse_limit, parse_datetime, parse_iso_datetime, keyset_after
+from utils.identity import resolve_user, resolve_users
+from utils.auth import authorize, STAFF_ROLES
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+import json
+import time
 
 appointment_bp = Blueprint('appointment_bp', __name__)
 
+SLOT_TAKEN_ERROR = "Doctor already has an appointment in this time slot"
+BULK_ADD_LIMIT = 1000
+# Allowed status changes through update-appointment-status: new status -> statuses it may replace.
+# 'expired' is only ever set by the expiry sweep.
+STATUS_TRANSITIONS = {
+    'approved': ('pending',),
+    'rejected': ('pending',),
+    'completed': ('approved',)
+}
+CALENDAR_MAX_DAYS = 62
+# Sent with the 503 when APPOINTMENT_STREAM_MAX_CONNECTIONS streams are already open
+STREAM_RETRY_AFTER_SECONDS = 5
+
+# Saves a new appointment and its change-log entry, relying on the unique
+# booked-slot index to catch a concurrent double booking
+def save_appointment(appointment):
+    db.session.add(appointment)
+    try:
+        db.session.flush()
+        record_events('created', [appointment])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
 # Route to add an appointment (used by doctor)
 @appointment_bp.route('/add-appointment', methods=['POST'])
 @swag_from({
@@ -39,6 +73,10 @@ appointment_bp = Blueprint('appointment_bp', __name__)
         400: {
             'description': 'Validation error',
             'examples': {'application/json': {'error': 'Validation error'}}
+        },
+        409: {
+            'description': 'The doctor already has an appointment in this time slot',
+            'examples': {'application/json': {'error': SLOT_TAKEN_ERROR}}
         }
     }
 })
@@ -51,25 +89,39 @@ def add_appointment():
     text_field = data.get('text_field')
     hospital_id = data.get('hospital_id')  # Get hospital_id from request
 
-    doctor = User.query.filter_by(clerkid=doctor_clerkid).first()
-    patient = User.query.filter_by(clerkid=patient_clerkid).first()
+    # Only the doctor themselves may book directly into their schedule
+    denied = authorize(doctor_clerkid, ('DOCTOR',))
+    if denied:
+        return denied
+
+    users = resolve_users([doctor_clerkid, patient_clerkid])
+    doctor = users.get(doctor_clerkid)
+    patient = users.get(patient_clerkid)
 
     if not doctor or doctor.role != 'DOCTOR':
         return jsonify({"error": "Doctor not found"}), 400
     if not patient or patient.role != 'PATIENT':
         return jsonify({"error": "Patient not found"}), 400
 
+    try:
+        appointment_date = parse_iso_datetime(appointment_date)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid appointment_date format. Use ISO 8601."}), 400
+
+    if is_slot_taken(doctor_clerkid, appointment_date):
+        return jsonify({"error": SLOT_TAKEN_ERROR}), 409
+
     appointment = Appointment(
         doctor_clerkid=doctor_clerkid,
         patient_clerkid=patient_clerkid,
-        appointment_date=datetime.fromisoformat(appointment_date),
+        appointment_date=appointment_date,
         status='approved',
         text_field=text_field,
         hospital_id=hospital_id  # Include hospital_id in the appointment
     )
 
-    db.session.add(appointment)
-    db.session.commit()
+    if not save_appointment(appointment):
+        return jsonify({"error": SLOT_TAKEN_ERROR}), 409
 
     return jsonify({"message": "Appointment added successfully"}), 201
 
@@ -102,8 +154,12 @@ def add_appointment():
             'examples': {'application/json': {'message': 'Appointment request added successfully'}}
         },
         400: {
-            'description': 'Validation error',
-            'examples': {'application/json': {'error': 'Validation error'}}
+            'description': 'Validation error or the doctor is not available at this time',
+            'examples': {'application/json': {'error': 'Doctor is not available at this time'}}
+        },
+        409: {
+            'description': 'The doctor already has an appointment in this time slot',
+            'examples': {'application/json': {'error': SLOT_TAKEN_ERROR}}
         }
     }
 })
@@ -116,32 +172,193 @@ def request_appointment():
     text_field = data.get('text_field')
     hospital_id = data.get('hospital_id')  # Get hospital_id from request
 
-    doctor = User.query.filter_by(clerkid=doctor_clerkid).first()
-    patient = User.query.filter_by(clerkid=patient_clerkid).first()
+    # Patients request appointments for themselves only
+    denied = authorize(patient_clerkid, ('PATIENT',))
+    if denied:
+        return denied
+
+    users = resolve_users([doctor_clerkid, patient_clerkid])
+    doctor = users.get(doctor_clerkid)
+    patient = users.get(patient_clerkid)
 
     if not doctor or doctor.role != 'DOCTOR':
         return jsonify({"error": "Doctor not found"}), 400
     if not patient or patient.role != 'PATIENT':
         return jsonify({"error": "Patient not found"}), 400
 
+    try:
+        appointment_date = parse_iso_datetime(appointment_date)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid appointment_date format. Use ISO 8601."}), 400
+
+    # Patients can only request slots inside the doctor's published availability
+    template = doctor_template(doctor_clerkid)
+    if template and not is_within_availability(template, appointment_date, slot_length()):
+        return jsonify({"error": "Doctor is not available at this time"}), 400
+
+    if is_slot_taken(doctor_clerkid, appointment_date):
+        return jsonify({"error": SLOT_TAKEN_ERROR}), 409
+
     appointment = Appointment(
         doctor_clerkid=doctor_clerkid,
         patient_clerkid=patient_clerkid,
-        appointment_date=datetime.fromisoformat(appointment_date),
+        appointment_date=appointment_date,
         status='pending',
         text_field=text_field,
         hospital_id=hospital_id  # Include hospital_id in the appointment
     )
 
-    db.session.add(appointment)
-    db.session.commit()
+    if not save_appointment(appointment):
+        return jsonify({"error": SLOT_TAKEN_ERROR}), 409
 
     return jsonify({"message": "Appointment request added successfully"}), 201
 
-# Route to accept or reject an appointment request (used by doctor)
+# Route to add many appointments at once (used by front-desk staff)
+@appointment_bp.route('/bulk-add', methods=['POST'])
+@swag_from({
+    'summary': 'Add up to 1000 appointments in one transaction, with per-item results',
+    'tags': ['Appointment'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'appointments': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'doctor_clerkid': {'type': 'string'},
+                                'patient_clerkid': {'type': 'string'},
+                                'appointment_date': {'type': 'string', 'format': 'date-time'},
+                                'text_field': {'type': 'string'},
+                                'hospital_id': {'type': 'integer'}
+                            },
+                            'required': ['doctor_clerkid', 'patient_clerkid', 'appointment_date']
+                        }
+                    }
+                },
+                'required': ['appointments']
+            }
+        }
+    ],
+    'responses': {
+        201: {
+            'description': 'At least one appointment was added; see results for the items that failed',
+            'examples': {
+                'application/json': {
+                    'created': 1,
+                    'failed': 1,
+                    'results': [
+                        {'index': 0, 'id': 42, 'status': 'created'},
+                        {'index': 1, 'status': 'failed', 'error': SLOT_TAKEN_ERROR}
+                    ]
+                }
+            }
+        },
+        400: {
+            'description': 'Malformed body, or no appointment could be added',
+            'examples': {'application/json': {'error': 'appointments must be a non-empty list'}}
+        },
+        409: {
+            'description': 'A concurrent booking took one of the slots; nothing was added',
+            'examples': {'application/json': {'error': 'A slot was booked concurrently, nothing was added. Please retry.'}}
+        }
+    }
+})
+def bulk_add_appointments():
+    data = request.json
+    items = data.get('appointments') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "appointments must be a non-empty list"}), 400
+    if len(items) > BULK_ADD_LIMIT:
+        return jsonify({"error": f"At most {BULK_ADD_LIMIT} appointments can be added at once"}), 400
+
+    # Staff may book for any doctor, a doctor only into their own schedule
+    denied = authorize(roles=STAFF_ROLES + ('DOCTOR',))
+    if denied:
+        return denied
+    identity = g.get('identity')
+    own_doctor = identity.clerkid if identity is not None and identity.role == 'DOCTOR' else None
+
+    results = [None] * len(items)
+    candidates = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('doctor_clerkid') or not item.get('patient_clerkid'):
+            results[index] = {'index': index, 'status': 'failed', 'error': 'doctor_clerkid and patient_clerkid are required'}
+            continue
+        if own_doctor is not None and item['doctor_clerkid'] != own_doctor:
+            results[index] = {'index': index, 'status': 'failed', 'error': 'Not allowed to act for this user'}
+            continue
+        try:
+            appointment_date = parse_iso_datetime(item.get('appointment_date'))
+        except (TypeError, ValueError):
+            results[index] = {'index': index, 'status': 'failed', 'error': 'Invalid appointment_date format. Use ISO 8601.'}
+            continue
+        candidates.append((index, item, appointment_date))
+
+    rows = []
+    if candidates:
+        # One IN query for every clerkid in the batch not already cached
+        clerkids = {item['doctor_clerkid'] for _, item, _ in candidates} | {item['patient_clerkid'] for _, item, _ in candidates}
+        roles = {clerkid: identity.role for clerkid, identity in resolve_users(clerkids).items()}
+
+        # One range scan for the booked slots of every doctor in the batch
+        doctor_clerkids = {item['doctor_clerkid'] for _, item, _ in candidates if roles.get(item['doctor_clerkid']) == 'DOCTOR'}
+        dates = [appointment_date for _, _, appointment_date in candidates]
+        booked = booked_indexes(doctor_clerkids, min(dates), max(dates) + slot_length()) if doctor_clerkids else {}
+
+        for index, item, appointment_date in candidates:
+            if roles.get(item['doctor_clerkid']) != 'DOCTOR':
+                results[index] = {'index': index, 'status': 'failed', 'error': 'Doctor not found'}
+            elif roles.get(item['patient_clerkid']) != 'PATIENT':
+                results[index] = {'index': index, 'status': 'failed', 'error': 'Patient not found'}
+            elif booked[item['doctor_clerkid']].conflicts(appointment_date):
+                results[index] = {'index': index, 'status': 'failed', 'error': SLOT_TAKEN_ERROR}
+            else:
+                # Later items in the same batch must not overlap this one either
+                booked[item['doctor_clerkid']].add(appointment_date)
+                rows.append((index, {
+                    'doctor_clerkid': item['doctor_clerkid'],
+                    'patient_clerkid': item['patient_clerkid'],
+                    'appointment_date': appointment_date,
+                    'status': 'approved',
+                    'text_field': item.get('text_field'),
+                    'hospital_id': item.get('hospital_id')
+                }))
+
+    if rows:
+        try:
+            inserted = db.session.execute(
+                insert(Appointment).returning(
+                    Appointment.id, Appointment.doctor_clerkid, Appointment.patient_clerkid,
+                    Appointment.appointment_date, Appointment.status, sort_by_parameter_order=True
+                ),
+                [row for _, row in rows]
+            ).all()
+            record_events('created', inserted)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({"error": "A slot was booked concurrently, nothing was added. Please retry."}), 409
+
+        for (index, _), appointment in zip(rows, inserted):
+            results[index] = {'index': index, 'id': appointment.id, 'status': 'created'}
+
+    created = len(rows)
+    return jsonify({
+        'created': created,
+        'failed': len(items) - created,
+        'results': results
+    }), 201 if created else 400
+
+# Route to accept, reject or complete an appointment (used by doctor)
 @appointment_bp.route('/update-appointment-status/<id>', methods=['PATCH'])
 @swag_from({
-    'summary': 'Update the status of an appointment request',
+    'summary': 'Update the status of an appointment: pending -> approved/rejected, approved -> completed',
     'tags': ['Appointment'],
     'parameters': [
         {
@@ -158,8 +375,9 @@ def request_appointment():
             'schema': {
                 'type': 'object',
                 'properties': {
-                    'status': {'type': 'string', 'enum': ['approved', 'rejected']},
-                    'text_field': {'type': 'string'}
+                    'status': {'type': 'string', 'enum': ['approved', 'rejected', 'completed']},
+                    'text_field': {'type': 'string'},
+                    'version': {'type': 'integer', 'description': 'Version the client last saw; the update fails with 409 if it changed since'}
                 },
                 'required': ['status']
             }
@@ -168,11 +386,15 @@ def request_appointment():
     'responses': {
         200: {
             'description': 'Appointment status updated successfully',
-            'examples': {'application/json': {'message': 'Appointment status updated successfully'}}
+            'examples': {'application/json': {'message': 'Appointment status updated successfully', 'status': 'approved', 'version': 2}}
         },
         400: {
             'description': 'Validation error',
-            'examples': {'application/json': {'error': 'Validation error'}}
+            'examples': {'application/json': {'error': 'Appointment not found'}}
+        },
+        409: {
+            'description': 'The transition is not allowed from the current status, or the version changed concurrently',
+            'examples': {'application/json': {'error': "Cannot change status from 'expired' to 'approved'", 'status': 'expired', 'version': 3}}
         }
     }
 })
@@ -181,23 +403,177 @@ def update_appointment_status(id):
 
     status = data.get('status')
     text_field = data.get('text_field')
+    expected_version = data.get('version')
 
-    appointment = Appointment.query.get(id)
-    if not appointment:
+    try:
+        id = int(id)
+    except ValueError:
         return jsonify({"error": "Appointment not found"}), 400
 
-    appointment.status = status
+    allowed_from = STATUS_TRANSITIONS.get(status)
+    if not allowed_from:
+        return jsonify({"error": f"Status must be one of {', '.join(STATUS_TRANSITIONS)}"}), 400
+    if expected_version is not None and not isinstance(expected_version, int):
+        return jsonify({"error": "Version must be an integer"}), 400
+
+    denied = authorize(roles=('DOCTOR',))
+    if denied:
+        return denied
+
+    # Compare-and-set: the row only changes if it is still in an allowed source status
+    # (and at the expected version), so no lock is held while Python decides anything
+    # A signed-in doctor only decides on their own appointments; others look like they do not exist
+    target = [Appointment.id == id]
+    identity = g.get('identity')
+    if identity is not None:
+        target.append(Appointment.doctor_clerkid == identity.clerkid)
+    conditions = target + [Appointment.status.in_(allowed_from)]
+    if expected_version is not None:
+        conditions.append(Appointment.version == expected_version)
+    values = {'status': status, 'version': Appointment.version + 1}
     if text_field:
-        appointment.text_field = text_field
+        values['text_field'] = text_field
+
+    appointment = db.session.execute(
+        update(Appointment)
+        .where(*conditions)
+        .values(**values)
+        .returning(
+            Appointment.id, Appointment.doctor_clerkid, Appointment.patient_clerkid,
+            Appointment.appointment_date, Appointment.status, Appointment.version
+        )
+        .execution_options(synchronize_session=False)
+    ).first()
 
+    if appointment is None:
+        db.session.rollback()
+        current = db.session.execute(select(Appointment.status, Appointment.version).where(*target)).first()
+        if current is None:
+            return jsonify({"error": "Appointment not found"}), 400
+        if current.status not in allowed_from:
+            error = f"Cannot change status from '{current.status}' to '{status}'"
+        else:
+            error = "Appointment was modified concurrently, reload it and retry"
+        return jsonify({"error": error, "status": current.status, "version": current.version}), 409
+
+    record_events('status_changed', [appointment])
     db.session.commit()
 
-    return jsonify({"message": "Appointment status updated successfully"}), 200
+    return jsonify({
+        "message": "Appointment status updated successfully",
+        "status": appointment.status,
+        "version": appointment.version
+    }), 200
+
+# Projects the listing columns of appointments, with hospital names from one outer join
+def appointment_listing_query(filters):
+    return (
+        db.session.query(
+            Appointment.id,
+            Appointment.doctor_clerkid,
+            Appointment.patient_clerkid,
+            Appointment.appointment_date,
+            Appointment.status,
+            Appointment.text_field,
+            Appointment.hospital_id,
+            Appointment.version,
+            Hospital.name.label('hospital_name')
+        )
+        .outerjoin(Hospital, Appointment.hospital_id == Hospital.id)
+        .filter(*filters)
+    )
+
+def serialize_appointment_row(row):
+    return {
+        'id': row.id,
+        'doctor_clerkid': row.doctor_clerkid,
+        'patient_clerkid': row.patient_clerkid,
+        'appointment_date': row.appointment_date.isoformat(),
+        'status': row.status,
+        'text_field': row.text_field,
+        'hospital_id': row.hospital_id,
+        'hospital_name': row.hospital_name,
+        'version': row.version
+    }
+
+# Builds one page of appointments in a single joined query,
+# ordered by (appointment_date, id) and paged with a keyset cursor
+def appointment_page(filters, args):
+    limit = parse_limit(args.get('limit'))
+    date_from = parse_datetime(args.get('from'), 'from')
+    date_to = parse_datetime(args.get('to'), 'to')
+
+    query = appointment_listing_query(filters)
+
+    status = args.get('status')
+    if status:
+        query = query.filter(Appointment.status.in_(status.split(',')))
+    if date_from:
+        query = query.filter(Appointment.appointment_date >= date_from)
+    if date_to:
+        query = query.filter(Appointment.appointment_date < date_to)
+
+    cursor = args.get('cursor')
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        if not isinstance(last_date, datetime) or not isinstance(last_id, int):
+            raise ValueError("Invalid cursor")
+        query = query.filter(keyset_after((Appointment.appointment_date, Appointment.id), (last_date, last_id)))
+
+    rows = query.order_by(Appointment.appointment_date, Appointment.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].appointment_date, rows[-1].id)
+
+    return [serialize_appointment_row(row) for row in rows], next_cursor
+
+# Query parameters shared by the appointment listing routes
+APPOINTMENT_PAGE_PARAMETERS = [
+    {
+        'name': 'status',
+        'in': 'query',
+        'type': 'string',
+        'required': False,
+        'description': 'Comma-separated list of statuses to include'
+    },
+    {
+        'name': 'from',
+        'in': 'query',
+        'type': 'string',
+        'format': 'date-time',
+        'required': False,
+        'description': 'Only include appointments on or after this date'
+    },
+    {
+        'name': 'to',
+        'in': 'query',
+        'type': 'string',
+        'format': 'date-time',
+        'required': False,
+        'description': 'Only include appointments before this date'
+    },
+    {
+        'name': 'cursor',
+        'in': 'query',
+        'type': 'string',
+        'required': False,
+        'description': 'next_cursor value returned by the previous page'
+    },
+    {
+        'name': 'limit',
+        'in': 'query',
+        'type': 'integer',
+        'required': False,
+        'description': 'Page size (default 50, max 200)'
+    }
+]
 
 # Route to get all appointments by user clerkid
 @appointment_bp.route('/get-appointments/<clerkid>', methods=['GET'])
 @swag_from({
-    'summary': 'Get all appointments for a user',
+    'summary': 'Get all appointments for a user, one page at a time',
     'tags': ['Appointment'],
     'parameters': [
         {
@@ -207,61 +583,60 @@ def update_appointment_status(id):
             'required': True,
             'description': 'ClerkID of the user (doctor or patient)'
         }
-    ],
+    ] + APPOINTMENT_PAGE_PARAMETERS,
     'responses': {
         200: {
             'description': 'Appointments fetched successfully',
             'examples': {
-                'application/json': [
-                    {
-                        'id': 1,
-                        'doctor_clerkid': '1234',
-                        'patient_clerkid': '5678',
-                        'appointment_date': '2023-10-01T12:00:00',
-                        'status': 'approved',
-                        'text_field': 'Follow-up appointment',
-                        'hospital_id': 1,  # Added hospital_id
-                        'hospital_name': 'General Hospital'  # Added hospital_name
-                    }
-                ]
+                'application/json': {
+                    'appointments': [
+                        {
+                            'id': 1,
+                            'doctor_clerkid': '1234',
+                            'patient_clerkid': '5678',
+                            'appointment_date': '2023-10-01T12:00:00',
+                            'status': 'approved',
+                            'text_field': 'Follow-up appointment',
+                            'hospital_id': 1,
+                            'hospital_name': 'General Hospital',
+                            'version': 0
+                        }
+                    ],
+                    'next_cursor': 'W3siZHQiOiIyMDIzLTEwLTAxVDEyOjAwOjAwIn0sMV0'
+                }
             }
         },
         400: {
-            'description': 'User not found',
+            'description': 'User not found or invalid query parameters',
             'examples': {'application/json': {'error': 'User not found'}}
         }
     }
 })
 def get_appointments(clerkid):
-    user = User.query.filter_by(clerkid=clerkid).first()
+    denied = authorize(clerkid)
+    if denied:
+        return denied
+
+    user = resolve_user(clerkid)
     if not user:
         return jsonify({"error": "User not found"}), 400
 
     if user.role == 'DOCTOR':
-        appointments = Appointment.query.filter_by(doctor_clerkid=clerkid).all()
+        filters = [Appointment.doctor_clerkid == clerkid]
     else:
-        appointments = Appointment.query.filter_by(patient_clerkid=clerkid).all()
-
-    appointment_list = []
-    for appointment in appointments:
-        hospital = Hospital.query.get(appointment.hospital_id)  # Fetch hospital details
-        appointment_list.append({
-            'id': appointment.id,
-            'doctor_clerkid': appointment.doctor_clerkid,
-            'patient_clerkid': appointment.patient_clerkid,
-            'appointment_date': appointment.appointment_date.isoformat(),
-            'status': appointment.status,
-            'text_field': appointment.text_field,
-            'hospital_id': appointment.hospital_id,  # Include hospital_id
-            'hospital_name': hospital.name if hospital else None  # Include hospital_name
-        })
-
-    return jsonify(appointment_list), 200
+        filters = [Appointment.patient_clerkid == clerkid]
+
+    try:
+        appointment_list, next_cursor = appointment_page(filters, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"appointments": appointment_list, "next_cursor": next_cursor}), 200
 
 # Route to get all pending appointments
 @appointment_bp.route('/get-pending-appointments/<doctor_clerkid>', methods=['GET'])
 @swag_from({
-    'summary': 'Get all pending appointments for a specific doctor',
+    'summary': 'Get pending appointments for a specific doctor, one page at a time',
     'tags': ['Appointment'],
     'parameters': [
         {
@@ -271,43 +646,421 @@ def get_appointments(clerkid):
             'required': True,
             'description': 'ClerkID of the doctor'
         }
-    ],
+    ] + [parameter for parameter in APPOINTMENT_PAGE_PARAMETERS if parameter['name'] != 'status'],
     'responses': {
         200: {
             'description': 'Pending appointments fetched successfully',
             'examples': {
-                'application/json': [
-                    {
-                        'id': 1,
-                        'doctor_clerkid': '1234',
-                        'patient_clerkid': '5678',
-                        'appointment_date': '2023-10-01T12:00:00',
-                        'status': 'pending',
-                        'text_field': 'Initial consultation',
-                        'hospital_id': 1,
-                        'hospital_name': 'General Hospital'
-                    }
-                ]
+                'application/json': {
+                    'appointments': [
+                        {
+                            'id': 1,
+                            'doctor_clerkid': '1234',
+                            'patient_clerkid': '5678',
+                            'appointment_date': '2023-10-01T12:00:00',
+                            'status': 'pending',
+                            'text_field': 'Initial consultation',
+                            'hospital_id': 1,
+                            'hospital_name': 'General Hospital',
+                            'version': 0
+                        }
+                    ],
+                    'next_cursor': None
+                }
             }
+        },
+        400: {
+            'description': 'Invalid query parameters',
+            'examples': {'application/json': {'error': 'Invalid cursor'}}
         }
     }
 })
 def get_pending_appointments(doctor_clerkid):
-    appointments = Appointment.query.filter_by(status='pending', doctor_clerkid=doctor_clerkid).all()
-
-    appointment_list = []
-    for appointment in appointments:
-        hospital = Hospital.query.get(appointment.hospital_id)
-        appointment_list.append({
-            'id': appointment.id,
-            'doctor_clerkid': appointment.doctor_clerkid,
-            'patient_clerkid': appointment.patient_clerkid,
-            'appointment_date': appointment.appointment_date.isoformat(),
-            'status': appointment.status,
-            'text_field': appointment.text_field,
-            'hospital_id': appointment.hospital_id,
-            'hospital_name': hospital.name if hospital else None
-        })
-
-    return jsonify(appointment_list), 200
+    denied = authorize(doctor_clerkid, ('DOCTOR',))
+    if denied:
+        return denied
+
+    filters = [Appointment.doctor_clerkid == doctor_clerkid, Appointment.status == 'pending']
+
+    args = request.args.to_dict()
+    args.pop('status', None)
+
+    try:
+        appointment_list, next_cursor = appointment_page(filters, args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"appointments": appointment_list, "next_cursor": next_cursor}), 200
+
+# Route to get a user's appointments between two dates, bucketed by day
+@appointment_bp.route('/calendar/<clerkid>', methods=['GET'])
+@swag_from({
+    'summary': 'Get a day-by-day calendar of appointments for a user',
+    'tags': ['Appointment'],
+    'parameters': [
+        {
+            'name': 'clerkid',
+            'in': 'path',
+            'type': 'string',
+            'required': True,
+            'description': 'ClerkID of the user (doctor or patient)'
+        },
+        {
+            'name': 'from',
+            'in': 'query',
+            'type': 'string',
+            'format': 'date',
+            'required': False,
+            'description': 'First day of the range (defaults to today)'
+        },
+        {
+            'name': 'to',
+            'in': 'query',
+            'type': 'string',
+            'format': 'date',
+            'required': False,
+            'description': 'Day after the last day of the range (defaults to 7 days after from, at most 62 days)'
+        },
+        {
+            'name': 'status',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Comma-separated list of statuses to include'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Calendar fetched successfully',
+            'examples': {
+                'application/json': {
+                    'clerkid': '1234',
+                    'from': '2023-10-02',
+                    'to': '2023-10-04',
+                    'days': [
+                        {
+                            'date': '2023-10-02',
+                            'appointments': [
+                                {
+                                    'id': 1,
+                                    'doctor_clerkid': '1234',
+                                    'patient_clerkid': '5678',
+                                    'appointment_date': '2023-10-02T12:00:00',
+                                    'status': 'approved',
+                                    'text_field': 'Follow-up appointment',
+                                    'hospital_id': 1,
+                                    'hospital_name': 'General Hospital',
+                                    'version': 0
+                                }
+                            ]
+                        },
+                        {'date': '2023-10-03', 'appointments': []}
+                    ]
+                }
+            }
+        },
+        400: {
+            'description': 'User not found or invalid range',
+            'examples': {'application/json': {'error': 'User not found'}}
+        }
+    }
+})
+def get_appointment_calendar(clerkid):
+    denied = authorize(clerkid)
+    if denied:
+        return denied
+
+    user = resolve_user(clerkid)
+    if not user:
+        return jsonify({"error": "User not found"}), 400
+
+    try:
+        date_from = parse_datetime(request.args.get('from'), 'from') or datetime.now()
+        date_to = parse_datetime(request.args.get('to'), 'to')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Calendar ranges always cover whole days
+    date_from = date_from.replace(hour=0, minute=0, second=0, microsecond=0)
+    date_to = date_to.replace(hour=0, minute=0, second=0, microsecond=0) if date_to else date_from + timedelta(days=7)
+    if date_to <= date_from:
+        return jsonify({"error": "'to' must be after 'from'"}), 400
+    if date_to - date_from > timedelta(days=CALENDAR_MAX_DAYS):
+        return jsonify({"error": f"The range can span at most {CALENDAR_MAX_DAYS} days"}), 400
+
+    # Served by ix_appointments_doctor_date / ix_appointments_patient_date as a single range scan
+    owner_column = Appointment.doctor_clerkid if user.role == 'DOCTOR' else Appointment.patient_clerkid
+    query = appointment_listing_query([
+        owner_column == clerkid,
+        Appointment.appointment_date >= date_from,
+        Appointment.appointment_date < date_to
+    ])
+    status = request.args.get('status')
+    if status:
+        query = query.filter(Appointment.status.in_(status.split(',')))
+    rows = query.order_by(Appointment.appointment_date, Appointment.id).all()
+
+    days = {}
+    day = date_from
+    while day < date_to:
+        days[day.date()] = []
+        day += timedelta(days=1)
+    for row in rows:
+        days[row.appointment_date.date()].append(serialize_appointment_row(row))
+
+    return jsonify({
+        'clerkid': clerkid,
+        'from': date_from.date().isoformat(),
+        'to': date_to.date().isoformat(),
+        'days': [{'date': day.isoformat(), 'appointments': appointments} for day, appointments in days.items()]
+    }), 200
+
+# Route to list a doctor's free appointment slots
+@appointment_bp.route('/available-slots/<doctor_clerkid>', methods=['GET'])
+@swag_from({
+    'summary': 'Get the free appointment slots of a doctor between two dates',
+    'tags': ['Appointment'],
+    'parameters': [
+        {
+            'name': 'doctor_clerkid',
+            'in': 'path',
+            'type': 'string',
+            'required': True,
+            'description': 'ClerkID of the doctor'
+        },
+        {
+            'name': 'from',
+            'in': 'query',
+            'type': 'string',
+            'format': 'date-time',
+            'required': False,
+            'description': 'Start of the window (defaults to now)'
+        },
+        {
+            'name': 'to',
+            'in': 'query',
+            'type': 'string',
+            'format': 'date-time',
+            'required': False,
+            'description': 'End of the window (defaults to 7 days after from, at most 31 days)'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Free slots fetched successfully',
+            'examples': {
+                'application/json': {
+                    'doctor_clerkid': '1234',
+                    'slot_minutes': 30,
+                    'slots': [
+                        {'start': '2023-10-02T09:00:00', 'end': '2023-10-02T09:30:00'},
+                        {'start': '2023-10-02T09:30:00', 'end': '2023-10-02T10:00:00'}
+                    ]
+                }
+            }
+        },
+        400: {
+            'description': 'Doctor not found, unparseable availability or invalid window',
+            'examples': {'application/json': {'error': 'Doctor details not found'}}
+        }
+    }
+})
+def get_available_slots(doctor_clerkid):
+    try:
+        date_from = parse_datetime(request.args.get('from'), 'from') or datetime.now().replace(second=0, microsecond=0)
+        date_to = parse_datetime(request.args.get('to'), 'to') or date_from + timedelta(days=7)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if date_to <= date_from:
+        return jsonify({"error": "'to' must be after 'from'"}), 400
+    if date_to - date_from > timedelta(days=31):
+        return jsonify({"error": "The window can span at most 31 days"}), 400
+
+    details = db.session.query(DoctorDetails.available_days, DoctorDetails.available_time).filter_by(clerkid=doctor_clerkid).first()
+    if not details:
+        return jsonify({"error": "Doctor details not found"}), 400
+
+    template = weekly_template(*details)
+    if not template:
+        return jsonify({"error": "Doctor availability could not be parsed"}), 400
+
+    booked = booked_index(doctor_clerkid, date_from, date_to)
+    slots = [
+        {'start': start.isoformat(), 'end': end.isoformat()}
+        for start, end in free_slots(template, booked, date_from, date_to)
+    ]
+
+    return jsonify({
+        'doctor_clerkid': doctor_clerkid,
+        'slot_minutes': int(booked.length.total_seconds() // 60),
+        'slots': slots
+    }), 200
+
+# Route to stream a user's appointment changes as server-sent events
+@appointment_bp.route('/stream/<clerkid>', methods=['GET'])
+@swag_from({
+    'summary': 'Stream appointment changes for a user as server-sent events',
+    'description': 'The last event of each batch carries the stream cursor as its SSE id, so reconnecting clients resume via Last-Event-ID; '
+                   'events may then be sent again, clients drop those whose data.id they already have. '
+                   'The stream closes after APPOINTMENT_STREAM_SECONDS and the client reconnects.',
+    'tags': ['Appointment'],
+    'produces': ['text/event-stream'],
+    'parameters': [
+        {
+            'name': 'clerkid',
+            'in': 'path',
+            'type': 'string',
+            'required': True,
+            'description': 'ClerkID of the user (doctor or patient)'
+        },
+        {
+            'name': 'since',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Only send changes after this cursor (defaults to Last-Event-ID, then to now)'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Event stream of appointment changes',
+            'examples': {
+                'text/event-stream': 'id: 42:39\nevent: appointment\ndata: {"id": 42, "event": "status_changed", "appointment_id": 7, "status": "approved", ...}'
+            }
+        },
+        400: {
+            'description': 'Invalid cursor',
+            'examples': {'application/json': {'error': 'Invalid cursor'}}
+        },
+        503: {
+            'description': 'Too many open change streams in this process; retry after Retry-After seconds',
+            'examples': {'application/json': {'error': 'Too many open change streams, retry shortly'}}
+        }
+    }
+})
+def stream_appointment_changes(clerkid):
+    denied = authorize(clerkid)
+    if denied:
+        return denied
+
+    try:
+        since = parse_event_cursor(request.args.get('since') or request.headers.get('Last-Event-ID'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    stream_seconds = app.config['APPOINTMENT_STREAM_SECONDS']
+    heartbeat_seconds = app.config['APPOINTMENT_STREAM_HEARTBEAT_SECONDS']
+
+    def generate(cursor):
+        yield 'retry: 3000\n\n'
+        deadline = time.monotonic() + stream_seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events, cursor = appointment_feed.wait(clerkid, cursor, min(heartbeat_seconds, remaining))
+            if not events:
+                yield ': keep-alive\n\n'
+                continue
+            # Only the last event of a batch carries the cursor; a client reconnecting mid-batch may see events again
+            for event in events[:-1]:
+                yield f"event: appointment\ndata: {json.dumps(event)}\n\n"
+            yield f"id: {format_event_cursor(cursor)}\nevent: appointment\ndata: {json.dumps(events[-1])}\n\n"
+
+    cursor = appointment_feed.current_cursor() if since is None else since
+    # Every open stream pins a request thread; past the cap the client retries later instead
+    if not appointment_feed.open_connection():
+        return jsonify({"error": "Too many open change streams, retry shortly"}), 503, {'Retry-After': str(STREAM_RETRY_AFTER_SECONDS)}
+    response = Response(
+        stream_with_context(generate(cursor)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Runs when the server is done with the response, even if the generator never started
+    response.call_on_close(appointment_feed.close_connection)
+    return response
+
+# Route to long-poll a user's appointment changes, for clients that cannot use server-sent events
+@appointment_bp.route('/changes/<clerkid>', methods=['GET'])
+@swag_from({
+    'summary': 'Long-poll appointment changes for a user after a cursor',
+    'tags': ['Appointment'],
+    'parameters': [
+        {
+            'name': 'clerkid',
+            'in': 'path',
+            'type': 'string',
+            'required': True,
+            'description': 'ClerkID of the user (doctor or patient)'
+        },
+        {
+            'name': 'since',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'next_cursor of the previous call; without it the call returns the current cursor immediately'
+        },
+        {
+            'name': 'wait',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Seconds to wait for a change before returning an empty list (default 25, max 55)'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Changes after the cursor, possibly empty',
+            'examples': {
+                'application/json': {
+                    'events': [
+                        {
+                            'id': 42,
+                            'event': 'status_changed',
+                            'appointment_id': 7,
+                            'doctor_clerkid': '1234',
+                            'patient_clerkid': '5678',
+                            'appointment_date': '2023-10-01T12:00:00',
+                            'status': 'approved',
+                            'created_at': '2023-09-28T08:15:00'
+                        }
+                    ],
+                    'next_cursor': '42:39'
+                }
+            }
+        },
+        400: {
+            'description': 'Invalid cursor or wait',
+            'examples': {'application/json': {'error': 'Invalid cursor'}}
+        },
+        503: {
+            'description': 'Too many open change streams in this process; retry after Retry-After seconds',
+            'examples': {'application/json': {'error': 'Too many open change streams, retry shortly'}}
+        }
+    }
+})
+def poll_appointment_changes(clerkid):
+    denied = authorize(clerkid)
+    if denied:
+        return denied
+
+    try:
+        since = parse_event_cursor(request.args.get('since'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        wait = min(max(int(request.args.get('wait', 25)), 0), 55)
+    except ValueError:
+        return jsonify({"error": "Invalid wait"}), 400
+
+    if since is None:
+        return jsonify({"events": [], "next_cursor": format_event_cursor(appointment_feed.current_cursor())}), 200
 
+    if not appointment_feed.open_connection():
+        return jsonify({"error": "Too many open change streams, retry shortly"}), 503, {'Retry-After': str(STREAM_RETRY_AFTER_SECONDS)}
+    try:
+        events, next_cursor = appointment_feed.wait(clerkid, since, wait)
+    finally:
+        appointment_feed.close_connection()
+    return jsonify({"events": events, "next_cursor": format_event_cursor(next_cursor)}), 200
@@ -0,0 +1,271 @@
+import threading
+import time
+from collections import deque, namedtuple
+from flask import current_app
+from sqlalchemy import insert, select, func, or_, and_
+from config import db
+from models import AppointmentEvent
+
+FEED_BATCH_SIZE = 500
+
+# Most uncommitted ids the feed waits for at once; beyond that the lowest are given up
+FEED_MAX_GAPS = 200
+
+EventCursor = namedtuple('EventCursor', ['last_id', 'gaps'])
+
+
+def record_events(event, appointments):
+    """
+    Appends one change-log row per appointment to the current transaction.
+    appointments can be ORM objects or result rows exposing id, doctor_clerkid,
+    patient_clerkid, appointment_date and status. The caller commits.
+    """
+    rows = [
+        {
+            'appointment_id': appointment.id,
+            'doctor_clerkid': appointment.doctor_clerkid,
+            'patient_clerkid': appointment.patient_clerkid,
+            'appointment_date': appointment.appointment_date,
+            'status': appointment.status,
+            'event': event
+        }
+        for appointment in appointments
+    ]
+    if rows:
+        db.session.execute(insert(AppointmentEvent), rows)
+
+
+def serialize_event(event):
+    return {
+        'id': event.id,
+        'event': event.event,
+        'appointment_id': event.appointment_id,
+        'doctor_clerkid': event.doctor_clerkid,
+        'patient_clerkid': event.patient_clerkid,
+        'appointment_date': event.appointment_date.isoformat(),
+        'status': event.status,
+        'created_at': event.created_at.isoformat()
+    }
+
+
+def parse_event_cursor(value):
+    """
+    Change-stream cursors are '<last id>' or '<last id>:<gap>,<gap>', the gaps being
+    ids below the last one whose transactions had not committed yet when it was read.
+    Returns an EventCursor, or None for an empty value; raises ValueError when malformed.
+    """
+    if value in (None, ''):
+        return None
+    try:
+        last_id, _, gaps = value.partition(':')
+        cursor = EventCursor(int(last_id), frozenset(int(gap) for gap in gaps.split(',')) if gaps else frozenset())
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if cursor.last_id < 0 or len(cursor.gaps) > FEED_MAX_GAPS or any(gap < 0 or gap >= cursor.last_id for gap in cursor.gaps):
+        raise ValueError("Invalid cursor")
+    return cursor
+
+
+def format_event_cursor(cursor):
+    if not cursor.gaps:
+        return str(cursor.last_id)
+    return f"{cursor.last_id}:{','.join(str(gap) for gap in sorted(cursor.gaps))}"
+
+
+def query_events(clerkid, cursor, head, limit=FEED_BATCH_SIZE):
+    # Reads one user's events not covered by the cursor, up to head, straight from the change log
+    pending = and_(AppointmentEvent.id > cursor.last_id, AppointmentEvent.id <= head)
+    if cursor.gaps:
+        pending = or_(pending, AppointmentEvent.id.in_(cursor.gaps))
+    events = db.session.execute(
+        select(AppointmentEvent)
+        .where(
+            pending,
+            or_(AppointmentEvent.doctor_clerkid == clerkid, AppointmentEvent.patient_clerkid == clerkid)
+        )
+        .order_by(AppointmentEvent.id)
+        .limit(limit)
+    ).scalars().all()
+    return [serialize_event(event) for event in events]
+
+
+class AppointmentFeed:
+    """
+    Per-process tail of the appointment_events table. While at least one client is
+    listening, a single thread reads new events every APPOINTMENT_FEED_POLL_SECONDS
+    into a bounded in-memory buffer and wakes the listeners, which filter it by
+    clerkid. Idle listeners therefore cost no queries of their own, and with no
+    listeners the thread makes no queries at all. Cursors older than the buffer
+    are served from the table.
+
+    Ids are allocated before commit, so a row can become visible after higher ids
+    were read. Ids skipped over are kept as gaps and re-read on every poll for
+    APPOINTMENT_FEED_GAP_SECONDS; cursors carry the gaps too, so such late rows still
+    reach every client exactly once.
+
+    Each stream or long-poll still holds a request thread, so at most
+    APPOINTMENT_STREAM_MAX_CONNECTIONS may be open per process (see open_connection).
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.buffer = deque()
+        self.floor = 0          # highest id evicted from the buffer; older cursors are read from the table
+        self.head = None
+        self.gaps = {}          # id below head not read yet -> when it was first missed
+        self.expired = {}       # gaps given up on, remembered so cursors still holding them skip the table
+        self.version = 0        # bumped whenever head, gaps or buffer change
+        self.listeners = 0
+        self.connections = 0
+        self.thread = None
+        self.app = None
+
+    def open_connection(self):
+        # Claims one of the process's stream connections; False when all are taken
+        limit = current_app.config['APPOINTMENT_STREAM_MAX_CONNECTIONS']
+        with self.condition:
+            if self.connections >= limit:
+                return False
+            self.connections += 1
+            return True
+
+    def close_connection(self):
+        with self.condition:
+            self.connections -= 1
+
+    def current_cursor(self):
+        self._ensure_started()
+        with self.condition:
+            return EventCursor(self.head, frozenset(self.gaps))
+
+    def read(self, clerkid, cursor):
+        # Returns the user's events not covered by cursor, and the cursor that covers them too
+        self._ensure_started()
+        with self.condition:
+            head = self.head
+            if cursor.last_id > head or (cursor.last_id == head and not cursor.gaps):
+                # Nothing new, or a cursor from a process that has read further and this one has to catch up
+                return [], cursor
+            unknown = {gap for gap in cursor.gaps if gap not in self.gaps and gap not in self.expired}
+            if cursor.last_id >= self.floor and (not unknown or unknown <= {event['id'] for event in self.buffer}):
+                events = [
+                    event for event in self.buffer
+                    if (event['id'] > cursor.last_id or event['id'] in cursor.gaps)
+                    and clerkid in (event['doctor_clerkid'], event['patient_clerkid'])
+                ]
+                gaps = {gap for gap in self.gaps if gap in cursor.gaps or gap > cursor.last_id}
+                return events, EventCursor(head, frozenset(gaps))
+            feed_gaps = set(self.gaps)
+
+        events = query_events(clerkid, cursor, head)
+        last_id = head
+        if len(events) == FEED_BATCH_SIZE:
+            # Truncated, the rest is read with the next cursor
+            last_id = max(cursor.last_id, events[-1]['id'])
+        delivered = {event['id'] for event in events}
+        gaps = {
+            gap for gap in feed_gaps
+            if gap < last_id and gap not in delivered and (gap in cursor.gaps or gap > cursor.last_id)
+        }
+        return events, EventCursor(last_id, frozenset(gaps))
+
+    def wait(self, clerkid, cursor, timeout):
+        # Like read, but blocks up to timeout seconds while there are no events
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.listeners += 1
+            self.condition.notify_all()
+        try:
+            while True:
+                with self.condition:
+                    version = self.version
+                events, cursor = self.read(clerkid, cursor)
+                if events:
+                    return events, cursor
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], cursor
+                with self.condition:
+                    if self.version == version:
+                        self.condition.wait(remaining)
+        finally:
+            with self.condition:
+                self.listeners -= 1
+
+    def _ensure_started(self):
+        if self.thread is not None:
+            return
+        with self.condition:
+            if self.thread is not None:
+                return
+            self.app = current_app._get_current_object()
+            self.buffer = deque(maxlen=self.app.config['APPOINTMENT_FEED_BUFFER_SIZE'])
+            self.head = self.floor = db.session.execute(select(func.max(AppointmentEvent.id))).scalar() or 0
+            # Ids just below the starting head may belong to transactions still in flight
+            window_start = max(self.head - FEED_MAX_GAPS, 0)
+            present = set(db.session.execute(select(AppointmentEvent.id).where(AppointmentEvent.id > window_start)).scalars())
+            now = time.monotonic()
+            self.gaps = {event_id: now for event_id in range(window_start + 1, self.head) if event_id not in present}
+            self.thread = threading.Thread(target=self._run, name='appointment-feed', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        poll_interval = self.app.config['APPOINTMENT_FEED_POLL_SECONDS']
+        gap_seconds = self.app.config['APPOINTMENT_FEED_GAP_SECONDS']
+        while True:
+            with self.condition:
+                while self.listeners == 0:
+                    self.condition.wait()
+                head = self.head
+                gaps = list(self.gaps)
+            try:
+                with self.app.app_context():
+                    pending = AppointmentEvent.id > head
+                    if gaps:
+                        pending = or_(pending, AppointmentEvent.id.in_(gaps))
+                    events = db.session.execute(
+                        select(AppointmentEvent)
+                        .where(pending)
+                        .order_by(AppointmentEvent.id)
+                        .limit(FEED_BATCH_SIZE)
+                    ).scalars().all()
+                    events = [serialize_event(event) for event in events]
+            except Exception as e:
+                self.app.logger.warning("Appointment feed poll failed: %s", e)
+                events = []
+
+            with self.condition:
+                if self._advance(events, gap_seconds):
+                    self.version += 1
+                    self.condition.notify_all()
+            if len(events) < FEED_BATCH_SIZE:
+                time.sleep(poll_interval)
+
+    def _advance(self, events, gap_seconds):
+        # Applies one poll to head, gaps and buffer; called with the condition held. True if anything changed
+        now = time.monotonic()
+        for event in events:
+            event_id = event['id']
+            if event_id > self.head:
+                self.gaps.update((missing, now) for missing in range(max(self.head + 1, event_id - FEED_MAX_GAPS), event_id))
+                self.head = event_id
+            else:
+                self.gaps.pop(event_id, None)
+            if len(self.buffer) == self.buffer.maxlen:
+                self.floor = max(self.floor, self.buffer[0]['id'])
+            self.buffer.append(event)
+
+        given_up = [gap for gap, missed_at in self.gaps.items() if now - missed_at > gap_seconds]
+        overflow = len(self.gaps) - FEED_MAX_GAPS
+        if overflow > 0:
+            given_up.extend(sorted(self.gaps)[:overflow])
+        for gap in given_up:
+            if self.gaps.pop(gap, None) is not None:
+                self.expired[gap] = now
+        for gap, expired_at in list(self.expired.items()):
+            if now - expired_at > gap_seconds or len(self.expired) > FEED_MAX_GAPS:
+                del self.expired[gap]
+        return bool(events or given_up)
+
+
+appointment_feed = AppointmentFeed()
@@ -0,0 +1,210 @@
+import re
+from bisect import bisect_left
+from datetime import timedelta
+from functools import lru_cache
+from flask import current_app
+from sqlalchemy import select
+from config import db
+from models import Appointment, DoctorDetails, BOOKED_STATUSES
+
+DAY_NAMES = {
+    'mon': 0, 'monday': 0,
+    'tue': 1, 'tues': 1, 'tuesday': 1,
+    'wed': 2, 'wednesday': 2,
+    'thu': 3, 'thur': 3, 'thurs': 3, 'thursday': 3,
+    'fri': 4, 'friday': 4,
+    'sat': 5, 'saturday': 5,
+    'sun': 6, 'sunday': 6
+}
+DAY_GROUPS = {
+    'weekdays': range(0, 5),
+    'weekends': range(5, 7),
+    'weekend': range(5, 7),
+    'daily': range(0, 7),
+    'everyday': range(0, 7),
+    'alldays': range(0, 7),
+    'all': range(0, 7)
+}
+
+TIME_PATTERN = re.compile(r'(\d{1,2})(?:[:.](\d{2}))?\s*([ap]\.?m\.?)?', re.IGNORECASE)
+RANGE_SEPARATOR = re.compile(r'\s*(?:-|–|to)\s*', re.IGNORECASE)
+
+
+def slot_length():
+    return timedelta(minutes=current_app.config['APPOINTMENT_SLOT_MINUTES'])
+
+
+def parse_days(available_days):
+    """
+    Parses strings such as 'Mon-Fri', 'Monday, Wednesday, Friday', 'Sat to Sun' or
+    'Weekdays' into a set of weekday numbers (Monday = 0). Returns None if any part
+    of the string is not understood.
+    """
+    days = set()
+    for part in re.split(r'[,/&;]|\band\b', available_days.lower()):
+        part = part.strip()
+        if not part:
+            continue
+        if part.replace(' ', '') in DAY_GROUPS:
+            days.update(DAY_GROUPS[part.replace(' ', '')])
+            continue
+        bounds = RANGE_SEPARATOR.split(part)
+        if len(bounds) == 1 and bounds[0] in DAY_NAMES:
+            days.add(DAY_NAMES[bounds[0]])
+        elif len(bounds) == 2 and bounds[0] in DAY_NAMES and bounds[1] in DAY_NAMES:
+            day, end = DAY_NAMES[bounds[0]], DAY_NAMES[bounds[1]]
+            days.add(day)
+            while day != end:
+                day = (day + 1) % 7
+                days.add(day)
+        else:
+            return None
+    return frozenset(days) or None
+
+
+def parse_clock(value, meridiem_hint=None):
+    # Returns minutes after midnight for '9', '09:30', '9.30pm', '5 PM'
+    match = TIME_PATTERN.fullmatch(value.strip())
+    if not match:
+        return None
+    hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+    meridiem = (match.group(3) or meridiem_hint or '').lower().replace('.', '')
+    if meridiem == 'pm' and hours < 12:
+        hours += 12
+    elif meridiem == 'am' and hours == 12:
+        hours = 0
+    # '24:00' is the end of the day; '24:30' is not a time
+    if hours > 24 or minutes > 59 or (hours == 24 and minutes):
+        return None
+    return hours * 60 + minutes
+
+
+def parse_times(available_time):
+    """
+    Parses strings such as '09:00-17:00', '9 AM - 5 PM' or '09:00-13:00, 14:00-18:00'
+    into a tuple of (start_minute, end_minute) ranges. Returns None if any range is
+    not understood.
+    """
+    ranges = []
+    for part in re.split(r'[,;&]|\band\b', available_time.lower()):
+        if not part.strip():
+            continue
+        bounds = RANGE_SEPARATOR.split(part.strip())
+        if len(bounds) != 2:
+            return None
+        start, end = parse_clock(bounds[0]), parse_clock(bounds[1])
+        # In '9-5 pm' or '1-5 pm' the start inherits the end's am/pm when that keeps it before the end
+        end_match = TIME_PATTERN.fullmatch(bounds[1])
+        if start is not None and end is not None and end_match.group(3) and not TIME_PATTERN.fullmatch(bounds[0]).group(3):
+            hinted = parse_clock(bounds[0], end_match.group(3))
+            if hinted is not None and hinted < end:
+                start = hinted
+        if start is None or end is None or start >= end:
+            return None
+        ranges.append((start, end))
+    return tuple(sorted(ranges)) or None
+
+
+@lru_cache(maxsize=1024)
+def weekly_template(available_days, available_time):
+    """
+    Parses a doctor's free-form availability once into {weekday: ((start, end), ...)}
+    in minutes after midnight. Cached on the raw strings, so a doctor's template is
+    re-parsed only after they edit their availability. Returns None if unparseable.
+    """
+    if not available_days or not available_time:
+        return None
+    days = parse_days(available_days)
+    times = parse_times(available_time)
+    if not days or not times:
+        return None
+    return {day: times for day in days}
+
+
+def doctor_template(doctor_clerkid):
+    # Loads only the two availability columns; parsing is served from the weekly_template cache
+    details = db.session.execute(
+        select(DoctorDetails.available_days, DoctorDetails.available_time)
+        .where(DoctorDetails.clerkid == doctor_clerkid)
+        .limit(1)
+    ).first()
+    return weekly_template(*details) if details else None
+
+
+def is_within_availability(template, start, length):
+    # True if [start, start + length) falls inside one of the doctor's ranges for that weekday
+    start_minute = start.hour * 60 + start.minute
+    end_minute = start_minute + int(length.total_seconds() // 60)
+    return any(begin <= start_minute and end_minute <= finish for begin, finish in template.get(start.weekday(), ()))
+
+
+class BookedIndex:
+    """
+    Sorted index of a doctor's booked appointment start times within a window.
+    Every appointment occupies one slot, so two appointments conflict when their
+    starts are less than one slot length apart; that is checked with a binary search.
+    """
+
+    def __init__(self, starts, length):
+        self.starts = sorted(starts)
+        self.length = length
+
+    def conflicts(self, start):
+        i = bisect_left(self.starts, start - self.length + timedelta(microseconds=1))
+        return i < len(self.starts) and self.starts[i] < start + self.length
+
+    def add(self, start):
+        self.starts.insert(bisect_left(self.starts, start), start)
+
+
+def booked_index(doctor_clerkid, date_from, date_to):
+    return booked_indexes([doctor_clerkid], date_from, date_to)[doctor_clerkid]
+
+
+def booked_indexes(doctor_clerkids, date_from, date_to):
+    # One range scan over ix_appointments_doctor_date for the booked starts of every doctor around the window
+    length = slot_length()
+    rows = db.session.execute(
+        select(Appointment.doctor_clerkid, Appointment.appointment_date).where(
+            Appointment.doctor_clerkid.in_(doctor_clerkids),
+            Appointment.status.in_(BOOKED_STATUSES),
+            Appointment.appointment_date > date_from - length,
+            Appointment.appointment_date < date_to
+        )
+    ).all()
+    starts = {clerkid: [] for clerkid in doctor_clerkids}
+    for clerkid, start in rows:
+        starts[clerkid].append(start)
+    return {clerkid: BookedIndex(doctor_starts, length) for clerkid, doctor_starts in starts.items()}
+
+
+def is_slot_taken(doctor_clerkid, start):
+    # Index probe for any booked appointment overlapping [start, start + slot)
+    length = slot_length()
+    return db.session.execute(
+        select(Appointment.id).where(
+            Appointment.doctor_clerkid == doctor_clerkid,
+            Appointment.status.in_(BOOKED_STATUSES),
+            Appointment.appointment_date > start - length,
+            Appointment.appointment_date < start + length
+        ).limit(1)
+    ).first() is not None
+
+
+def free_slots(template, booked, date_from, date_to):
+    """
+    Yields (start, end) for every slot of the weekly template between date_from and
+    date_to that does not overlap a booked appointment.
+    """
+    length = booked.length
+    step = int(length.total_seconds() // 60)
+    day = date_from.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < date_to:
+        for begin, finish in template.get(day.weekday(), ()):
+            for minute in range(begin, finish - step + 1, step):
+                start = day + timedelta(minutes=minute)
+                if start < date_from or start + length > date_to:
+                    continue
+                if not booked.conflicts(start):
+                    yield start, start + length
+        day += timedelta(days=1)
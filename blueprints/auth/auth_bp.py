@@ -1,10 +1,21 @@
 from flask import Blueprint, request, jsonify
 from config import db
-from models import User
+from models import User, DoctorDetails
+from blueprints.doctor.directory import DOCTOR_DIRECTORY
+from blueprints.doctor.doctor_bp import doctor_profiles
+from utils.cache import bump_version
+from utils.identity import invalidate_identity, invalidate_identities
+from utils.auth import authorize, STAFF_ROLES
 from flasgger import swag_from
+from sqlalchemy import select, update, or_, func
+from sqlalchemy.dialects import postgresql, sqlite
 
 auth_bp = Blueprint('auth_bp', __name__)  # Declare this as a blueprint
 
+SYNC_USERS_LIMIT = 100000
+SYNC_CHUNK_SIZE = 1000
+USER_ROLES = ('PATIENT', 'DOCTOR')
+
 # API route to create a user, TO BE USED IN TESTING ONLY, NOT REQUIRED BY THE FRONTEND as when the user is created via clerk it automatically goes in the db we have
 @auth_bp.route('/create-user', methods=['POST'])
 @swag_from({
@@ -71,8 +82,188 @@ def create_user():
     user = User(id=id, first_name=first_name, last_name=last_name, email=email, role=role, clerkid=clerkid)
     try:
         db.session.add(user)
+        invalidate_identity(clerkid)
         db.session.commit()
         return jsonify({"message": "User registered successfully"}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Failed to register user: {str(e)}"}), 500
+
+# INSERT ... ON CONFLICT (clerkid) DO UPDATE for the current database, touching only rows that actually change
+def upsert_users_statement():
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        statement = postgresql.insert(User)
+    elif dialect == 'sqlite':
+        statement = sqlite.insert(User)
+    else:
+        raise RuntimeError(f"User sync does not support the '{dialect}' database")
+
+    synced = ('email', 'first_name', 'last_name', 'role')
+    changed = or_(*[getattr(User, column).is_distinct_from(statement.excluded[column]) for column in synced])
+    return statement.on_conflict_do_update(
+        index_elements=[User.clerkid],
+        set_=dict({column: statement.excluded[column] for column in synced}, updatedat=func.current_timestamp()),
+        where=changed
+    ).returning(User.clerkid)
+
+# API route to bulk create or update users from Clerk, e.g. for a backfill or a periodic re-sync
+@auth_bp.route('/sync-users', methods=['POST'])
+@swag_from({
+    'summary': 'Creates or updates a batch of users by clerkid in one upsert, reporting inserted/updated/skipped counts',
+    'tags': ['Auth'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'users': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'id': {'type': 'string'},
+                                'clerkid': {'type': 'string'},
+                                'email': {'type': 'string'},
+                                'first_name': {'type': 'string'},
+                                'last_name': {'type': 'string'},
+                                'role': {'type': 'string', 'enum': ['PATIENT', 'DOCTOR']}
+                            },
+                            'required': ['id', 'clerkid', 'email', 'first_name', 'role']
+                        }
+                    }
+                },
+                'required': ['users']
+            }
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Users synced; unchanged and invalid records are counted as skipped, records overridden by a later one for the same clerkid as duplicates',
+            'examples': {
+                'application/json': {
+                    'inserted': 1,
+                    'updated': 1,
+                    'skipped': 2,
+                    'duplicates': 0,
+                    'errors': [{'index': 3, 'clerkid': 'user_3', 'error': 'Email is already used by another user'}]
+                }
+            }
+        },
+        400: {
+            'description': 'Malformed body',
+            'examples': {'application/json': {'error': 'users must be a non-empty list'}}
+        },
+        401: {
+            'description': 'No bearer token',
+            'examples': {'application/json': {'error': 'Authentication required'}}
+        },
+        403: {
+            'description': 'The token is not an admin or service identity',
+            'examples': {'application/json': {'error': 'Not allowed to act for this user'}}
+        }
+    }
+})
+def sync_users():
+    denied = authorize(roles=STAFF_ROLES, required=True)
+    if denied:
+        return denied
+
+    data = request.json
+    items = data.get('users') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "users must be a non-empty list"}), 400
+    if len(items) > SYNC_USERS_LIMIT:
+        return jsonify({"error": f"At most {SYNC_USERS_LIMIT} users can be synced at once"}), 400
+
+    errors = []
+    records = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not all(item.get(field) for field in ('id', 'clerkid', 'email', 'first_name')):
+            errors.append({'index': index, 'clerkid': item.get('clerkid') if isinstance(item, dict) else None, 'error': 'id, clerkid, email and first_name are required'})
+            continue
+        if item.get('role') not in USER_ROLES:
+            errors.append({'index': index, 'clerkid': item['clerkid'], 'error': "Role must be either 'PATIENT' or 'DOCTOR'"})
+            continue
+        # A clerkid repeated in the batch keeps its last record
+        records[item['clerkid']] = (index, {
+            'id': item['id'],
+            'clerkid': item['clerkid'],
+            'email': item['email'],
+            'first_name': item['first_name'],
+            'last_name': item.get('last_name') or '',
+            'role': item['role']
+        })
+    duplicates = len(items) - len(errors) - len(records)
+
+    statement = upsert_users_statement()
+    inserted = updated = 0
+    role_changes = []
+    pending = list(records.values())
+    for start in range(0, len(pending), SYNC_CHUNK_SIZE):
+        chunk = pending[start:start + SYNC_CHUNK_SIZE]
+
+        # One query finds every existing user the chunk could collide with
+        existing = db.session.execute(
+            select(User.id, User.clerkid, User.email, User.role).where(or_(
+                User.clerkid.in_([row['clerkid'] for _, row in chunk]),
+                User.email.in_([row['email'] for _, row in chunk]),
+                User.id.in_([row['id'] for _, row in chunk])
+            ))
+        ).all()
+        by_clerkid = {user.clerkid: user for user in existing}
+        email_owner = {user.email: user.clerkid for user in existing}
+        id_owner = {user.id: user.clerkid for user in existing}
+
+        rows = []
+        for index, row in chunk:
+            current = by_clerkid.get(row['clerkid'])
+            if email_owner.get(row['email'], row['clerkid']) != row['clerkid']:
+                errors.append({'index': index, 'clerkid': row['clerkid'], 'error': 'Email is already used by another user'})
+                continue
+            if current is None and id_owner.get(row['id'], row['clerkid']) != row['clerkid']:
+                errors.append({'index': index, 'clerkid': row['clerkid'], 'error': 'ID is already used by another user'})
+                continue
+            # Later records in the batch must not reuse this email or id either
+            email_owner[row['email']] = row['clerkid']
+            id_owner[row['id']] = row['clerkid']
+            rows.append(row)
+
+        if not rows:
+            continue
+        written = set(db.session.execute(statement, rows).scalars())
+        for row in rows:
+            current = by_clerkid.get(row['clerkid'])
+            if row['clerkid'] not in written:
+                continue
+            if current is None:
+                inserted += 1
+            else:
+                updated += 1
+                if current.role != row['role']:
+                    role_changes.append(row['clerkid'])
+
+    invalidate_identities(role_changes)
+    if role_changes:
+        # Promoted or demoted doctors enter or leave the directory, and their cached profiles go stale
+        version = bump_version(DOCTOR_DIRECTORY)
+        for start in range(0, len(role_changes), SYNC_CHUNK_SIZE):
+            db.session.execute(
+                update(DoctorDetails)
+                .where(DoctorDetails.clerkid.in_(role_changes[start:start + SYNC_CHUNK_SIZE]))
+                .values(directory_version=version)
+            )
+        doctor_profiles.invalidate_many(role_changes)
+    db.session.commit()
+
+    errors.sort(key=lambda error: error['index'])
+    return jsonify({
+        'inserted': inserted,
+        'updated': updated,
+        'skipped': len(items) - inserted - updated - duplicates,
+        'duplicates': duplicates,
+        'errors': errors
+    }), 200
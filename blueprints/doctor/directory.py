@@ -0,0 +1,143 @@
+from bisect import bisect_right
+from collections import namedtuple, Counter
+from flask import current_app
+from config import db
+from models import User, DoctorDetails
+from blueprints.hospital.models import Hospital
+from blueprints.appointment.slots import parse_days
+from utils.cache import VersionedSnapshot
+
+DOCTOR_DIRECTORY = 'doctor-directory'
+
+# Fields of a directory entry returned by /doctor/get-all-doctors
+LISTING_FIELDS = ('clerkid', 'first_name', 'last_name', 'specialization', 'hospital_id', 'hospital_name')
+
+# doctors maps doctor_details.id to its entry, body is the listing already encoded as JSON
+DoctorDirectory = namedtuple('DoctorDirectory', ['doctors', 'body', 'index'])
+
+
+def directory_query(doctors_only=True):
+    # One join replaces the per-doctor User and Hospital lookups; doctors_only=False also returns details of non-doctors
+    query = (
+        db.session.query(
+            DoctorDetails.id,
+            DoctorDetails.clerkid,
+            DoctorDetails.first_name,
+            DoctorDetails.last_name,
+            DoctorDetails.specialization,
+            DoctorDetails.consultation_fee,
+            DoctorDetails.available_days,
+            DoctorDetails.available_time,
+            DoctorDetails.hospital_id,
+            Hospital.name.label('hospital_name'),
+            User.role
+        )
+    )
+    if doctors_only:
+        query = query.join(User, (User.clerkid == DoctorDetails.clerkid) & (User.role == 'DOCTOR'))
+    else:
+        query = query.outerjoin(User, User.clerkid == DoctorDetails.clerkid)
+    return query.outerjoin(Hospital, DoctorDetails.hospital_id == Hospital.id)
+
+
+def directory_entry(row):
+    return {
+        'clerkid': row.clerkid,
+        'first_name': row.first_name,
+        'last_name': row.last_name,
+        'specialization': row.specialization,
+        'consultation_fee': row.consultation_fee,
+        'available_days': row.available_days,
+        'available_time': row.available_time,
+        'hospital_id': row.hospital_id,
+        'hospital_name': row.hospital_name
+    }
+
+
+def make_directory(doctors):
+    doctors = dict(sorted(doctors.items()))
+    listing = [{field: doctor[field] for field in LISTING_FIELDS} for doctor in doctors.values()]
+    return DoctorDirectory(doctors, current_app.json.dumps(listing), DoctorIndex(doctors))
+
+
+def build_doctor_directory():
+    return make_directory({row.id: directory_entry(row) for row in directory_query().all()})
+
+
+def refresh_doctor_directory(directory, since_version):
+    # Reloads only the details written after the snapshot's version; those whose user is no longer a doctor are dropped
+    changed = directory_query(doctors_only=False).filter(DoctorDetails.directory_version > since_version).all()
+    doctors = dict(directory.doctors)
+    for row in changed:
+        if row.role == 'DOCTOR':
+            doctors[row.id] = directory_entry(row)
+        else:
+            doctors.pop(row.id, None)
+    # Deleted rows leave nothing to reload, a count that no longer matches means a full rebuild
+    if len(doctors) != directory_query().count():
+        return build_doctor_directory()
+    return make_directory(doctors)
+
+
+class DoctorIndex:
+    """
+    Inverted index over the directory: specialization, hospital and weekday each map
+    to the set of matching doctor ids, and fees are kept sorted for range queries.
+    A search intersects the posting sets smallest first, so its cost follows the
+    size of the result rather than the size of the directory.
+    """
+
+    def __init__(self, doctors):
+        self.doctors = doctors
+        self.by_specialization = {}
+        self.by_hospital = {}
+        self.by_day = {}
+        self.days = {}
+        fees = []
+        for doctor_id, doctor in doctors.items():
+            if doctor['specialization']:
+                self.by_specialization.setdefault(doctor['specialization'].strip().lower(), set()).add(doctor_id)
+            self.by_hospital.setdefault(doctor['hospital_id'], set()).add(doctor_id)
+            self.days[doctor_id] = parse_days(doctor['available_days'] or '') or frozenset()
+            for day in self.days[doctor_id]:
+                self.by_day.setdefault(day, set()).add(doctor_id)
+            if doctor['consultation_fee'] is not None:
+                fees.append((doctor['consultation_fee'], doctor_id))
+        fees.sort()
+        self.fee_values = [fee for fee, _ in fees]
+        self.fee_ids = [doctor_id for _, doctor_id in fees]
+
+    def search(self, specialization=None, hospital_id=None, max_fee=None, day=None):
+        # Returns the sorted ids of the doctors matching every given filter
+        postings = []
+        if specialization is not None:
+            postings.append(self.by_specialization.get(specialization.strip().lower(), set()))
+        if hospital_id is not None:
+            postings.append(self.by_hospital.get(hospital_id, set()))
+        if day is not None:
+            postings.append(self.by_day.get(day, set()))
+
+        if postings:
+            postings.sort(key=len)
+            matches = set(postings[0]).intersection(*postings[1:])
+            if max_fee is not None:
+                matches = {doctor_id for doctor_id in matches if (self.doctors[doctor_id]['consultation_fee'] or 0) <= max_fee}
+        elif max_fee is not None:
+            matches = self.fee_ids[:bisect_right(self.fee_values, max_fee)]
+        else:
+            matches = self.doctors
+        return sorted(matches)
+
+    def facets(self, doctor_ids):
+        # Counts of the matching doctors per specialization, hospital and weekday
+        specializations, hospitals, days = Counter(), Counter(), Counter()
+        for doctor_id in doctor_ids:
+            doctor = self.doctors[doctor_id]
+            specializations[doctor['specialization']] += 1
+            hospitals[doctor['hospital_id']] += 1
+            for day in self.days[doctor_id]:
+                days[day] += 1
+        return specializations, hospitals, days
+
+
+doctor_directory = VersionedSnapshot(DOCTOR_DIRECTORY, build_doctor_directory, refresh_doctor_directory)
@@ -1,12 +1,26 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from sqlalchemy import update, func, or_
 from flasgger import swag_from
 from config import db
 from models import User, UserDetails, DoctorDetails
 from blueprints.hospital.models import Hospital # Import Hospital model
+from blueprints.doctor.directory import doctor_directory, DOCTOR_DIRECTORY
+from blueprints.appointment.slots import DAY_NAMES
+from utils.cache import bump_version, ReadThroughCache
+from utils.identity import resolve_user, invalidate_identity
+from utils.auth import authorize, STAFF_ROLES
+from utils.pagination import encode_cursor, decode_cursor, parse_limit
 from datetime import datetime
+import calendar
+import json
 
 doctor_bp = Blueprint('doctor_bp', __name__)
 
+ROSTER_STREAM_BATCH_SIZE = 1000
+
+# Serialized get-details responses keyed by clerkid
+doctor_profiles = ReadThroughCache('doctor-profile')
+
 # Function to handle date conversion
 def convert_to_date(date_string):
     if date_string:
@@ -33,11 +47,19 @@ def convert_to_date(date_string):
     }
 })
 def create_doctor(clerkid):
+    denied = authorize(roles=STAFF_ROLES)
+    if denied:
+        return denied
+
     user = User.query.filter_by(clerkid=clerkid).first()
     if not user:
         return jsonify({"error": "User not found"}), 400
 
     user.role = 'DOCTOR'
+    version = bump_version(DOCTOR_DIRECTORY)
+    db.session.execute(update(DoctorDetails).where(DoctorDetails.clerkid == clerkid).values(directory_version=version))
+    doctor_profiles.invalidate(clerkid)
+    invalidate_identity(clerkid)
     db.session.commit()
 
     return jsonify({"message": "User role updated to DOCTOR successfully"}), 200
@@ -93,7 +115,11 @@ def post_doctor_details():
     data = request.json
 
     clerkid = data.get('clerkid')
-    user = User.query.filter_by(clerkid=clerkid).first()
+    denied = authorize(clerkid, ('DOCTOR',))
+    if denied:
+        return denied
+
+    user = resolve_user(clerkid)
     if not user or user.role != 'DOCTOR':
         return jsonify({"error": "User not found or not a doctor"}), 400
 
@@ -111,14 +137,50 @@ def post_doctor_details():
         consultation_fee=data.get('consultation_fee'),
         available_days=data.get('available_days'),
         available_time=data.get('available_time'),
-        hospital_id=data.get('hospital_id')  # Include hospital_id
+        hospital_id=data.get('hospital_id'),  # Include hospital_id
+        directory_version=bump_version(DOCTOR_DIRECTORY)
     )
 
     db.session.add(doctor_details)
+    doctor_profiles.invalidate(user.clerkid)
     db.session.commit()
 
     return jsonify({"message": "Doctor details created successfully"}), 201
 
+# Loads the profile with one join; None if the doctor or their details do not exist
+def load_doctor_profile(clerkid):
+    # Join DoctorDetails and Hospital tables to fetch hospital name
+    doctor_details = (
+        db.session.query(DoctorDetails, Hospital.name)
+        .join(User, (User.clerkid == DoctorDetails.clerkid) & (User.role == 'DOCTOR'))
+        .join(Hospital, DoctorDetails.hospital_id == Hospital.id, isouter=True)
+        .filter(DoctorDetails.clerkid == clerkid)
+        .first()
+    )
+    if not doctor_details:
+        return None
+
+    # Unpack the result
+    doctor, hospital_name = doctor_details
+
+    return {
+        'clerkid': doctor.clerkid,
+        'first_name': doctor.first_name,
+        'last_name': doctor.last_name,
+        'phone_number': doctor.phone_number,
+        'email': doctor.email,
+        'address': doctor.address,
+        'years_of_experience': doctor.years_of_experience,
+        'specialization': doctor.specialization,
+        'department': doctor.department,
+        'clinic_address': doctor.clinic_address,
+        'consultation_fee': doctor.consultation_fee,
+        'available_days': doctor.available_days,
+        'available_time': doctor.available_time,
+        'hospital_id': doctor.hospital_id,  # Include hospital_id
+        'hospital_name': hospital_name  # Include hospital_name
+    }
+
 # Route to get doctor details by clerkid
 @doctor_bp.route('/get-details/<clerkid>', methods=['GET'])
 @swag_from({
@@ -163,41 +225,15 @@ def post_doctor_details():
     }
 })
 def get_doctor_details(clerkid):
-    user = User.query.filter_by(clerkid=clerkid).first()
-    if not user or user.role != 'DOCTOR':
-        return jsonify({"error": "Doctor not found"}), 400
-
-    # Join DoctorDetails and Hospital tables to fetch hospital name
-    doctor_details = (
-        db.session.query(DoctorDetails, Hospital.name)
-        .join(Hospital, DoctorDetails.hospital_id == Hospital.id, isouter=True)
-        .filter(DoctorDetails.clerkid == user.clerkid)
-        .first()
-    )
-
-    if not doctor_details:
+    # Repeat reads are served from the profile cache
+    profile = doctor_profiles.get(clerkid, lambda: load_doctor_profile(clerkid))
+    if profile is None:
+        user = resolve_user(clerkid)
+        if not user or user.role != 'DOCTOR':
+            return jsonify({"error": "Doctor not found"}), 400
         return jsonify({"error": "Doctor details not found"}), 400
 
-    # Unpack the result
-    doctor, hospital_name = doctor_details
-
-    return jsonify({
-        'clerkid': user.clerkid,
-        'first_name': doctor.first_name,
-        'last_name': doctor.last_name,
-        'phone_number': doctor.phone_number,
-        'email': doctor.email,
-        'address': doctor.address,
-        'years_of_experience': doctor.years_of_experience,
-        'specialization': doctor.specialization,
-        'department': doctor.department,
-        'clinic_address': doctor.clinic_address,
-        'consultation_fee': doctor.consultation_fee,
-        'available_days': doctor.available_days,
-        'available_time': doctor.available_time,
-        'hospital_id': doctor.hospital_id,  # Include hospital_id
-        'hospital_name': hospital_name  # Include hospital_name
-    }), 200
+    return jsonify(profile), 200
 
     
 # Route to update doctor details
@@ -251,7 +287,11 @@ def get_doctor_details(clerkid):
 def update_doctor_details(clerkid):
     data = request.json
 
-    user = User.query.filter_by(clerkid=clerkid).first()
+    denied = authorize(clerkid, ('DOCTOR',))
+    if denied:
+        return denied
+
+    user = resolve_user(clerkid)
     if not user or user.role != 'DOCTOR':
         return jsonify({"error": "Doctor not found"}), 400
 
@@ -286,50 +326,141 @@ def update_doctor_details(clerkid):
     if 'hospital_id' in data:
         doctor_details.hospital_id = data['hospital_id']  # Update hospital_id
 
+    doctor_details.directory_version = bump_version(DOCTOR_DIRECTORY)
+    doctor_profiles.invalidate(user.clerkid)
     db.session.commit()
 
     return jsonify({"message": "Doctor details updated successfully"}), 200
 
+# Builds the patient roster query: only the listed columns of user_details joined
+# to User, optionally narrowed to a case-insensitive name/email prefix, in id order
+def roster_query(q=None):
+    query = (
+        db.session.query(
+            UserDetails.id,
+            UserDetails.clerkid,
+            UserDetails.first_name,
+            UserDetails.last_name,
+            UserDetails.phone_number,
+            UserDetails.email
+        )
+        .join(User, User.clerkid == UserDetails.clerkid)
+    )
+    if q:
+        prefix = q.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        query = query.filter(or_(
+            func.lower(UserDetails.first_name).like(prefix, escape='\\'),
+            func.lower(UserDetails.last_name).like(prefix, escape='\\'),
+            func.lower(UserDetails.email).like(prefix, escape='\\')
+        ))
+    return query.order_by(UserDetails.id)
+
+def serialize_roster_row(row):
+    return {
+        'clerkid': row.clerkid,
+        'name': f"{row.first_name} {row.last_name}",
+        'phone_number': row.phone_number,
+        'email': row.email
+    }
+
 # Route to get all users for the doctor's dashboard
 @doctor_bp.route('/get-all-users', methods=['GET'])
 @swag_from({
-    'summary': 'Fetches all users for the doctor\'s dashboard',
+    'summary': 'Fetches users for the doctor\'s dashboard, paginated or streamed',
     'tags': ['Doctor Dashboard'],
+    'parameters': [
+        {
+            'name': 'q',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Case-insensitive prefix of the first name, last name or email'
+        },
+        {
+            'name': 'limit',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Page size (default 50, max 200)'
+        },
+        {
+            'name': 'cursor',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'next_cursor from the previous page'
+        },
+        {
+            'name': 'stream',
+            'in': 'query',
+            'type': 'boolean',
+            'required': False,
+            'description': 'Stream every matching user as newline-delimited JSON instead of one page'
+        }
+    ],
     'responses': {
         200: {
             'description': 'Users fetched successfully',
             'examples': {
-                'application/json': [
-                    {
-                        'clerkid': '1234',
-                        'name': 'John Doe',
-                        'phone_number': '9876543210',
-                        'email': 'john.doe@example.com'
-                    },
-                    {
-                        'clerkid': '5678',
-                        'name': 'Jane Smith',
-                        'phone_number': '1234567890',
-                        'email': 'jane.smith@example.com'
-                    }
-                ]
+                'application/json': {
+                    'users': [
+                        {
+                            'clerkid': '1234',
+                            'name': 'John Doe',
+                            'phone_number': '9876543210',
+                            'email': 'john.doe@example.com'
+                        },
+                        {
+                            'clerkid': '5678',
+                            'name': 'Jane Smith',
+                            'phone_number': '1234567890',
+                            'email': 'jane.smith@example.com'
+                        }
+                    ],
+                    'next_cursor': 'WzJd'
+                }
             }
+        },
+        400: {
+            'description': 'Invalid cursor or limit',
+            'examples': {'application/json': {'error': 'Invalid cursor'}}
         }
     }
 })
 def get_all_users():
-    user_details_list = UserDetails.query.all()
-    users = []
-    for user_details in user_details_list:
-        user = User.query.filter_by(clerkid=user_details.clerkid).first()
-        if user:
-            users.append({
-                'clerkid': user.clerkid,
-                'name': f"{user_details.first_name} {user_details.last_name}",
-                'phone_number': user_details.phone_number,
-                'email': user_details.email
-            })
-    return jsonify(users), 200
+    # Names, phones and emails of every patient: doctors only
+    denied = authorize(roles=('DOCTOR',))
+    if denied:
+        return denied
+
+    q = (request.args.get('q') or '').strip()
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        last_id = decode_cursor(request.args['cursor'])[0] if request.args.get('cursor') else 0
+        if not isinstance(last_id, int):
+            raise ValueError("Invalid cursor")
+    except (ValueError, IndexError) as e:
+        return jsonify({"error": str(e) or "Invalid cursor"}), 400
+
+    if request.args.get('stream') in ('1', 'true'):
+        # Walks the roster in keyset batches so memory stays flat however many users match
+        def generate(last_id):
+            while True:
+                rows = roster_query(q).filter(UserDetails.id > last_id).limit(ROSTER_STREAM_BATCH_SIZE).all()
+                for row in rows:
+                    yield json.dumps(serialize_roster_row(row)) + '\n'
+                if len(rows) < ROSTER_STREAM_BATCH_SIZE:
+                    return
+                last_id = rows[-1].id
+
+        return Response(stream_with_context(generate(last_id)), mimetype='application/x-ndjson')
+
+    rows = roster_query(q).filter(UserDetails.id > last_id).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1].id) if len(rows) > limit else None
+    return jsonify({
+        'users': [serialize_roster_row(row) for row in rows[:limit]],
+        'next_cursor': next_cursor
+    }), 200
 
 # Route to get all doctors
 @doctor_bp.route('/get-all-doctors', methods=['GET'])
@@ -355,18 +486,111 @@ def get_all_users():
     }
 })
 def get_all_doctors():
-    doctor_details_list = DoctorDetails.query.all()
-    doctors = []
-    for doctor_details in doctor_details_list:
-        user = User.query.filter_by(clerkid=doctor_details.clerkid, role='DOCTOR').first()
-        if user:
-            hospital = Hospital.query.get(doctor_details.hospital_id)  # Fetch hospital details
-            doctors.append({
-                'clerkid': doctor_details.clerkid,
-                'first_name': doctor_details.first_name,
-                'last_name': doctor_details.last_name,
-                'specialization': doctor_details.specialization,
-                'hospital_id': doctor_details.hospital_id,  # Include hospital_id
-                'hospital_name': hospital.name if hospital else None  # Include hospital_name
-            })
-    return jsonify(doctors), 200
\ No newline at end of file
+    # Served from the in-process snapshot, rebuilt only when the directory version changes
+    return Response(doctor_directory.get().body, status=200, mimetype='application/json')
+
+
+# Route to search doctors by specialization, hospital, fee and available day
+@doctor_bp.route('/search', methods=['GET'])
+@swag_from({
+    'summary': 'Searches doctors from the in-memory directory index, with facet counts',
+    'tags': ['Doctor'],
+    'parameters': [
+        {
+            'name': 'specialization',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Exact specialization, case-insensitive'
+        },
+        {
+            'name': 'hospital_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'ID of the hospital'
+        },
+        {
+            'name': 'max_fee',
+            'in': 'query',
+            'type': 'number',
+            'required': False,
+            'description': 'Highest consultation fee'
+        },
+        {
+            'name': 'day',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Day the doctor must be available, e.g. Mon or Monday'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Doctors fetched successfully',
+            'examples': {
+                'application/json': {
+                    'doctors': [
+                        {
+                            'clerkid': '1234',
+                            'first_name': 'John',
+                            'last_name': 'Doe',
+                            'specialization': 'Cardiology',
+                            'consultation_fee': 100,
+                            'available_days': 'Mon-Fri',
+                            'available_time': '09:00-17:00',
+                            'hospital_id': 1,
+                            'hospital_name': 'General Hospital'
+                        }
+                    ],
+                    'total': 1,
+                    'facets': {
+                        'specialization': [{'value': 'Cardiology', 'count': 1}],
+                        'hospital': [{'hospital_id': 1, 'hospital_name': 'General Hospital', 'count': 1}],
+                        'day': [{'value': 'Monday', 'count': 1}]
+                    }
+                }
+            }
+        },
+        400: {
+            'description': 'Invalid filter',
+            'examples': {'application/json': {'error': 'Invalid day. Use a weekday name such as Mon or Monday.'}}
+        }
+    }
+})
+def search_doctors():
+    try:
+        hospital_id = int(request.args['hospital_id']) if request.args.get('hospital_id') else None
+        max_fee = float(request.args['max_fee']) if request.args.get('max_fee') else None
+    except ValueError:
+        return jsonify({"error": "hospital_id must be an integer and max_fee a number"}), 400
+
+    day = None
+    if request.args.get('day'):
+        day = DAY_NAMES.get(request.args['day'].strip().lower())
+        if day is None:
+            return jsonify({"error": "Invalid day. Use a weekday name such as Mon or Monday."}), 400
+
+    directory = doctor_directory.get()
+    index = directory.index
+    doctor_ids = index.search(
+        specialization=request.args.get('specialization') or None,
+        hospital_id=hospital_id,
+        max_fee=max_fee,
+        day=day
+    )
+    specializations, hospitals, days = index.facets(doctor_ids)
+    hospital_names = {doctor['hospital_id']: doctor['hospital_name'] for doctor in (directory.doctors[doctor_id] for doctor_id in doctor_ids)}
+
+    return jsonify({
+        'doctors': [directory.doctors[doctor_id] for doctor_id in doctor_ids],
+        'total': len(doctor_ids),
+        'facets': {
+            'specialization': [{'value': value, 'count': count} for value, count in specializations.most_common()],
+            'hospital': [
+                {'hospital_id': value, 'hospital_name': hospital_names[value], 'count': count}
+                for value, count in hospitals.most_common()
+            ],
+            'day': [{'value': calendar.day_name[value], 'count': count} for value, count in sorted(days.items())]
+        }
+    }), 200
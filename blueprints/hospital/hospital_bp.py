@@ -3,6 +3,8 @@ from flasgger import swag_from
 from config import db
 from models import DoctorDetails
 from blueprints.hospital.models import Hospital
+from blueprints.doctor.directory import DOCTOR_DIRECTORY
+from utils.cache import bump_version
 
 hospital_bp = Blueprint('hospital_bp', __name__)
 
@@ -52,6 +54,7 @@ def add_hospital():
     )
 
     db.session.add(hospital)
+    bump_version(DOCTOR_DIRECTORY)
     db.session.commit()
 
     return jsonify({"message": "Hospital added successfully"}), 201
@@ -0,0 +1,172 @@
+from flask import Blueprint, request, jsonify
+from flasgger import swag_from
+from config import db
+from models import User, UserDetails, TextReport, Routine, Appointment, Prescription
+from blueprints.user.user_bp import serialize_user_details
+from blueprints.appointment.appointment_bp import appointment_page
+from blueprints.prescription.prescription_bp import prescription_page
+from utils.pagination import encode_cursor, decode_cursor, parse_limit, keyset_after
+from utils.auth import authorize
+from datetime import datetime
+
+patient_bp = Blueprint('patient_bp', __name__)
+
+CHART_SECTIONS = ('details', 'reports', 'prescriptions', 'appointments', 'routines')
+
+# Default page size of each paged chart section, overridable with <section>_limit
+CHART_SECTION_LIMITS = {
+    'reports': 10,
+    'prescriptions': 20,
+    'appointments': 20,
+    'routines': 5
+}
+
+# Query parameters of one section: <section>_limit, <section>_cursor, ... with the prefix stripped
+def section_args(section):
+    prefix = f'{section}_'
+    args = {key[len(prefix):]: value for key, value in request.args.items() if key.startswith(prefix)}
+    args.setdefault('limit', str(CHART_SECTION_LIMITS[section]))
+    return args
+
+# One newest-first page of a per-user table ordered by (created_at, id), used for reports and routines
+def recent_page(model, columns, clerkid, args):
+    limit = parse_limit(args.get('limit'))
+    query = db.session.query(model.id, model.created_at, *columns).filter(model.clerkid == clerkid)
+
+    cursor = args.get('cursor')
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        if not isinstance(last_date, datetime) or not isinstance(last_id, int):
+            raise ValueError("Invalid cursor")
+        query = query.filter(keyset_after((model.created_at, model.id), (last_date, last_id), descending=True))
+
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    items = [
+        dict({column.key: getattr(row, column.key) for column in columns}, created_at=row.created_at.isoformat())
+        for row in rows
+    ]
+    return items, next_cursor
+
+# Route to fetch a patient's whole chart in one call
+@patient_bp.route('/<clerkid>/chart', methods=['GET'])
+@swag_from({
+    'summary': 'Fetches a patient\'s details, reports, prescriptions, appointments and routines in one document',
+    'tags': ['Patient'],
+    'parameters': [
+        {
+            'name': 'clerkid',
+            'in': 'path',
+            'type': 'string',
+            'required': True,
+            'description': 'ClerkID of the patient'
+        },
+        {
+            'name': 'sections',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Comma-separated sections to include (default: details,reports,prescriptions,appointments,routines)'
+        },
+        {
+            'name': 'reports_limit',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Page size of a section (default reports 10, prescriptions 20, appointments 20, routines 5); '
+                           'prescriptions_limit, appointments_limit and routines_limit work the same way'
+        },
+        {
+            'name': 'reports_cursor',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Continues a section from its next_cursor; prescriptions_cursor, appointments_cursor '
+                           'and routines_cursor work the same way'
+        },
+        {
+            'name': 'appointments_status',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Filters passed through to a section, e.g. appointments_status, appointments_from, prescriptions_doctor_clerkid'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Chart fetched successfully',
+            'examples': {
+                'application/json': {
+                    'clerkid': '5678',
+                    'details': {'clerkid': '5678', 'first_name': 'Jane', 'last_name': 'Smith', 'blood_group': 'O+'},
+                    'reports': {
+                        'items': [{'file_url': 'http://example.com/file.pdf', 'summarized_text': 'This is a sample summary', 'created_at': '2025-01-17T18:30:00'}],
+                        'next_cursor': None
+                    },
+                    'prescriptions': {'items': [], 'next_cursor': None},
+                    'appointments': {'items': [], 'next_cursor': None},
+                    'routines': {'items': [], 'next_cursor': None}
+                }
+            }
+        },
+        400: {
+            'description': 'User not found, not a patient, or invalid parameter',
+            'examples': {'application/json': {'error': 'User not found'}}
+        },
+        403: {
+            'description': 'Neither the patient nor a doctor',
+            'examples': {'application/json': {'error': 'Not allowed to act for this user'}}
+        }
+    }
+})
+def get_patient_chart(clerkid):
+    # Patients see their own chart, doctors any patient's
+    denied = authorize(clerkid, ('PATIENT',)) and authorize(roles=('DOCTOR',))
+    if denied:
+        return denied
+
+    sections = request.args.get('sections')
+    sections = [section.strip() for section in sections.split(',')] if sections else list(CHART_SECTIONS)
+    unknown = [section for section in sections if section not in CHART_SECTIONS]
+    if unknown:
+        return jsonify({"error": f"Unknown section(s): {', '.join(unknown)}"}), 400
+
+    # The user lookup and the details section share one query
+    row = (
+        db.session.query(User.clerkid, User.role, UserDetails)
+        .outerjoin(UserDetails, UserDetails.clerkid == User.clerkid)
+        .filter(User.clerkid == clerkid)
+        .first()
+    )
+    if not row:
+        return jsonify({"error": "User not found"}), 400
+    if row.role != 'PATIENT':
+        return jsonify({"error": "Patient not found"}), 400
+
+    chart = {'clerkid': clerkid}
+    try:
+        if 'details' in sections:
+            chart['details'] = serialize_user_details(row.UserDetails) if row.UserDetails else None
+        if 'reports' in sections:
+            items, next_cursor = recent_page(
+                TextReport, (TextReport.file_url, TextReport.summarized_text), clerkid, section_args('reports')
+            )
+            chart['reports'] = {'items': items, 'next_cursor': next_cursor}
+        if 'prescriptions' in sections:
+            items, next_cursor = prescription_page([Prescription.patient_clerkid == clerkid], section_args('prescriptions'))
+            chart['prescriptions'] = {'items': items, 'next_cursor': next_cursor}
+        if 'appointments' in sections:
+            items, next_cursor = appointment_page([Appointment.patient_clerkid == clerkid], section_args('appointments'))
+            chart['appointments'] = {'items': items, 'next_cursor': next_cursor}
+        if 'routines' in sections:
+            items, next_cursor = recent_page(Routine, (Routine.goal, Routine.routine), clerkid, section_args('routines'))
+            chart['routines'] = {'items': items, 'next_cursor': next_cursor}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(chart), 200
@@ -1,11 +1,19 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, g
 from flasgger import swag_from
 from config import db
-from models import Prescription, User, DoctorDetails
+from models import Prescription, User, DoctorDetails, Appointment
 from blueprints.hospital.models import Hospital # Import Hospital model
+from utils.pagination import encode_cursor, decode_cursor, parse_limit, parse_datetime, keyset_after
+from utils.fulltext import fulltext_backend, normalize_query
+from utils.identity import resolve_user, resolve_users
+from utils.auth import authorize
+from sqlalchemy import select, insert, union
+from datetime import datetime
 
 prescription_bp = Blueprint('prescription_bp', __name__)
 
+BULK_ADD_LIMIT = 1000
+
 # Route to add a prescription (used by doctor)
 @prescription_bp.route('/add-prescription', methods=['POST'])
 @swag_from({
@@ -47,8 +55,13 @@ def add_prescription():
     prescription_text = data.get('prescription_text')
     hospital_id = data.get('hospital_id')  # Get hospital_id from request
 
-    doctor = User.query.filter_by(clerkid=doctor_clerkid).first()
-    patient = User.query.filter_by(clerkid=patient_clerkid).first()
+    denied = authorize(doctor_clerkid, ('DOCTOR',))
+    if denied:
+        return denied
+
+    users = resolve_users([doctor_clerkid, patient_clerkid])
+    doctor = users.get(doctor_clerkid)
+    patient = users.get(patient_clerkid)
 
     if not doctor or doctor.role != 'DOCTOR':
         return jsonify({"error": "Doctor not found"}), 400
@@ -67,10 +80,207 @@ def add_prescription():
 
     return jsonify({"message": "Prescription added successfully"}), 201
 
+# Route to issue many prescriptions at once, e.g. during ward rounds (used by doctor)
+@prescription_bp.route('/bulk-add', methods=['POST'])
+@swag_from({
+    'summary': 'Add up to 1000 prescriptions from one doctor in one transaction, with per-item results',
+    'tags': ['Prescription'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'doctor_clerkid': {'type': 'string'},
+                    'hospital_id': {'type': 'integer', 'description': 'Default hospital for items that do not set one'},
+                    'prescriptions': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'patient_clerkid': {'type': 'string'},
+                                'prescription_text': {'type': 'string'},
+                                'hospital_id': {'type': 'integer'}
+                            },
+                            'required': ['patient_clerkid', 'prescription_text']
+                        }
+                    }
+                },
+                'required': ['doctor_clerkid', 'prescriptions']
+            }
+        }
+    ],
+    'responses': {
+        201: {
+            'description': 'At least one prescription was added; see results for the items that failed',
+            'examples': {
+                'application/json': {
+                    'created': 1,
+                    'failed': 1,
+                    'results': [
+                        {'index': 0, 'id': 42, 'status': 'created'},
+                        {'index': 1, 'status': 'failed', 'error': 'Patient not found'}
+                    ]
+                }
+            }
+        },
+        400: {
+            'description': 'Malformed body, unknown doctor, or no prescription could be added',
+            'examples': {'application/json': {'error': 'Doctor not found'}}
+        }
+    }
+})
+def bulk_add_prescriptions():
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be an object"}), 400
+
+    doctor_clerkid = data.get('doctor_clerkid')
+    default_hospital_id = data.get('hospital_id')
+    items = data.get('prescriptions')
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "prescriptions must be a non-empty list"}), 400
+    if len(items) > BULK_ADD_LIMIT:
+        return jsonify({"error": f"At most {BULK_ADD_LIMIT} prescriptions can be added at once"}), 400
+
+    # The doctor is checked once for the whole batch
+    denied = authorize(doctor_clerkid, ('DOCTOR',))
+    if denied:
+        return denied
+    doctor = resolve_user(doctor_clerkid)
+    if not doctor or doctor.role != 'DOCTOR':
+        return jsonify({"error": "Doctor not found"}), 400
+
+    results = [None] * len(items)
+    candidates = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('patient_clerkid') or not item.get('prescription_text'):
+            results[index] = {'index': index, 'status': 'failed', 'error': 'patient_clerkid and prescription_text are required'}
+            continue
+        hospital_id = item.get('hospital_id', default_hospital_id)
+        if hospital_id is not None and not isinstance(hospital_id, int):
+            results[index] = {'index': index, 'status': 'failed', 'error': 'hospital_id must be an integer'}
+            continue
+        candidates.append((index, item, hospital_id))
+
+    rows = []
+    if candidates:
+        # One IN query for every patient not already cached and one for every hospital in the batch
+        patient_clerkids = {item['patient_clerkid'] for _, item, _ in candidates}
+        patients = {clerkid for clerkid, identity in resolve_users(patient_clerkids).items() if identity.role == 'PATIENT'}
+        hospital_ids = {hospital_id for _, _, hospital_id in candidates if hospital_id is not None}
+        hospitals = set(db.session.execute(
+            select(Hospital.id).where(Hospital.id.in_(hospital_ids))
+        ).scalars()) if hospital_ids else set()
+
+        for index, item, hospital_id in candidates:
+            if item['patient_clerkid'] not in patients:
+                results[index] = {'index': index, 'status': 'failed', 'error': 'Patient not found'}
+            elif hospital_id is not None and hospital_id not in hospitals:
+                results[index] = {'index': index, 'status': 'failed', 'error': 'Hospital not found'}
+            else:
+                rows.append((index, {
+                    'doctor_clerkid': doctor_clerkid,
+                    'patient_clerkid': item['patient_clerkid'],
+                    'prescription_text': item['prescription_text'],
+                    'hospital_id': hospital_id
+                }))
+
+    if rows:
+        inserted = db.session.execute(
+            insert(Prescription).returning(Prescription.id, sort_by_parameter_order=True),
+            [row for _, row in rows]
+        ).scalars().all()
+        db.session.commit()
+
+        for (index, _), prescription_id in zip(rows, inserted):
+            results[index] = {'index': index, 'id': prescription_id, 'status': 'created'}
+
+    created = len(rows)
+    return jsonify({
+        'created': created,
+        'failed': len(items) - created,
+        'results': results
+    }), 201 if created else 400
+
+# Builds one page of prescriptions in a single query: the doctor's name comes from a
+# correlated subquery and the hospital name from an outer join, newest first by
+# (prescription_date, id) and paged with a keyset cursor
+def prescription_page(filters, args):
+    limit = parse_limit(args.get('limit'))
+    date_from = parse_datetime(args.get('from'), 'from')
+    date_to = parse_datetime(args.get('to'), 'to')
+
+    doctor_name = (
+        select(DoctorDetails.first_name + ' ' + DoctorDetails.last_name)
+        .where(DoctorDetails.clerkid == Prescription.doctor_clerkid)
+        .limit(1)
+        .correlate(Prescription)
+        .scalar_subquery()
+    )
+    query = (
+        db.session.query(
+            Prescription.id,
+            Prescription.doctor_clerkid,
+            Prescription.patient_clerkid,
+            Prescription.prescription_date,
+            Prescription.prescription_text,
+            Prescription.hospital_id,
+            doctor_name.label('doctor_name'),
+            Hospital.name.label('hospital_name')
+        )
+        .outerjoin(Hospital, Prescription.hospital_id == Hospital.id)
+        .filter(*filters)
+    )
+
+    if args.get('doctor_clerkid'):
+        query = query.filter(Prescription.doctor_clerkid == args.get('doctor_clerkid'))
+    if args.get('hospital_id'):
+        try:
+            query = query.filter(Prescription.hospital_id == int(args.get('hospital_id')))
+        except ValueError:
+            raise ValueError("Invalid hospital_id")
+    if date_from:
+        query = query.filter(Prescription.prescription_date >= date_from)
+    if date_to:
+        query = query.filter(Prescription.prescription_date < date_to)
+
+    cursor = args.get('cursor')
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        if not isinstance(last_date, datetime) or not isinstance(last_id, int):
+            raise ValueError("Invalid cursor")
+        query = query.filter(keyset_after((Prescription.prescription_date, Prescription.id), (last_date, last_id), descending=True))
+
+    rows = query.order_by(Prescription.prescription_date.desc(), Prescription.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].prescription_date, rows[-1].id)
+
+    prescription_list = [
+        {
+            'id': row.id,
+            'doctor_clerkid': row.doctor_clerkid,
+            'doctor_name': row.doctor_name or "Unknown",
+            'patient_clerkid': row.patient_clerkid,
+            'prescription_date': row.prescription_date.isoformat(),
+            'prescription_text': row.prescription_text,
+            'hospital_id': row.hospital_id,
+            'hospital_name': row.hospital_name
+        }
+        for row in rows
+    ]
+
+    return prescription_list, next_cursor
+
 # Route to get all prescriptions for a patient
 @prescription_bp.route('/get-prescriptions/<patient_clerkid>', methods=['GET'])
 @swag_from({
-    'summary': 'Get all prescriptions for a patient',
+    'summary': 'Get the prescriptions of a patient, newest first, one page at a time',
     'tags': ['Prescription'],
     'parameters': [
         {
@@ -79,55 +289,237 @@ def add_prescription():
             'type': 'string',
             'required': True,
             'description': 'ClerkID of the patient'
+        },
+        {
+            'name': 'doctor_clerkid',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Only include prescriptions issued by this doctor'
+        },
+        {
+            'name': 'hospital_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Only include prescriptions issued at this hospital'
+        },
+        {
+            'name': 'from',
+            'in': 'query',
+            'type': 'string',
+            'format': 'date-time',
+            'required': False,
+            'description': 'Only include prescriptions on or after this date'
+        },
+        {
+            'name': 'to',
+            'in': 'query',
+            'type': 'string',
+            'format': 'date-time',
+            'required': False,
+            'description': 'Only include prescriptions before this date'
+        },
+        {
+            'name': 'cursor',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'next_cursor value returned by the previous page'
+        },
+        {
+            'name': 'limit',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Page size (default 50, max 200)'
         }
     ],
     'responses': {
         200: {
             'description': 'Prescriptions fetched successfully',
             'examples': {
-                'application/json': [
-                    {
-                        'doctor_clerkid': '1234',
-                        'doctor_name': 'John Doe',
-                        'patient_clerkid': '5678',
-                        'prescription_date': '2023-10-01T12:00:00',
-                        'prescription_text': 'Take two tablets daily',
-                        'hospital_id': 1,  # Added hospital_id
-                        'hospital_name': 'General Hospital'  # Added hospital_name
-                    }
-                ]
+                'application/json': {
+                    'prescriptions': [
+                        {
+                            'id': 7,
+                            'doctor_clerkid': '1234',
+                            'doctor_name': 'John Doe',
+                            'patient_clerkid': '5678',
+                            'prescription_date': '2023-10-01T12:00:00',
+                            'prescription_text': 'Take two tablets daily',
+                            'hospital_id': 1,
+                            'hospital_name': 'General Hospital'
+                        }
+                    ],
+                    'next_cursor': None
+                }
             }
         },
         400: {
-            'description': 'Patient not found',
+            'description': 'Patient not found or invalid query parameters',
             'examples': {'application/json': {'error': 'Patient not found'}}
         }
     }
 })
 def get_prescriptions(patient_clerkid):
-    patient = User.query.filter_by(clerkid=patient_clerkid).first()
+    # Patients see their own prescriptions, doctors any patient's
+    denied = authorize(patient_clerkid, ('PATIENT',)) and authorize(roles=('DOCTOR',))
+    if denied:
+        return denied
+
+    patient = resolve_user(patient_clerkid)
     if not patient or patient.role != 'PATIENT':
         return jsonify({"error": "Patient not found"}), 400
 
-    prescriptions = Prescription.query.filter_by(patient_clerkid=patient_clerkid).all()
-
-    prescription_list = []
-    for prescription in prescriptions:
-        doctor = DoctorDetails.query.filter_by(clerkid=prescription.doctor_clerkid).first()
-        doctor_name = f"{doctor.first_name} {doctor.last_name}" if doctor else "Unknown"
-        
-        # Fetch hospital details
-        hospital = Hospital.query.get(prescription.hospital_id)
-        hospital_name = hospital.name if hospital else None
-
-        prescription_list.append({
-            'doctor_clerkid': prescription.doctor_clerkid,
-            'doctor_name': doctor_name,
-            'patient_clerkid': prescription.patient_clerkid,
-            'prescription_date': prescription.prescription_date.isoformat(),
-            'prescription_text': prescription.prescription_text,
-            'hospital_id': prescription.hospital_id,  # Include hospital_id
-            'hospital_name': hospital_name  # Include hospital_name
-        })
-
-    return jsonify(prescription_list), 200
\ No newline at end of file
+    try:
+        prescription_list, next_cursor = prescription_page([Prescription.patient_clerkid == patient_clerkid], request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"prescriptions": prescription_list, "next_cursor": next_cursor}), 200
+
+# Route for a doctor to search the prescriptions of their patients
+@prescription_bp.route('/search', methods=['GET'])
+@swag_from({
+    'summary': 'Full-text search over the prescriptions of a doctor\'s patients, best matches first',
+    'description': 'Covers every prescription of the patients the doctor has prescribed for or has appointments with.',
+    'tags': ['Prescription'],
+    'parameters': [
+        {
+            'name': 'q',
+            'in': 'query',
+            'type': 'string',
+            'required': True,
+            'description': 'Words to search for, e.g. a drug name; all words must match'
+        },
+        {
+            'name': 'doctor_clerkid',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'ClerkID of the searching doctor; defaults to the bearer token\'s user and must match it'
+        },
+        {
+            'name': 'hospital_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Only search prescriptions issued at this hospital'
+        },
+        {
+            'name': 'limit',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Number of results (default 50, max 200)'
+        },
+        {
+            'name': 'offset',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Number of results to skip'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Matching prescriptions fetched successfully',
+            'examples': {
+                'application/json': {
+                    'results': [
+                        {
+                            'id': 7,
+                            'patient_clerkid': '5678',
+                            'patient_name': 'Jane Smith',
+                            'doctor_clerkid': '1234',
+                            'prescription_date': '2023-10-01T12:00:00',
+                            'hospital_id': 1,
+                            'snippet': 'Take <b>metformin</b> 500mg twice daily',
+                            'rank': 0.0607
+                        }
+                    ],
+                    'next_offset': None
+                }
+            }
+        },
+        400: {
+            'description': 'Missing or invalid query, or not a doctor',
+            'examples': {'application/json': {'error': 'q is required'}}
+        },
+        403: {
+            'description': 'The token is not the searching doctor\'s',
+            'examples': {'application/json': {'error': 'Not allowed to act for this user'}}
+        }
+    }
+})
+def search_prescriptions():
+    q = normalize_query(request.args.get('q'))
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+
+    identity = g.get('identity')
+    doctor_clerkid = request.args.get('doctor_clerkid') or (identity.clerkid if identity else None)
+    if not doctor_clerkid:
+        return jsonify({"error": "doctor_clerkid is required"}), 400
+    denied = authorize(doctor_clerkid, ('DOCTOR',))
+    if denied:
+        return denied
+    doctor = resolve_user(doctor_clerkid)
+    if not doctor or doctor.role != 'DOCTOR':
+        return jsonify({"error": "Doctor not found"}), 400
+
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        offset = max(int(request.args.get('offset', 0)), 0)
+        hospital_id = int(request.args['hospital_id']) if request.args.get('hospital_id') else None
+    except ValueError:
+        return jsonify({"error": "limit, offset and hospital_id must be integers"}), 400
+
+    query = (
+        db.session.query(
+            Prescription.id,
+            Prescription.patient_clerkid,
+            Prescription.doctor_clerkid,
+            Prescription.prescription_date,
+            Prescription.hospital_id,
+            User.first_name,
+            User.last_name
+        )
+        .outerjoin(User, User.clerkid == Prescription.patient_clerkid)
+    )
+    # Only patients the doctor has prescribed for or has appointments with
+    patients = union(
+        select(Prescription.patient_clerkid).where(Prescription.doctor_clerkid == doctor_clerkid),
+        select(Appointment.patient_clerkid).where(Appointment.doctor_clerkid == doctor_clerkid)
+    )
+    query = query.filter(Prescription.patient_clerkid.in_(patients))
+    if hospital_id is not None:
+        query = query.filter(Prescription.hospital_id == hospital_id)
+
+    backend = fulltext_backend(Prescription, 'prescription_text', current_app.config['FULLTEXT_BACKEND'])
+    query, rank, snippet = backend.apply(query, q)
+    rows = (
+        query.add_columns(rank.label('rank'), snippet.label('snippet'))
+        .order_by(rank.desc(), Prescription.id.desc())
+        .offset(offset)
+        .limit(limit + 1)
+        .all()
+    )
+
+    next_offset = offset + limit if len(rows) > limit else None
+    results = [
+        {
+            'id': row.id,
+            'patient_clerkid': row.patient_clerkid,
+            'patient_name': f"{row.first_name} {row.last_name}" if row.first_name else None,
+            'doctor_clerkid': row.doctor_clerkid,
+            'prescription_date': row.prescription_date.isoformat(),
+            'hospital_id': row.hospital_id,
+            'snippet': row.snippet,
+            'rank': round(float(row.rank), 4)
+        }
+        for row in rows[:limit]
+    ]
+
+    return jsonify({"results": results, "next_offset": next_offset}), 200
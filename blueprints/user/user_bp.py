@@ -2,10 +2,16 @@ from flask import Blueprint, request, jsonify
 from flasgger import swag_from
 from config import db
 from models import User, UserDetails
+from utils.cache import ReadThroughCache
+from utils.identity import resolve_user
+from utils.auth import authorize
 from datetime import datetime
 
 user_bp = Blueprint('user_bp', __name__)  # Declare this as a blueprint
 
+# Serialized get-details responses keyed by clerkid
+user_profiles = ReadThroughCache('user-profile')
+
 # Function to handle date conversion
 def convert_to_date(date_string):
     if date_string:
@@ -86,9 +92,12 @@ def create_user_details():
         return jsonify({"error": str(e)}), 400
 
     clerkid = data.get('clerkid')
+    denied = authorize(clerkid)
+    if denied:
+        return denied
 
     # Find the user in the User table using the clerkid
-    user = User.query.filter_by(clerkid=clerkid).first()
+    user = resolve_user(clerkid)
     if not user:
         return jsonify({"error": "User not found"}), 400
 
@@ -129,10 +138,56 @@ def create_user_details():
     )
 
     db.session.add(user_details)
+    user_profiles.invalidate(user.clerkid)
     db.session.commit()
 
     return jsonify({"message": "User details created successfully"}), 201
 
+# Full medical profile of a user as returned by get-details
+def serialize_user_details(user_details):
+    return {
+        'clerkid': user_details.clerkid,
+        'first_name': user_details.first_name,
+        'last_name': user_details.last_name,
+        'email': user_details.email,
+        'phone_number': user_details.phone_number,
+        'age': user_details.age,
+        'address': user_details.address,
+        'blood_group': user_details.blood_group,
+        'known_allergies': user_details.known_allergies,
+        'chronic_conditions': user_details.chronic_conditions,
+        'previous_major_diseases': user_details.previous_major_diseases,
+        'previous_major_surgeries': user_details.previous_major_surgeries,
+        'family_medical_history': user_details.family_medical_history,
+        'height': user_details.height,
+        'weight': user_details.weight,
+        'bmi': user_details.bmi,
+        'current_medication': user_details.current_medication,
+        'current_health_conditions': user_details.current_health_conditions,
+        'vaccination_history': user_details.vaccination_history,
+        'emergency_contact_name': user_details.emergency_contact_name,
+        'emergency_contact_phone': user_details.emergency_contact_phone,
+        'emergency_contact_relationship': user_details.emergency_contact_relationship,
+        'smoking_status': user_details.smoking_status,
+        'alcohol_consumption': user_details.alcohol_consumption,
+        'exercise_frequency': user_details.exercise_frequency,
+        'dietary_preferences': user_details.dietary_preferences,
+        'insurance_provider': user_details.insurance_provider,
+        'insurance_plan_number': user_details.insurance_plan_number,
+        'insurance_validity': user_details.insurance_validity,
+        'mental_health_conditions': user_details.mental_health_conditions
+    }
+
+# Loads the profile with one join; None if the user or their details do not exist
+def load_user_profile(clerkid):
+    user_details = (
+        db.session.query(UserDetails)
+        .join(User, User.clerkid == UserDetails.clerkid)
+        .filter(UserDetails.clerkid == clerkid)
+        .first()
+    )
+    return serialize_user_details(user_details) if user_details else None
+
 # API route to get user details
 @user_bp.route('/get-details/<clerkid>', methods=['GET'])
 @swag_from({
@@ -161,47 +216,18 @@ def create_user_details():
     }
 })
 def get_user_details(clerkid):
-    user = User.query.filter_by(clerkid=clerkid).first()
-    if not user:
-        return jsonify({"error": "User not found"}), 400
-
-    user_details = UserDetails.query.filter_by(clerkid=user.clerkid).first()
+    denied = authorize(clerkid)
+    if denied:
+        return denied
 
-    if not user_details:
+    # Repeat reads are served from the profile cache
+    profile = user_profiles.get(clerkid, lambda: load_user_profile(clerkid))
+    if profile is None:
+        if not resolve_user(clerkid):
+            return jsonify({"error": "User not found"}), 400
         return jsonify({"error": "User details not found"}), 400
 
-    return jsonify({
-        'clerkid': user.clerkid,
-        'first_name': user_details.first_name,
-        'last_name': user_details.last_name,
-        'email': user_details.email,
-        'phone_number': user_details.phone_number,
-        'age': user_details.age,
-        'address': user_details.address,
-        'blood_group': user_details.blood_group,
-        'known_allergies': user_details.known_allergies,
-        'chronic_conditions': user_details.chronic_conditions,
-        'previous_major_diseases': user_details.previous_major_diseases,
-        'previous_major_surgeries': user_details.previous_major_surgeries,
-        'family_medical_history': user_details.family_medical_history,
-        'height': user_details.height,
-        'weight': user_details.weight,
-        'bmi': user_details.bmi,
-        'current_medication': user_details.current_medication,
-        'current_health_conditions': user_details.current_health_conditions,
-        'vaccination_history': user_details.vaccination_history,
-        'emergency_contact_name': user_details.emergency_contact_name,
-        'emergency_contact_phone': user_details.emergency_contact_phone,
-        'emergency_contact_relationship': user_details.emergency_contact_relationship,
-        'smoking_status': user_details.smoking_status,
-        'alcohol_consumption': user_details.alcohol_consumption,
-        'exercise_frequency': user_details.exercise_frequency,
-        'dietary_preferences': user_details.dietary_preferences,
-        'insurance_provider': user_details.insurance_provider,
-        'insurance_plan_number': user_details.insurance_plan_number,
-        'insurance_validity': user_details.insurance_validity,
-        'mental_health_conditions': user_details.mental_health_conditions
-    }), 200
+    return jsonify(profile), 200
 
 # API route to update user details
 @user_bp.route('/update-details/<clerkid>', methods=['PATCH'])
@@ -220,10 +246,14 @@ def get_user_details(clerkid):
     }
 })
 def update_user_details(clerkid):
+    denied = authorize(clerkid)
+    if denied:
+        return denied
+
     data = request.json  # Get the JSON data sent by the client
 
     # Find the user by clerkid
-    user = User.query.filter_by(clerkid=clerkid).first()
+    user = resolve_user(clerkid)
     if not user:
         return jsonify({"error": "User not found"}), 400
 
@@ -304,6 +334,7 @@ def update_user_details(clerkid):
 
     # Commit changes to the database
     try:
+        user_profiles.invalidate(user.clerkid)
         db.session.commit()
     except Exception as e:
         db.session.rollback()
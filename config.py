@@ -16,6 +16,57 @@ def configure_app(app: Flask):  #configures entire flask app
         'uiversion': 3
     }
     app.config['SCHEDULER_API_ENABLED'] = True
+    app.config['SCHEDULER_MODE'] = os.getenv('SCHEDULER_MODE', 'leader')   #leader / embedded / off, see utils/scheduler.py
+    app.config['SCHEDULER_LEASE_SECONDS'] = int(os.getenv('SCHEDULER_LEASE_SECONDS', 60))   #leader failover happens after this long
+    app.config['SCHEDULER_RENEW_SECONDS'] = int(os.getenv('SCHEDULER_RENEW_SECONDS', 20))
+    app.config['APPOINTMENT_SLOT_MINUTES'] = int(os.getenv('APPOINTMENT_SLOT_MINUTES', 30))   #length of one bookable appointment slot
+    app.config['APPOINTMENT_FEED_POLL_SECONDS'] = float(os.getenv('APPOINTMENT_FEED_POLL_SECONDS', 1))   #how often a process tails appointment_events while clients listen
+    app.config['APPOINTMENT_FEED_BUFFER_SIZE'] = int(os.getenv('APPOINTMENT_FEED_BUFFER_SIZE', 5000))   #recent events kept in memory per process
+    app.config['APPOINTMENT_FEED_GAP_SECONDS'] = int(os.getenv('APPOINTMENT_FEED_GAP_SECONDS', 60))   #how long the feed waits for ids skipped by transactions that commit late
+    app.config['APPOINTMENT_STREAM_SECONDS'] = int(os.getenv('APPOINTMENT_STREAM_SECONDS', 300))   #SSE connections are closed (and resumed by the client) after this
+    app.config['APPOINTMENT_STREAM_HEARTBEAT_SECONDS'] = int(os.getenv('APPOINTMENT_STREAM_HEARTBEAT_SECONDS', 15))
+    app.config['APPOINTMENT_STREAM_MAX_CONNECTIONS'] = int(os.getenv('APPOINTMENT_STREAM_MAX_CONNECTIONS', 4))   #open streams/long-polls per process; keep below GUNICORN_THREADS, raise with an async worker class
+    app.config['APPOINTMENT_EVENT_RETENTION_DAYS'] = int(os.getenv('APPOINTMENT_EVENT_RETENTION_DAYS', 7))
+    app.config['FULLTEXT_BACKEND'] = os.getenv('FULLTEXT_BACKEND')   #postgres / sqlite / like, defaults to the database's own engine
+    app.config['CACHE_VERSION_CHECK_SECONDS'] = float(os.getenv('CACHE_VERSION_CHECK_SECONDS', 2))   #how stale an in-process snapshot may be after another worker's write
+    app.config['CACHE_MAX_ENTRIES'] = int(os.getenv('CACHE_MAX_ENTRIES', 10000))   #per cache, per process
+    app.config['CACHE_TTL_SECONDS'] = int(os.getenv('CACHE_TTL_SECONDS', 300))
+    app.config['CACHE_INVALIDATION_POLL_SECONDS'] = float(os.getenv('CACHE_INVALIDATION_POLL_SECONDS', 2))   #how soon other workers drop an entry after a write
+    app.config['CACHE_INVALIDATION_GAP_SECONDS'] = int(os.getenv('CACHE_INVALIDATION_GAP_SECONDS', 60))   #how long the listener waits for ids skipped by transactions that commit late
+    app.config['CACHE_INVALIDATION_RETENTION_HOURS'] = int(os.getenv('CACHE_INVALIDATION_RETENTION_HOURS', 24))
+    app.config['AUTH_REQUIRED'] = os.getenv('AUTH_REQUIRED', 'false').lower() == 'true'   #reject requests without a bearer token
+    app.config['JWT_KEYS_FILE'] = os.getenv('JWT_KEYS_FILE')   #local JWKS (e.g. a saved copy of Clerk's) or PEM public key
+    app.config['JWT_PUBLIC_KEY'] = os.getenv('JWT_PUBLIC_KEY')   #PEM public key, e.g. Clerk's JWT verification key
+    app.config['JWT_SECRET'] = os.getenv('JWT_SECRET')   #HS256 shared secret, mainly for local testing
+    app.config['JWT_ISSUER'] = os.getenv('JWT_ISSUER')
+    app.config['JWT_AUDIENCE'] = os.getenv('JWT_AUDIENCE')
+    app.config['JWT_ROLE_CLAIM'] = os.getenv('JWT_ROLE_CLAIM', 'role')   #dotted path of the role in the session claims
+    app.config['JWT_LEEWAY_SECONDS'] = int(os.getenv('JWT_LEEWAY_SECONDS', 30))
+    app.config['AI_BACKEND'] = os.getenv('AI_BACKEND', 'gemini')   #gemini / fake (deterministic, offline; for tests and benchmarks)
+    app.config['AI_MODEL'] = os.getenv('AI_MODEL', 'gemini-1.5-flash')
+    app.config['GOOGLE_GEMINI_API_KEY'] = os.getenv('GOOGLE_GEMINI_API_KEY')
+    app.config['AI_TIMEOUT_SECONDS'] = float(os.getenv('AI_TIMEOUT_SECONDS', 60))   #deadline per model call, including time queued
+    app.config['AI_MAX_CONCURRENCY'] = int(os.getenv('AI_MAX_CONCURRENCY', 4))   #model calls in flight per process
+    app.config['AI_QUEUE_TIMEOUT_SECONDS'] = float(os.getenv('AI_QUEUE_TIMEOUT_SECONDS', 10))   #how long a call may wait for a slot before a 503
+    app.config['AI_FAKE_LATENCY_MS'] = int(os.getenv('AI_FAKE_LATENCY_MS', 0))
+    app.config['SUMMARY_CHUNK_TOKENS'] = int(os.getenv('SUMMARY_CHUNK_TOKENS', 8000))   #longer reports are summarized in chunks of about this size and merged
+    app.config['SUMMARY_MAP_CONCURRENCY'] = int(os.getenv('SUMMARY_MAP_CONCURRENCY', 3))   #chunks summarized at once per report, further capped at AI_MAX_CONCURRENCY // REPORT_WORKER_THREADS since all report workers share the gateway
+    app.config['SUMMARY_CACHE_LOCAL_ENTRIES'] = int(os.getenv('SUMMARY_CACHE_LOCAL_ENTRIES', 1000))   #report summaries kept in memory per process
+    app.config['SUMMARY_CACHE_MAX_AGE_DAYS'] = int(os.getenv('SUMMARY_CACHE_MAX_AGE_DAYS', 90))   #summaries unused for this long are dropped
+    app.config['SUMMARY_CACHE_MAX_ROWS'] = int(os.getenv('SUMMARY_CACHE_MAX_ROWS', 100000))   #least recently used rows beyond this are dropped
+    app.config['ROUTINE_CACHE_LOCAL_ENTRIES'] = int(os.getenv('ROUTINE_CACHE_LOCAL_ENTRIES', 1000))   #routines kept in memory per process
+    app.config['ROUTINE_CACHE_MAX_ROWS'] = int(os.getenv('ROUTINE_CACHE_MAX_ROWS', 10000))   #least popular goals beyond this are dropped
+    app.config['ROUTINE_CACHE_MAX_IDLE_DAYS'] = int(os.getenv('ROUTINE_CACHE_MAX_IDLE_DAYS', 90))
+    app.config['ROUTINE_CACHE_REFRESH_DAYS'] = int(os.getenv('ROUTINE_CACHE_REFRESH_DAYS', 30))   #cached plans older than this are regenerated, 0 = never
+    app.config['ROUTINE_CACHE_SERVE_STALE'] = os.getenv('ROUTINE_CACHE_SERVE_STALE', 'true').lower() == 'true'   #serve an old plan while it is refreshed in the background
+    app.config['REPORT_WORKER_MODE'] = os.getenv('REPORT_WORKER_MODE', 'embedded')   #embedded / off (worker.py runs the pool), see utils/report_jobs.py
+    app.config['REPORT_WORKER_THREADS'] = int(os.getenv('REPORT_WORKER_THREADS', 2))   #report jobs processed at once per process
+    app.config['REPORT_WORKER_POLL_SECONDS'] = float(os.getenv('REPORT_WORKER_POLL_SECONDS', 2))   #how soon jobs enqueued by other processes are picked up
+    app.config['REPORT_JOB_LEASE_SECONDS'] = int(os.getenv('REPORT_JOB_LEASE_SECONDS', 300))   #a job whose worker died is retried after this
+    app.config['REPORT_JOB_MAX_ATTEMPTS'] = int(os.getenv('REPORT_JOB_MAX_ATTEMPTS', 3))
+    app.config['REPORT_JOB_RETENTION_DAYS'] = int(os.getenv('REPORT_JOB_RETENTION_DAYS', 7))   #finished jobs stay pollable this long
+    app.config['REPORT_UPLOAD_MAX_BYTES'] = int(os.getenv('REPORT_UPLOAD_MAX_BYTES', 20 * 1024 * 1024))
+    app.config['EXPIRY_SWEEP_CHUNK_SIZE'] = int(os.getenv('EXPIRY_SWEEP_CHUNK_SIZE', 500))   #rows expired per UPDATE/transaction
 
     db.init_app(app)    #link db instance to app instance
     Swagger(app)    #init Swagger (used for API documentation - avail at /apidocs)
\ No newline at end of file
@@ -1,3 +1,12 @@
+import os
+
 workers = 3
+# Threaded workers so long-lived /appointment/stream and /appointment/changes
+# connections don't pin a whole worker each. Each one still holds a thread, so
+# APPOINTMENT_STREAM_MAX_CONNECTIONS caps them below the thread count. For many
+# idle dashboards use GUNICORN_WORKER_CLASS=gevent (with gevent installed) and a
+# higher cap, or run a separate gunicorn for /appointment/stream and /changes.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 8))
 timeout = 120
 bind = "0.0.0.0:8000"
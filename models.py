@@ -69,6 +69,18 @@ class UserDetails(db.Model):
     # Relationship
     user = db.relationship('User', back_populates="user_details")
 
+    __table_args__ = (
+        db.Index('ix_user_details_clerkid', 'clerkid'),
+    )
+
+# Case-insensitive prefix indexes for the patient roster search (text_pattern_ops lets Postgres use them for LIKE 'q%')
+db.Index('ix_user_details_first_name_lower', db.func.lower(UserDetails.first_name).label('first_name_lower'),
+         postgresql_ops={'first_name_lower': 'text_pattern_ops'})
+db.Index('ix_user_details_last_name_lower', db.func.lower(UserDetails.last_name).label('last_name_lower'),
+         postgresql_ops={'last_name_lower': 'text_pattern_ops'})
+db.Index('ix_user_details_email_lower', db.func.lower(UserDetails.email).label('email_lower'),
+         postgresql_ops={'email_lower': 'text_pattern_ops'})
+
 
 class TextReport(db.Model):
     __tablename__ = 'text_reports'
@@ -81,6 +93,11 @@ class TextReport(db.Model):
 
     user = db.relationship('User', back_populates="text_reports")  # Relationship with User model
 
+    # Backs the per-user newest-first (created_at, id) listing
+    __table_args__ = (
+        db.Index('ix_text_reports_clerkid_created', 'clerkid', 'created_at', 'id'),
+    )
+
 class DoctorDetails(db.Model):
     __tablename__ = 'doctor_details'
 
@@ -99,10 +116,16 @@ class DoctorDetails(db.Model):
     available_days = db.Column(db.String(50), nullable=False)
     available_time = db.Column(db.String(50), nullable=False)
     hospital_id = db.Column(db.Integer, db.ForeignKey('hospitals.id'), nullable=True)
+    directory_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Doctor directory version of the last write, for incremental refreshes
 
     user = db.relationship('User', back_populates='doctor_details')
     hospital = db.relationship('Hospital', back_populates='doctors')
 
+    __table_args__ = (
+        db.Index('ix_doctor_details_clerkid', 'clerkid'),
+        db.Index('ix_doctor_details_directory_version', 'directory_version'),
+    )
+
 class Prescription(db.Model):
     __tablename__ = 'prescriptions'
 
@@ -115,7 +138,17 @@ class Prescription(db.Model):
 
     doctor = db.relationship('User', foreign_keys=[doctor_clerkid])
     patient = db.relationship('User', foreign_keys=[patient_clerkid])
+
+    # Backs the per-patient (prescription_date DESC, id DESC) keyset listing
+    __table_args__ = (
+        db.Index('ix_prescriptions_patient_date', 'patient_clerkid', 'prescription_date', 'id'),
+    )
     
+# Appointments in these statuses are never moved to 'expired' by the sweep
+EXPIRY_EXEMPT_STATUSES = ('completed', 'expired')
+# Appointments in these statuses occupy their doctor's time slot
+BOOKED_STATUSES = ('pending', 'approved')
+
 class Appointment(db.Model):
     __tablename__ = 'appointments'
 
@@ -126,6 +159,43 @@ class Appointment(db.Model):
     status = db.Column(db.String(15), nullable=False)
     text_field = db.Column(db.Text, nullable=True)
     hospital_id = db.Column(db.Integer, db.ForeignKey('hospitals.id'), nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every status change, for optimistic concurrency
+
+    # Composite indexes backing the per-user (appointment_date, id) keyset listing,
+    # a partial index over the rows the expiry sweep still has to visit, and a unique
+    # partial index that stops two concurrent bookings of the same doctor slot
+    __table_args__ = (
+        db.Index('ix_appointments_doctor_date', 'doctor_clerkid', 'appointment_date', 'id'),
+        db.Index('ix_appointments_patient_date', 'patient_clerkid', 'appointment_date', 'id'),
+        db.Index(
+            'uq_appointments_doctor_booked_slot', doctor_clerkid, appointment_date, unique=True,
+            postgresql_where=status.in_(BOOKED_STATUSES),
+            sqlite_where=status.in_(BOOKED_STATUSES)
+        ),
+        db.Index(
+            'ix_appointments_unexpired_date', appointment_date,
+            postgresql_where=status.notin_(EXPIRY_EXEMPT_STATUSES),
+            sqlite_where=status.notin_(EXPIRY_EXEMPT_STATUSES)
+        ),
+    )
+
+class AppointmentEvent(db.Model):
+    __tablename__ = 'appointment_events'
+
+    id = db.Column(db.Integer, primary_key=True)  # Monotonic, doubles as the change-stream cursor
+    appointment_id = db.Column(db.Integer, nullable=False)
+    doctor_clerkid = db.Column(db.String(36), nullable=False)
+    patient_clerkid = db.Column(db.String(36), nullable=False)
+    appointment_date = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(15), nullable=False)  # Status after the change
+    event = db.Column(db.String(20), nullable=False)  # created / status_changed / expired
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+    # Per-user tails read (clerkid, id > cursor)
+    __table_args__ = (
+        db.Index('ix_appointment_events_doctor', 'doctor_clerkid', 'id'),
+        db.Index('ix_appointment_events_patient', 'patient_clerkid', 'id'),
+    )
 
 class Routine (db.Model):
     __tablename__ = 'routines'
@@ -136,4 +206,84 @@ class Routine (db.Model):
     routine = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
 
-    user = db.relationship('User', back_populates='routine')  # Relationship with User model
\ No newline at end of file
+    user = db.relationship('User', back_populates='routine')  # Relationship with User model
+
+    # Backs the per-user newest-first (created_at, id) listing
+    __table_args__ = (
+        db.Index('ix_routines_clerkid_created', 'clerkid', 'created_at', 'id'),
+    )
+
+class SchedulerLease(db.Model):
+    __tablename__ = 'scheduler_leases'
+
+    name = db.Column(db.String(64), primary_key=True)  # One row per elected role (e.g. the scheduler leader)
+    owner = db.Column(db.String(128), nullable=False)  # host:pid:nonce of the process holding the lease
+    expires_at = db.Column(db.DateTime, nullable=False)  # Lease is free for takeover once this passes
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+
+    name = db.Column(db.String(64), primary_key=True)  # One counter per cached dataset (e.g. the doctor directory)
+    version = db.Column(db.Integer, nullable=False, default=0)  # Bumped in the same transaction as every write to that dataset
+
+class CacheInvalidation(db.Model):
+    __tablename__ = 'cache_invalidations'
+
+    id = db.Column(db.Integer, primary_key=True)  # Workers tail this log by id
+    cache = db.Column(db.String(64), nullable=False)  # Name of the ReadThroughCache
+    key = db.Column(db.String(255), nullable=False)  # Entry to evict in every worker
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+class SummaryCacheEntry(db.Model):
+    __tablename__ = 'summary_cache'
+
+    key = db.Column(db.String(80), primary_key=True)  # 'text:' or 'file:' + sha256 of the prompt version and the content, or 'part:' + sha256 of a partial's prompt
+    summary = db.Column(db.Text, nullable=False)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False)  # UTC, like last_used_at; both set by utils/summary_cache.py
+    last_used_at = db.Column(db.DateTime, nullable=False)  # Eviction drops the least recently used rows first
+
+    __table_args__ = (
+        db.Index('ix_summary_cache_last_used', 'last_used_at'),
+    )
+
+class RoutineCacheEntry(db.Model):
+    __tablename__ = 'routine_cache'
+
+    key = db.Column(db.String(255), primary_key=True)  # Prompt version + canonical goal, see utils/routine_cache.py
+    goal = db.Column(db.String(100), nullable=False)  # Wording the routine was generated from
+    routine = db.Column(db.Text, nullable=False)
+    hits = db.Column(db.Integer, nullable=False, default=0)  # Halved on every prune so popularity decays
+    generated_at = db.Column(db.DateTime, nullable=False)  # UTC, like last_used_at; both set by utils/routine_cache.py
+    last_used_at = db.Column(db.DateTime, nullable=False)
+
+REPORT_JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+class ReportJob(db.Model):
+    __tablename__ = 'report_jobs'
+
+    id = db.Column(db.String(36), primary_key=True)  # uuid4, handed to the client for polling
+    clerkid = db.Column(db.String(36), db.ForeignKey('User.clerkid'), nullable=False)
+    file_url = db.Column(db.Text, nullable=False)
+    file_extension = db.Column(db.String(10), nullable=False)
+    data = db.Column(db.LargeBinary, nullable=True)  # The uploaded file, cleared once the job finishes
+    status = db.Column(db.String(15), nullable=False, default='queued')  # One of REPORT_JOB_STATUSES
+    stage = db.Column(db.String(20), nullable=False, default='queued')  # queued / extracting / summarizing / done / failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)  # Last failure, kept while the job is retried
+    worker = db.Column(db.String(100), nullable=True)  # Owner of the running attempt
+    available_at = db.Column(db.DateTime, nullable=False)  # Retries are delayed until then (UTC)
+    locked_until = db.Column(db.DateTime, nullable=True)  # A running job whose worker died is reclaimed after this (UTC)
+    text_report_id = db.Column(db.Integer, db.ForeignKey('text_reports.id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)  # All times of a job are UTC, set by utils/report_jobs.py
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # Workers only ever scan unfinished jobs
+    __table_args__ = (
+        db.Index(
+            'ix_report_jobs_unfinished', 'available_at',
+            postgresql_where=status.in_(('queued', 'running')),
+            sqlite_where=status.in_(('queued', 'running'))
+        ),
+    )
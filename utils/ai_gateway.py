@@ -0,0 +1,209 @@
+import hashlib
+import threading
+import time
+from flask import current_app
+
+
+class AIGatewayError(Exception):
+    pass
+
+
+class AIGatewayBusy(AIGatewayError):
+    """All AI_MAX_CONCURRENCY slots stayed taken for AI_QUEUE_TIMEOUT_SECONDS."""
+
+
+class AIGatewayTimeout(AIGatewayError):
+    """The model did not answer within the call's deadline."""
+
+
+class GeminiBackend:
+    """
+    One configured google.generativeai model per process. The library is imported
+    here rather than at module level so the fake backend works without it.
+    """
+
+    def __init__(self, api_key, model_name):
+        if not api_key:
+            raise EnvironmentError("GOOGLE_GEMINI_API_KEY is not set in the environment variables.")
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt, timeout):
+        try:
+            return self.model.generate_content(prompt, request_options={'timeout': timeout}).text
+        except Exception as e:
+            if _is_timeout(e):
+                raise AIGatewayTimeout(f"Model did not answer within {timeout:.0f}s") from e
+            raise
+
+    def stream(self, prompt, timeout):
+        try:
+            response = self.model.generate_content(prompt, stream=True, request_options={'timeout': timeout})
+            for chunk in response:
+                # Safety-blocked and empty chunks have no parts, and reading their .text raises
+                if chunk.parts and chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            if _is_timeout(e):
+                raise AIGatewayTimeout(f"Model did not answer within {timeout:.0f}s") from e
+            raise
+
+
+def _is_timeout(error):
+    # Client-side and server-side deadline errors of google-api-core and requests
+    return type(error).__name__ in ('DeadlineExceeded', 'Timeout', 'ReadTimeout')
+
+
+class FakeBackend:
+    """
+    Deterministic offline stand-in for tests and benchmarks: the same prompt always
+    yields the same text, after an optional AI_FAKE_LATENCY_MS delay.
+    """
+
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000
+
+    def generate(self, prompt, timeout):
+        if self.latency > timeout:
+            time.sleep(timeout)
+            raise AIGatewayTimeout(f"Model did not answer within {timeout:.0f}s")
+        time.sleep(self.latency)
+        return self._answer(prompt)
+
+    def stream(self, prompt, timeout):
+        words = self.generate(prompt, timeout).split(' ')
+        for start in range(0, len(words), 8):
+            yield ' '.join(words[start:start + 8]) + ' '
+
+    def _answer(self, prompt):
+        digest = hashlib.sha256(prompt.encode()).hexdigest()
+        first_line = prompt.strip().splitlines()[0][:80] if prompt.strip() else ''
+        return f"[fake:{digest[:12]}] Response to: {first_line} ({len(prompt)} characters of input)"
+
+
+class AIGateway:
+    """
+    Process-wide entry point for model calls. Holds one backend per process
+    (AI_BACKEND 'gemini' or 'fake'), lets at most AI_MAX_CONCURRENCY calls run at
+    once, makes further callers queue for up to AI_QUEUE_TIMEOUT_SECONDS before
+    raising AIGatewayBusy, and gives every call a deadline of AI_TIMEOUT_SECONDS
+    that includes its time in the queue. stats() reports the queueing metrics.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.slots = None
+        self.lock = threading.Lock()
+        self.metrics = {
+            'calls': 0,
+            'completed': 0,
+            'failed': 0,
+            'timed_out': 0,
+            'rejected': 0,
+            'in_flight': 0,
+            'waiting': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'total_call_ms': 0.0
+        }
+
+    def generate(self, prompt, timeout=None):
+        # Returns the model's text for prompt, within timeout seconds (default AI_TIMEOUT_SECONDS)
+        deadline = self._acquire(timeout)
+        started = time.monotonic()
+        try:
+            text = self.backend.generate(prompt, max(deadline - started, 0.001))
+        except AIGatewayTimeout:
+            self._finish(started, 'timed_out')
+            raise
+        except Exception:
+            self._finish(started, 'failed')
+            raise
+        self._finish(started, 'completed')
+        return text
+
+    def stream(self, prompt, timeout=None):
+        """
+        Yields the model's text in chunks as it is generated. The concurrency slot is
+        held until the generator is exhausted or closed.
+        """
+        deadline = self._acquire(timeout)
+        started = time.monotonic()
+        outcome = 'failed'
+        try:
+            for chunk in self.backend.stream(prompt, max(deadline - started, 0.001)):
+                yield chunk
+            outcome = 'completed'
+        except GeneratorExit:
+            # The client went away; the call itself did not fail
+            outcome = 'completed'
+            raise
+        except AIGatewayTimeout:
+            outcome = 'timed_out'
+            raise
+        finally:
+            self._finish(started, outcome)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+        waited = stats['calls'] - stats['rejected']
+        stats['avg_wait_ms'] = round(stats['total_wait_ms'] / waited, 1) if waited else 0.0
+        finished = stats['completed'] + stats['failed'] + stats['timed_out']
+        stats['avg_call_ms'] = round(stats['total_call_ms'] / finished, 1) if finished else 0.0
+        for key in ('total_wait_ms', 'max_wait_ms', 'total_call_ms'):
+            stats[key] = round(stats[key], 1)
+        stats['max_concurrency'] = current_app.config['AI_MAX_CONCURRENCY']
+        stats['backend'] = current_app.config['AI_BACKEND']
+        return stats
+
+    def _acquire(self, timeout):
+        # Waits for a concurrency slot and returns the call's absolute deadline
+        self._ensure_configured()
+        config = current_app.config
+        queued_at = time.monotonic()
+        deadline = queued_at + (timeout or config['AI_TIMEOUT_SECONDS'])
+        with self.lock:
+            self.metrics['calls'] += 1
+            self.metrics['waiting'] += 1
+
+        acquired = self.slots.acquire(timeout=min(config['AI_QUEUE_TIMEOUT_SECONDS'], deadline - queued_at))
+        waited_ms = (time.monotonic() - queued_at) * 1000
+        with self.lock:
+            self.metrics['waiting'] -= 1
+            if not acquired:
+                self.metrics['rejected'] += 1
+            else:
+                self.metrics['in_flight'] += 1
+                self.metrics['total_wait_ms'] += waited_ms
+                self.metrics['max_wait_ms'] = max(self.metrics['max_wait_ms'], waited_ms)
+        if not acquired:
+            raise AIGatewayBusy("The AI service is busy, please retry shortly.")
+        return deadline
+
+    def _finish(self, started, outcome):
+        self.slots.release()
+        with self.lock:
+            self.metrics['in_flight'] -= 1
+            self.metrics[outcome] += 1
+            self.metrics['total_call_ms'] += (time.monotonic() - started) * 1000
+
+    def _ensure_configured(self):
+        if self.backend is not None:
+            return
+        with self.lock:
+            if self.backend is not None:
+                return
+            config = current_app.config
+            if config['AI_BACKEND'] == 'fake':
+                backend = FakeBackend(config['AI_FAKE_LATENCY_MS'])
+            elif config['AI_BACKEND'] == 'gemini':
+                backend = GeminiBackend(config['GOOGLE_GEMINI_API_KEY'], config['AI_MODEL'])
+            else:
+                raise ValueError(f"Unknown AI_BACKEND '{config['AI_BACKEND']}'. Use 'gemini' or 'fake'.")
+            self.slots = threading.BoundedSemaphore(config['AI_MAX_CONCURRENCY'])
+            self.backend = backend
+
+
+ai_gateway = AIGateway()
@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+import jwt
+from flask import g, request, jsonify, current_app
+from utils.identity import Identity, resolve_user, seed_identity
+
+# How often an unknown key id may trigger a re-read of JWT_KEYS_FILE
+KEY_RELOAD_INTERVAL_SECONDS = 60
+
+# Endpoints reachable without a token even when AUTH_REQUIRED is set
+PUBLIC_ENDPOINTS = {'hello', 'static', 'flasgger.apidocs', 'flasgger.apispec_1', 'flasgger.static', 'flasgger.oauth_redirect', 'flasgger.<lambda>'}
+
+# Administrators and trusted back-end callers (e.g. the Clerk user sync)
+STAFF_ROLES = ('ADMIN', 'SERVICE')
+
+
+class KeyStore:
+    """
+    Verification keys held in memory so tokens are checked without any network
+    call. Keys come from JWT_KEYS_FILE (a JWKS document such as Clerk's, or a
+    single PEM public key), JWT_PUBLIC_KEY (PEM) and JWT_SECRET (HS256 shared
+    secret). The file is re-read when a token names a key id we do not have,
+    at most once every KEY_RELOAD_INTERVAL_SECONDS, so key rotation needs no restart.
+    """
+
+    def __init__(self, app):
+        self.keys_file = app.config['JWT_KEYS_FILE']
+        self.public_key = app.config['JWT_PUBLIC_KEY']
+        self.secret = app.config['JWT_SECRET']
+        self.logger = app.logger
+        self.by_kid = {}
+        self.default_keys = []
+        self.loaded_at = 0
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        by_kid, default_keys = {}, []
+        if self.keys_file:
+            try:
+                with open(self.keys_file) as keys_file:
+                    content = keys_file.read()
+                if content.lstrip().startswith('{'):
+                    for jwk in json.loads(content).get('keys', []):
+                        key = jwt.PyJWK(jwk)
+                        if jwk.get('kid'):
+                            by_kid[jwk['kid']] = (key.key, [key.algorithm_name])
+                        else:
+                            default_keys.append((key.key, [key.algorithm_name]))
+                else:
+                    default_keys.append((content, ['RS256', 'ES256']))
+            except (OSError, ValueError, jwt.PyJWKError) as e:
+                self.logger.warning("Could not load JWT keys from %s: %s", self.keys_file, e)
+        if self.public_key:
+            default_keys.append((self.public_key, ['RS256', 'ES256']))
+        if self.secret:
+            default_keys.append((self.secret, ['HS256']))
+
+        with self.lock:
+            self.by_kid, self.default_keys = by_kid, default_keys
+            self.loaded_at = time.monotonic()
+
+    def candidates(self, kid):
+        # The key named by the token's kid, otherwise every key without a kid
+        if kid and kid not in self.by_kid and self.keys_file and time.monotonic() - self.loaded_at > KEY_RELOAD_INTERVAL_SECONDS:
+            self.load()
+        if kid and kid in self.by_kid:
+            return [self.by_kid[kid]]
+        return self.default_keys
+
+
+def verify_token(key_store, token, app):
+    """
+    Verifies the token's signature, expiry and (when configured) issuer and
+    audience, and returns the Identity it carries. Raises jwt.InvalidTokenError.
+    """
+    header = jwt.get_unverified_header(token)
+    options = {
+        'issuer': app.config['JWT_ISSUER'],
+        'audience': app.config['JWT_AUDIENCE'],
+        'leeway': app.config['JWT_LEEWAY_SECONDS'],
+        'options': {'require': ['exp', 'sub'], 'verify_aud': bool(app.config['JWT_AUDIENCE'])}
+    }
+
+    error = jwt.InvalidTokenError("No verification key configured")
+    # Only keys for the token's algorithm; a PEM key listed for RS256 and ES256 can still be the wrong type
+    candidates = [(key, algorithms) for key, algorithms in key_store.candidates(header.get('kid')) if header.get('alg') in algorithms]
+    for key, algorithms in candidates:
+        try:
+            claims = jwt.decode(token, key, algorithms=[header['alg']], **options)
+            break
+        except (jwt.InvalidSignatureError, jwt.InvalidAlgorithmError) as e:
+            error = e
+        except jwt.InvalidKeyError as e:
+            error = jwt.InvalidTokenError(f"Token does not fit the verification key: {e}")
+    else:
+        raise error
+
+    # The role lives in a custom session claim, e.g. 'role' or 'metadata.role'
+    role = claims
+    for part in app.config['JWT_ROLE_CLAIM'].split('.'):
+        role = role.get(part) if isinstance(role, dict) else None
+    return Identity(claims['sub'], role.upper() if isinstance(role, str) else None)
+
+
+def init_auth(app):
+    """
+    Registers a before_request hook that verifies 'Authorization: Bearer <token>'
+    and puts the caller's Identity (clerkid from 'sub', role from JWT_ROLE_CLAIM,
+    else the stored role) in g.identity, for authorize() to check. Tokens for a
+    clerkid with no User row get an identity without a role, which authorize()
+    always refuses. Requests without a token are let through unless AUTH_REQUIRED
+    is set; invalid tokens always get a 401.
+    """
+    key_store = KeyStore(app)
+
+    @app.before_request
+    def authenticate():
+        g.identity = None
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            if app.config['AUTH_REQUIRED'] and request.endpoint not in PUBLIC_ENDPOINTS and request.method != 'OPTIONS':
+                return jsonify({"error": "Authentication required"}), 401
+            return None
+
+        try:
+            identity = verify_token(key_store, header[len('Bearer '):].strip(), app)
+        except jwt.InvalidTokenError as e:
+            return jsonify({"error": f"Invalid token: {e}"}), 401
+
+        # Only callers with a User row get a role; tokens without a role claim fall back to the stored one
+        user = resolve_user(identity.clerkid)
+        if user is None:
+            g.identity = Identity(identity.clerkid, None)
+            return None
+        g.identity = Identity(identity.clerkid, identity.role or user.role)
+        seed_identity(g.identity)
+        return None
+
+    return key_store
+
+
+def authorize(clerkid=None, roles=None, required=False):
+    """
+    Checks the verified caller in g.identity against the acting party of a
+    request: its clerkid must be clerkid and its role one of roles, for whichever
+    of the two are given. Returns None when allowed, otherwise the error response
+    to return. Requests without a token pass unless AUTH_REQUIRED (or required)
+    is set, so deployments that have not switched tokens on keep working.
+    """
+    identity = g.get('identity')
+    if identity is None:
+        if required or current_app.config['AUTH_REQUIRED']:
+            return jsonify({"error": "Authentication required"}), 401
+        return None
+    if identity.role is None or (clerkid is not None and identity.clerkid != clerkid) or (roles is not None and identity.role not in roles):
+        return jsonify({"error": "Not allowed to act for this user"}), 403
+    return None
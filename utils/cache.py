@@ -0,0 +1,267 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import select, update, insert, func, or_, event
+from sqlalchemy.exc import IntegrityError
+from config import db
+from models import CacheVersion, CacheInvalidation
+
+_snapshots = {}
+_caches = {}
+_MISSING = object()
+
+# Most uncommitted cache_invalidations ids the listener waits for at once
+INVALIDATION_MAX_GAPS = 1000
+
+
+def bump_version(name):
+    """
+    Increments the version counter for a cached dataset inside the current
+    transaction, so the bump becomes visible exactly when the write it describes
+    commits, and returns the new version. The caller commits.
+    """
+    bump = (
+        update(CacheVersion)
+        .where(CacheVersion.name == name)
+        .values(version=CacheVersion.version + 1)
+        .returning(CacheVersion.version)
+    )
+    version = db.session.execute(bump).scalar()
+    if version is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(CacheVersion(name=name, version=1))
+            version = 1
+        except IntegrityError:
+            # Another writer created the row first
+            version = db.session.execute(bump).scalar()
+
+    # This process sees its own writes on the next read instead of after the check interval
+    snapshot = _snapshots.get(name)
+    if snapshot is not None:
+        snapshot.next_check = 0
+    return version
+
+
+def read_version(name):
+    return db.session.execute(select(CacheVersion.version).where(CacheVersion.name == name)).scalar() or 0
+
+
+class VersionedSnapshot:
+    """
+    An in-process, read-only copy of a dataset built by build(). Readers get the
+    current snapshot from memory; at most once every CACHE_VERSION_CHECK_SECONDS a
+    reader compares the dataset's version counter (one primary-key read) and
+    rebuilds the snapshot only if it changed, through refresh(previous, version)
+    when given so only the rows written since that version are reloaded. Snapshots
+    are replaced, never mutated, so readers need no lock.
+    """
+
+    def __init__(self, name, build, refresh=None):
+        self.name = name
+        self.build = build
+        self.refresh = refresh
+        self.value = None
+        self.version = None
+        self.next_check = 0
+        self.lock = threading.Lock()
+        _snapshots[name] = self
+
+    def get(self):
+        value = self.value
+        if value is not None and time.monotonic() < self.next_check:
+            return value
+
+        with self.lock:
+            if self.value is not None and time.monotonic() < self.next_check:
+                return self.value
+            # Read the version before building so a write that lands mid-build triggers another rebuild
+            version = read_version(self.name)
+            if self.value is None:
+                self.value = self.build()
+            elif version != self.version:
+                self.value = self.refresh(self.value, self.version) if self.refresh else self.build()
+            self.version = version
+            self.next_check = time.monotonic() + current_app.config['CACHE_VERSION_CHECK_SECONDS']
+            return self.value
+
+
+class TTLCache:
+    """
+    Bounded LRU mapping whose entries also expire ttl seconds after being stored.
+    Safe to share between request threads.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class ReadThroughCache:
+    """
+    Per-process TTLCache in front of a loader, sized by CACHE_MAX_ENTRIES and
+    CACHE_TTL_SECONDS. get() only calls the loader on a miss; a loader result of
+    None (not found) is not cached. invalidate() evicts the key here and logs it to
+    cache_invalidations in the caller's transaction, and every worker's
+    invalidation_listener evicts it within CACHE_INVALIDATION_POLL_SECONDS of the
+    commit, so hits never query the database.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.entries = None
+        self.lock = threading.Lock()
+        _caches[name] = self
+
+    def get(self, key, load):
+        value = self.peek(key, _MISSING)
+        if value is _MISSING:
+            value = load()
+            self.put(key, value)
+        return value
+
+    def peek(self, key, default=None):
+        # Cached value or default, without loading
+        if self.entries is None:
+            self._configure()
+        invalidation_listener.ensure_started()
+        return self.entries.get(key, default)
+
+    def put(self, key, value):
+        if value is not None:
+            self.entries.set(key, value)
+
+    def invalidate(self, key):
+        # The caller commits; the row makes the other workers drop their copy too
+        db.session.add(CacheInvalidation(cache=self.name, key=key))
+        self.evict(key)
+        _evict_after_commit(self, [key])
+
+    def invalidate_many(self, keys):
+        # Same as invalidate() for a batch of keys, with one multi-row INSERT
+        keys = list(keys)
+        if keys:
+            db.session.execute(insert(CacheInvalidation), [{'cache': self.name, 'key': key} for key in keys])
+        for key in keys:
+            self.evict(key)
+        _evict_after_commit(self, keys)
+
+    def evict(self, key):
+        if self.entries is not None:
+            self.entries.pop(key)
+
+    def _configure(self):
+        with self.lock:
+            if self.entries is None:
+                self.entries = TTLCache(current_app.config['CACHE_MAX_ENTRIES'], current_app.config['CACHE_TTL_SECONDS'])
+
+
+def _evict_after_commit(cache, keys):
+    # Until the caller commits, another request can still load the old row and cache it again
+    db.session.info.setdefault('evict_after_commit', []).append((cache, keys))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _evict_committed(session):
+    for cache, keys in session.info.pop('evict_after_commit', ()):
+        for key in keys:
+            cache.evict(key)
+
+
+class InvalidationListener:
+    """
+    Per-process thread tailing cache_invalidations every CACHE_INVALIDATION_POLL_SECONDS
+    and evicting the logged keys from the local ReadThroughCaches. Ids are allocated
+    before commit, so ids skipped over are kept as gaps and re-read on every poll for
+    CACHE_INVALIDATION_GAP_SECONDS, in case their transaction commits late.
+    """
+
+    def __init__(self):
+        self.thread = None
+        self.head = None
+        self.gaps = {}          # id below head not read yet -> when it was first missed
+        self.app = None
+        self.lock = threading.Lock()
+
+    def ensure_started(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.app = current_app._get_current_object()
+            self.head = db.session.execute(select(func.max(CacheInvalidation.id))).scalar() or 0
+            # Ids just below the starting head may belong to transactions still in flight
+            window_start = max(self.head - INVALIDATION_MAX_GAPS, 0)
+            present = set(db.session.execute(select(CacheInvalidation.id).where(CacheInvalidation.id > window_start)).scalars())
+            now = time.monotonic()
+            self.gaps = {row_id: now for row_id in range(window_start + 1, self.head) if row_id not in present}
+            self.thread = threading.Thread(target=self._run, name='cache-invalidation-listener', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        poll_interval = self.app.config['CACHE_INVALIDATION_POLL_SECONDS']
+        gap_seconds = self.app.config['CACHE_INVALIDATION_GAP_SECONDS']
+        while True:
+            time.sleep(poll_interval)
+            pending = CacheInvalidation.id > self.head
+            if self.gaps:
+                pending = or_(pending, CacheInvalidation.id.in_(list(self.gaps)))
+            try:
+                with self.app.app_context():
+                    rows = db.session.execute(
+                        select(CacheInvalidation.id, CacheInvalidation.cache, CacheInvalidation.key)
+                        .where(pending)
+                        .order_by(CacheInvalidation.id)
+                    ).all()
+            except Exception as e:
+                self.app.logger.warning("Cache invalidation poll failed: %s", e)
+                continue
+
+            now = time.monotonic()
+            for row in rows:
+                cache = _caches.get(row.cache)
+                if cache is not None:
+                    cache.evict(row.key)
+                if row.id > self.head:
+                    self.gaps.update((missing, now) for missing in range(max(self.head + 1, row.id - INVALIDATION_MAX_GAPS), row.id))
+                    self.head = row.id
+                else:
+                    self.gaps.pop(row.id, None)
+            self.gaps = {gap: missed_at for gap, missed_at in self.gaps.items() if now - missed_at <= gap_seconds}
+            if len(self.gaps) > INVALIDATION_MAX_GAPS:
+                for gap in sorted(self.gaps)[:len(self.gaps) - INVALIDATION_MAX_GAPS]:
+                    del self.gaps[gap]
+
+
+invalidation_listener = InvalidationListener()
@@ -4,31 +4,31 @@ from PyPDF2 import PdfReader
 from PIL import Image
 import pytesseract
 from tempfile import NamedTemporaryFile
+from utils.text_chunks import PAGE_BREAK
 
-def handle_file_upload(file):
+def extract_text(data, file_extension):
     # Save the file to a temporary location
     temp_file = NamedTemporaryFile(delete=False)
-    temp_file.write(file.read())
+    temp_file.write(data)
     temp_file.close()
 
     file_path = temp_file.name
-    file_extension = file.filename.split('.')[-1].lower()
-
-    # Extract text based on file type (PDF or Image)
-    if file_extension == 'pdf':
-        return extract_text_from_pdf(file_path)
-    elif file_extension in ['jpg', 'jpeg', 'png']:
-        return extract_text_from_image(file_path)
-    else:
-        return "Unsupported file format"
+    try:
+        # Extract text based on file type (PDF or Image)
+        if file_extension == 'pdf':
+            return extract_text_from_pdf(file_path)
+        elif file_extension in ['jpg', 'jpeg', 'png']:
+            return extract_text_from_image(file_path)
+        else:
+            return "Unsupported file format"
+    finally:
+        os.remove(file_path)
 
 def extract_text_from_pdf(file_path):
-    text = ""
+    # Pages are separated by form feeds so long reports can be chunked on page boundaries (see utils/text_chunks.py)
     with open(file_path, 'rb') as f:
         reader = PdfReader(f)
-        for page in reader.pages:
-            text += page.extract_text()
-    return text
+        return PAGE_BREAK.join(page.extract_text() or '' for page in reader.pages)
 
 def extract_text_from_image(file_path):
     img = Image.open(file_path)
@@ -0,0 +1,121 @@
+import re
+from sqlalchemy import text, func, literal_column, table, column, cast, Float
+from config import db
+
+
+class PostgresFullText:
+    """
+    Postgres tsvector search backed by a GIN expression index. Postgres maintains the
+    index itself on every INSERT/UPDATE, so new rows are searchable as soon as they commit.
+    """
+    name = 'postgres'
+
+    def __init__(self, table_name, text_column, config='english'):
+        self.table_name = table_name
+        self.text_column = text_column
+        # Inlined rather than bound so the planner can match the expression index
+        self.config_sql = f"'{config}'::regconfig"
+        self.config = literal_column(self.config_sql)
+
+    def ensure(self):
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                f'CREATE INDEX IF NOT EXISTS ix_{self.table_name}_{self.text_column.name}_fts '
+                f'ON "{self.table_name}" USING GIN (to_tsvector({self.config_sql}, {self.text_column.name}))'
+            ))
+
+    def apply(self, query, q):
+        # Returns (query, rank, snippet): query filtered to matches, higher rank is better
+        vector = func.to_tsvector(self.config, self.text_column)
+        tsquery = func.websearch_to_tsquery(self.config, q)
+        rank = func.ts_rank(vector, tsquery)
+        snippet = func.ts_headline(self.config, self.text_column, tsquery, 'MaxFragments=1, MinWords=5, MaxWords=20')
+        return query.filter(vector.op('@@')(tsquery)), rank, snippet
+
+
+class SQLiteFullText:
+    """
+    SQLite FTS5 external-content table kept in sync by triggers, so every INSERT,
+    UPDATE and DELETE on the source table updates the index incrementally.
+    """
+    name = 'sqlite'
+
+    def __init__(self, table_name, text_column, id_column):
+        self.table_name = table_name
+        self.text_column = text_column
+        self.id_column = id_column
+        self.fts_name = f'{table_name}_fts'
+        self.fts = table(self.fts_name, column('rowid'), column(self.fts_name))
+
+    def ensure(self):
+        fts, source, text_name, id_name = self.fts_name, self.table_name, self.text_column.name, self.id_column.name
+        with db.engine.begin() as connection:
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': fts}
+            ).first()
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({text_name}, content='{source}', content_rowid='{id_name}')"
+            ))
+            connection.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} BEGIN "
+                f"INSERT INTO {fts}(rowid, {text_name}) VALUES (new.{id_name}, new.{text_name}); END"
+            ))
+            connection.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {text_name}) VALUES ('delete', old.{id_name}, old.{text_name}); END"
+            ))
+            connection.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {source} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {text_name}) VALUES ('delete', old.{id_name}, old.{text_name}); "
+                f"INSERT INTO {fts}(rowid, {text_name}) VALUES (new.{id_name}, new.{text_name}); END"
+            ))
+            if not exists:
+                # Index the rows written before the search table existed
+                connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+    def apply(self, query, q):
+        # Every word must match; words are quoted so FTS5 operators in user input are taken literally
+        match = ' '.join('"' + word.replace('"', '""') + '"' for word in q.split())
+        fts_column = literal_column(self.fts_name)
+        rank = -func.bm25(fts_column)
+        snippet = func.snippet(fts_column, 0, '<b>', '</b>', '…', 20)
+        query = query.join(self.fts, self.fts.c.rowid == self.id_column).filter(self.fts.c[self.fts_name].op('MATCH')(match))
+        return query, rank, snippet
+
+
+class LikeFullText:
+    """
+    Fallback for databases without a supported full-text engine: unranked substring
+    matching. Only meant for development setups.
+    """
+    name = 'like'
+
+    def __init__(self, text_column):
+        self.text_column = text_column
+
+    def ensure(self):
+        pass
+
+    def apply(self, query, q):
+        conditions = [self.text_column.ilike(f"%{word}%") for word in q.split()]
+        # A bare 0 in ORDER BY would be read as a column position
+        return query.filter(*conditions), cast(literal_column('0'), Float), func.substr(self.text_column, 1, 200)
+
+
+def fulltext_backend(model, text_attribute, backend=None):
+    """
+    Picks the full-text backend for model.text_attribute from FULLTEXT_BACKEND
+    ('postgres', 'sqlite' or 'like'), defaulting to the one matching the database.
+    """
+    backend = backend or db.engine.dialect.name
+    text_column = getattr(model, text_attribute)
+    if backend in ('postgres', 'postgresql'):
+        return PostgresFullText(model.__tablename__, text_column)
+    if backend == 'sqlite':
+        return SQLiteFullText(model.__tablename__, text_column, model.id)
+    return LikeFullText(text_column)
+
+
+def normalize_query(q):
+    # Collapses whitespace and drops characters that carry no meaning for any backend
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s\-\'.]', ' ', q or '')).strip()
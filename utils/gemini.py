@@ -1,26 +1,73 @@
-import os
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from config import db
+from utils.ai_gateway import ai_gateway
+from utils.text_chunks import chunk_report_text, estimate_tokens
 
-def summarize_text(text):
-    # Load the API key from the environment variable
-    api_key = os.getenv("GOOGLE_GEMINI_API_KEY")
-    if not api_key:
-        raise EnvironmentError("GOOGLE_GEMINI_API_KEY is not set in the environment variables.")
+# Both helpers go through the process-wide AI gateway, which owns the configured
+# Gemini client, the per-call deadline and the concurrency limit
 
-    # Configure the Generative AI library with the API key
-    genai.configure(api_key=api_key)
+# Bump SUMMARY_PROMPT_VERSION whenever SUMMARY_PROMPT, SUMMARY_CHUNK_PROMPT or
+# SUMMARY_MERGE_PROMPT changes, so cached summaries made with the old prompts are
+# no longer served (see utils/summary_cache.py)
+SUMMARY_PROMPT = "Analyze the following text:\n\n{text}"
+SUMMARY_CHUNK_PROMPT = (
+    "The following is part {index} of {count} of one medical report. Analyze this part, keeping every diagnosis, "
+    "test result with its value and unit, medication with its dose, and follow-up instruction:\n\n{text}"
+)
+SUMMARY_MERGE_PROMPT = (
+    "The following are analyses of consecutive parts of one medical report, in order. Merge them into a single "
+    "analysis of the whole report, without repeating findings and without mentioning the parts:\n\n{text}"
+)
+SUMMARY_PROMPT_VERSION = 1
 
-    try:
-        # Instantiate the model
-        model = genai.GenerativeModel("gemini-1.5-flash")  # Use the correct model as per your documentation
-        # Generate a summary for the text
-        response = model.generate_content(f"Analyze the following text:\n\n{text}")
+# Separates partial analyses in a merge prompt
+PARTS_SEPARATOR = "\n\n---\n\n"
+
+# Same contract for routines, see utils/routine_cache.py
+ROUTINE_PROMPT = "generate me a 30 days plan for {goal} in md format without any extra description. only answer the question if the goal is health or wellness related because this is for a hospital website, if its not health related then return that the goal is not health related."
+ROUTINE_PROMPT_VERSION = 1
+
+
+def summarize_text(text, cache=None):
+    """
+    Summarizes/analyzes extracted report text. Text longer than SUMMARY_CHUNK_TOKENS
+    is split on page and section boundaries, the chunks are analyzed concurrently
+    (see _map_concurrency) and the partial analyses are merged, so latency follows
+    the slowest chunk rather than the report's length.
+
+    :param text: The text extracted from the uploaded report.
+    :param cache: Optional SummaryCache. Every partial analysis and group merge is
+                  stored in it as soon as it is done, so retrying a report that
+                  failed halfway only redoes the calls that did not finish.
+    :return: The model's analysis.
+    """
+    max_tokens = current_app.config['SUMMARY_CHUNK_TOKENS']
+    if estimate_tokens(text) <= max_tokens:
+        return ai_gateway.generate(SUMMARY_PROMPT.format(text=text))
+
+    chunks = chunk_report_text(text, max_tokens)
+    if len(chunks) == 1:
+        return ai_gateway.generate(SUMMARY_PROMPT.format(text=chunks[0]))
+
+    partials = _generate_all([
+        SUMMARY_CHUNK_PROMPT.format(index=index, count=len(chunks), text=chunk)
+        for index, chunk in enumerate(chunks, start=1)
+    ], cache=cache)
 
-        # Extract and return the summarized text
-        return response.text
-    except Exception as e:
-        print(f"Error during text summarization: {e}")
-        raise
+    # Partial analyses that together overflow the budget are merged in groups first
+    while len(partials) > 1 and estimate_tokens(PARTS_SEPARATOR.join(partials)) > max_tokens:
+        groups = _group_partials(partials, max_tokens)
+        if len(groups) == len(partials):
+            break
+        partials = _generate_all([
+            SUMMARY_MERGE_PROMPT.format(text=PARTS_SEPARATOR.join(group)) if len(group) > 1 else None
+            for group in groups
+        ], passthrough=[group[0] for group in groups], cache=cache)
+
+    if len(partials) == 1:
+        return partials[0]
+    return ai_gateway.generate(SUMMARY_MERGE_PROMPT.format(text=PARTS_SEPARATOR.join(partials)))
 
 
 def routine_generator(query):
@@ -30,22 +77,49 @@ def routine_generator(query):
     :param query: The query for routine generation.
     :return: The generated routine.
     """
-    # Load the API key from the environment variable
-    api_key = os.getenv("GOOGLE_GEMINI_API_KEY")
-    if not api_key:
-        raise EnvironmentError("GOOGLE_GEMINI_API_KEY is not set in the environment variables.")
+    return ai_gateway.generate(query)
+
+
+def _map_concurrency(config):
+    # All report workers of a process share the gateway's slots, so each report gets an equal share
+    share = config['AI_MAX_CONCURRENCY'] // max(config['REPORT_WORKER_THREADS'], 1)
+    return max(1, min(config['SUMMARY_MAP_CONCURRENCY'], share))
 
-    # Configure the Generative AI library with the API key
-    genai.configure(api_key=api_key)
 
+def _generate_all(prompts, passthrough=None, cache=None):
+    """
+    Runs the prompts through the gateway in parallel, in order, each with its own
+    app context. A None prompt returns the matching passthrough value unchanged.
+    The first failure is raised and cancels the prompts not yet started; those
+    already running still finish and, with a cache, are kept for the retry.
+    """
+    app = current_app._get_current_object()
+
+    def generate(index):
+        if prompts[index] is None:
+            return passthrough[index]
+        with app.app_context():
+            if cache is None:
+                return ai_gateway.generate(prompts[index])
+            text = cache.get_part(prompts[index])
+            if text is None:
+                text = ai_gateway.generate(prompts[index])
+                cache.put_part(prompts[index], text)
+            db.session.commit()
+            return text
+
+    executor = ThreadPoolExecutor(max_workers=_map_concurrency(app.config), thread_name_prefix='summary-map')
     try:
-        # Instantiate the model
-        model = genai.GenerativeModel("gemini-1.5-flash")  # Adjust model name as per documentation
-        # Generate routine content
-        response = model.generate_content(query)
-
-        # Return the generated content
-        return response.text
-    except Exception as e:
-        print(f"Error during routine generation: {e}")
-        raise
+        return list(executor.map(generate, range(len(prompts))))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _group_partials(partials, max_tokens):
+    # Consecutive partials packed into groups whose merge prompt fits the budget
+    groups = [[]]
+    for partial in partials:
+        if groups[-1] and estimate_tokens(PARTS_SEPARATOR.join(groups[-1] + [partial])) > max_tokens:
+            groups.append([])
+        groups[-1].append(partial)
+    return groups
@@ -0,0 +1,71 @@
+from collections import namedtuple
+from flask import g
+from sqlalchemy import select
+from config import db
+from models import User
+from utils.cache import ReadThroughCache
+
+# The part of a User row most endpoints need: who it is and what role it has
+Identity = namedtuple('Identity', ['clerkid', 'role'])
+
+identities = ReadThroughCache('identity')
+
+
+def _request_identities():
+    if 'identities' not in g:
+        g.identities = {}
+    return g.identities
+
+
+def resolve_user(clerkid):
+    """
+    Returns the Identity for clerkid, or None if no such user exists. Looked up in
+    the current request first, then in the process-wide identity cache, and only
+    then in the database.
+    """
+    return resolve_users([clerkid]).get(clerkid)
+
+
+def resolve_users(clerkids):
+    """
+    Returns {clerkid: Identity} for the given clerkids that exist, loading every
+    one missing from both caches with a single IN query. Unknown clerkids are left
+    out and never cached, so a user created later is found immediately.
+    """
+    request_cache = _request_identities()
+    found = {}
+    missing = set()
+    for clerkid in clerkids:
+        identity = request_cache.get(clerkid) or identities.peek(clerkid)
+        if identity is None:
+            missing.add(clerkid)
+        else:
+            found[clerkid] = identity
+
+    if missing:
+        rows = db.session.execute(select(User.clerkid, User.role).where(User.clerkid.in_(missing))).all()
+        for row in rows:
+            identity = Identity(row.clerkid, row.role)
+            identities.put(row.clerkid, identity)
+            found[row.clerkid] = identity
+
+    request_cache.update(found)
+    return found
+
+
+def seed_identity(identity):
+    # Makes an identity already proven for this request (e.g. by a verified token) resolvable without the database
+    _request_identities()[identity.clerkid] = identity
+
+
+def invalidate_identity(clerkid):
+    # Drops the cached identity in this request and, once the caller commits, in every worker
+    _request_identities().pop(clerkid, None)
+    identities.invalidate(clerkid)
+
+
+def invalidate_identities(clerkids):
+    request_cache = _request_identities()
+    for clerkid in clerkids:
+        request_cache.pop(clerkid, None)
+    identities.invalidate_many(clerkids)
@@ -0,0 +1,77 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(*values):
+    """
+    Encodes the sort key of the last row of a page into an opaque cursor string.
+    Datetimes are stored as ISO strings and restored by decode_cursor.
+    """
+    payload = [{'dt': v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor produced by encode_cursor back into a tuple of sort key values.
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, list):
+            raise ValueError
+        return tuple(datetime.fromisoformat(v['dt']) if isinstance(v, dict) else v for v in payload)
+    except (ValueError, TypeError, KeyError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    # Clamp the requested page size to [1, maximum]
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid limit")
+    return max(1, min(limit, maximum))
+
+
+def to_naive_local(value):
+    # Stored datetimes are naive server-local time; aware inputs are converted to it so they compare
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def parse_iso_datetime(value):
+    # datetime.fromisoformat that also accepts offsets ('...+00:00', '...Z'); raises TypeError/ValueError like it
+    return to_naive_local(datetime.fromisoformat(value))
+
+
+def parse_datetime(value, name):
+    # Parses an optional ISO date/datetime query parameter
+    if not value:
+        return None
+    try:
+        return parse_iso_datetime(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} date format. Use ISO 8601.")
+
+
+def keyset_after(columns, values, descending=False):
+    """
+    Builds the WHERE clause that selects rows strictly after the given sort key,
+    e.g. (date > d) OR (date = d AND id > i) for an ascending (date, id) ordering.
+    """
+    clauses = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        equal = [c == v for c, v in zip(columns[:i], values[:i])]
+        clauses.append(and_(*equal, column < value if descending else column > value))
+    return or_(*clauses)
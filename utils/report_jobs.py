@@ -0,0 +1,257 @@
+import atexit
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, or_, and_
+from config import db
+from models import ReportJob, TextReport
+from utils.ai_gateway import AIGatewayBusy
+from utils.file_upload import extract_text
+from utils.gemini import summarize_text
+from utils.summary_cache import summary_cache, file_key, text_key
+
+# Base of the backoff after the AI gateway turned a job away; shorter than for failures, the gateway frees up soon
+BUSY_RETRY_SECONDS = 5
+
+# Base of the exponential backoff between failed attempts
+RETRY_BACKOFF_SECONDS = 10
+
+
+def init_report_workers(app):
+    """
+    Starts the report worker pool according to REPORT_WORKER_MODE:
+      - 'embedded' (default) every process runs REPORT_WORKER_THREADS worker threads
+                   next to its request threads
+      - 'off'      this process only enqueues, e.g. web workers when worker.py
+                   runs the pool as a separate process
+    Returns the ReportWorkerPool, or None when off.
+    """
+    mode = app.config['REPORT_WORKER_MODE']
+    if mode == 'off':
+        return None
+    if mode != 'embedded':
+        raise ValueError(f"Unknown REPORT_WORKER_MODE '{mode}'. Use 'embedded' or 'off'.")
+    pool = ReportWorkerPool(app)
+    pool.start()
+    return pool
+
+
+def enqueue_report_job(clerkid, file_url, file_extension, data):
+    # Added to the caller's transaction; workers see it once committed. Job times are all UTC
+    now = datetime.utcnow()
+    job = ReportJob(
+        id=str(uuid.uuid4()),
+        clerkid=clerkid,
+        file_url=file_url,
+        file_extension=file_extension,
+        data=data,
+        status='queued',
+        stage='queued',
+        available_at=now,
+        created_at=now
+    )
+    db.session.add(job)
+    return job
+
+
+def finished_report_job(clerkid, file_url, file_extension, text_report_id):
+    # Record of an upload that was answered straight from the summary cache
+    job = enqueue_report_job(clerkid, file_url, file_extension, None)
+    job.status = job.stage = 'done'
+    job.text_report_id = text_report_id
+    job.started_at = job.finished_at = job.created_at
+    return job
+
+
+def serialize_report_job(job, summarized_text=None):
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'stage': job.stage,
+        'attempts': job.attempts,
+        'error': job.error,
+        'report_id': job.text_report_id,
+        'summarized_text': summarized_text,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def prune_report_jobs(app):
+    # Finished jobs are only kept for status polling
+    cutoff = datetime.utcnow() - timedelta(days=app.config['REPORT_JOB_RETENTION_DAYS'])
+    result = db.session.execute(
+        delete(ReportJob).where(ReportJob.status.in_(('done', 'failed')), ReportJob.finished_at < cutoff)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+class ReportWorkerPool:
+    """
+    REPORT_WORKER_THREADS threads that claim queued report jobs and run text
+    extraction and summarization, so request threads never wait on OCR or the
+    model. A claim is a conditional UPDATE (queued -> running) and takes a lease
+    of REPORT_JOB_LEASE_SECONDS, renewed at every stage; jobs of a worker that
+    died are reclaimed once it runs out. Failures are retried with exponential
+    backoff up to REPORT_JOB_MAX_ATTEMPTS. Idle threads poll every
+    REPORT_WORKER_POLL_SECONDS, and wake() starts them at once for jobs enqueued
+    by this process.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease = timedelta(seconds=app.config['REPORT_JOB_LEASE_SECONDS'])
+        self.poll_interval = app.config['REPORT_WORKER_POLL_SECONDS']
+        self.max_attempts = app.config['REPORT_JOB_MAX_ATTEMPTS']
+        self.threads = [
+            threading.Thread(target=self._run, name=f'report-worker-{n}', daemon=True)
+            for n in range(app.config['REPORT_WORKER_THREADS'])
+        ]
+        self._wakeup = threading.Condition()
+        self._stopped = threading.Event()
+        atexit.register(self.stop)
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self.wake(all_threads=True)
+
+    def wake(self, all_threads=False):
+        with self._wakeup:
+            if all_threads:
+                self._wakeup.notify_all()
+            else:
+                self._wakeup.notify()
+
+    def is_alive(self):
+        return any(thread.is_alive() for thread in self.threads)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                with self.app.app_context():
+                    job = self._claim()
+                    if job is not None:
+                        self._process(job)
+            except Exception as e:
+                self.app.logger.warning("Report worker loop failed: %s", e)
+                job = None
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+
+    def _claim(self):
+        now = datetime.utcnow()
+        claimable = or_(
+            and_(ReportJob.status == 'queued', ReportJob.available_at <= now),
+            and_(ReportJob.status == 'running', ReportJob.locked_until < now)
+        )
+        next_job = (
+            select(ReportJob.id)
+            .where(claimable)
+            .order_by(ReportJob.available_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        job = db.session.execute(
+            update(ReportJob)
+            .where(ReportJob.id.in_(next_job), claimable)
+            .values(
+                status='running',
+                stage='extracting',
+                attempts=ReportJob.attempts + 1,
+                worker=self.owner,
+                locked_until=now + self.lease,
+                started_at=now
+            )
+            .returning(ReportJob.id, ReportJob.clerkid, ReportJob.file_url, ReportJob.file_extension, ReportJob.data, ReportJob.attempts)
+            .execution_options(synchronize_session=False)
+        ).first()
+        db.session.commit()
+        return job
+
+    def _owned(self, job):
+        return and_(ReportJob.id == job.id, ReportJob.status == 'running', ReportJob.worker == self.owner)
+
+    def _set_stage(self, job, stage):
+        # Committed on its own so pollers see progress; also renews the lease
+        db.session.execute(
+            update(ReportJob)
+            .where(self._owned(job))
+            .values(stage=stage, locked_until=datetime.utcnow() + self.lease)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _process(self, job):
+        if job.attempts > self.max_attempts:
+            # Only reachable by reclaiming: the job keeps taking its workers down with it
+            self._fail(job, "Worker lost the job too many times")
+            return
+        try:
+            upload_key = file_key(job.data)
+            summarized_text = summary_cache.get(upload_key)
+            if summarized_text is None:
+                text = extract_text(job.data, job.file_extension)
+                report_key = text_key(text)
+                summarized_text = summary_cache.get(report_key)
+                if summarized_text is None:
+                    self._set_stage(job, 'summarizing')
+                    summarized_text = summarize_text(text, cache=summary_cache)
+                    summary_cache.put(report_key, summarized_text)
+                summary_cache.put(upload_key, summarized_text)
+            self._finish(job, summarized_text)
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.warning("Report job %s attempt %d failed: %s", job.id, job.attempts, e)
+            # A gateway that stays busy counts against REPORT_JOB_MAX_ATTEMPTS like any failure
+            backoff = BUSY_RETRY_SECONDS if isinstance(e, AIGatewayBusy) else RETRY_BACKOFF_SECONDS
+            if job.attempts >= self.max_attempts:
+                self._fail(job, str(e))
+            else:
+                self._retry(job, str(e), backoff * 2 ** (job.attempts - 1))
+
+    def _finish(self, job, summarized_text):
+        text_report = TextReport(clerkid=job.clerkid, summarized_text=summarized_text, file_url=job.file_url)
+        db.session.add(text_report)
+        db.session.flush()
+        finished = db.session.execute(
+            update(ReportJob)
+            .where(self._owned(job))
+            .values(status='done', stage='done', data=None, error=None, locked_until=None,
+                    text_report_id=text_report.id, finished_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if finished:
+            db.session.commit()
+        else:
+            # Our lease ran out and another worker reclaimed the job; its result will be saved instead
+            db.session.rollback()
+
+    def _retry(self, job, error, delay):
+        db.session.execute(
+            update(ReportJob)
+            .where(self._owned(job))
+            .values(status='queued', stage='queued', error=error, worker=None, locked_until=None,
+                    available_at=datetime.utcnow() + timedelta(seconds=delay))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _fail(self, job, error):
+        db.session.execute(
+            update(ReportJob)
+            .where(self._owned(job))
+            .values(status='failed', stage='failed', error=error, data=None, locked_until=None,
+                    finished_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
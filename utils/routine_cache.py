@@ -0,0 +1,161 @@
+import re
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.exc import IntegrityError
+from config import db
+from models import RoutineCacheEntry
+from utils.cache import TTLCache
+from utils.gemini import ROUTINE_PROMPT, ROUTINE_PROMPT_VERSION, routine_generator
+
+# Filler words that do not change what plan is asked for. Negations and
+# quantities are deliberately absent: 'not', 'no', 'more', 'less' change the goal.
+GOAL_STOPWORDS = {
+    'a', 'an', 'the', 'i', 'im', 'me', 'my', 'we', 'our', 'you', 'your', 'to', 'want', 'wanna', 'would', 'like',
+    'need', 'please', 'plan', 'routine', 'help', 'how', 'can', 'do', 'some', 'for', 'of', 'and', 'with', 'in',
+    'on', 'get', 'getting', 'try', 'trying', 'be', 'am', 'is', 'so', 'that', 'just', 'really', 'also'
+}
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+CachedRoutine = namedtuple('CachedRoutine', ['routine', 'generated_at'])
+
+
+def canonical_goal(goal):
+    # 'I want to LOSE weight!!' and 'lose  weight.' both become 'lose weight'; word order is kept
+    words = _NON_WORD.sub(' ', (goal or '').lower()).split()
+    return ' '.join(word for word in words if word not in GOAL_STOPWORDS)
+
+
+def routine_key(goal):
+    # None when nothing meaningful is left, such goals are never cached
+    canonical = canonical_goal(goal)
+    return f"v{ROUTINE_PROMPT_VERSION}:{canonical}"[:255] if canonical else None
+
+
+class RoutineCache:
+    """
+    Generated routines shared by everyone asking for the same canonical goal: the
+    routine_cache table, with a per-process LRU of ROUTINE_CACHE_LOCAL_ENTRIES in
+    front. Rows are evicted by decayed popularity (hits, halved on every prune),
+    least recently used first among equals. Plans older than ROUTINE_CACHE_REFRESH_DAYS
+    are regenerated; with ROUTINE_CACHE_SERVE_STALE the old plan is returned at once
+    and this process refreshes it in the background.
+    """
+
+    def __init__(self):
+        self.entries = None
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+    def get(self, key, goal):
+        # Cached routine or None (missing, or stale and not to be served). Counts the hit in the caller's transaction
+        if key is None:
+            return None
+        if self.entries is None:
+            self._configure()
+
+        cached = self.entries.get(key)
+        if cached is None:
+            row = db.session.execute(
+                select(RoutineCacheEntry.routine, RoutineCacheEntry.generated_at).where(RoutineCacheEntry.key == key)
+            ).first()
+            if row is None:
+                return None
+            cached = CachedRoutine(row.routine, row.generated_at)
+            self.entries.set(key, cached)
+
+        if self._is_stale(cached):
+            if not current_app.config['ROUTINE_CACHE_SERVE_STALE']:
+                return None
+            self._refresh_in_background(key, goal)
+
+        db.session.execute(
+            update(RoutineCacheEntry)
+            .where(RoutineCacheEntry.key == key)
+            .values(hits=RoutineCacheEntry.hits + 1, last_used_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        return cached.routine
+
+    def put(self, key, goal, routine):
+        # Stored (or replaced, when it was stale) in the caller's transaction
+        if key is None:
+            return
+        if self.entries is None:
+            self._configure()
+        now = datetime.utcnow()
+        self.entries.set(key, CachedRoutine(routine, now))
+        replaced = db.session.execute(
+            update(RoutineCacheEntry)
+            .where(RoutineCacheEntry.key == key)
+            .values(goal=goal, routine=routine, generated_at=now, last_used_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not replaced:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(RoutineCacheEntry(key=key, goal=goal, routine=routine, generated_at=now, last_used_at=now))
+            except IntegrityError:
+                pass
+
+    def prune(self):
+        """
+        Drops rows unused for ROUTINE_CACHE_MAX_IDLE_DAYS, then the least popular rows
+        beyond ROUTINE_CACHE_MAX_ROWS, then halves every hit count so that a goal
+        popular months ago does not outrank this week's.
+        """
+        config = current_app.config
+        cutoff = datetime.utcnow() - timedelta(days=config['ROUTINE_CACHE_MAX_IDLE_DAYS'])
+        idle = db.session.execute(delete(RoutineCacheEntry).where(RoutineCacheEntry.last_used_at < cutoff)).rowcount
+
+        overflow = 0
+        excess = db.session.execute(select(func.count()).select_from(RoutineCacheEntry)).scalar() - config['ROUTINE_CACHE_MAX_ROWS']
+        if excess > 0:
+            least_popular = (
+                select(RoutineCacheEntry.key)
+                .order_by(RoutineCacheEntry.hits, RoutineCacheEntry.last_used_at)
+                .limit(excess)
+            )
+            overflow = db.session.execute(
+                delete(RoutineCacheEntry).where(RoutineCacheEntry.key.in_(least_popular.scalar_subquery()))
+            ).rowcount
+
+        db.session.execute(update(RoutineCacheEntry).where(RoutineCacheEntry.hits > 0).values(hits=RoutineCacheEntry.hits // 2))
+        db.session.commit()
+        return idle, overflow
+
+    def _is_stale(self, cached):
+        refresh_days = current_app.config['ROUTINE_CACHE_REFRESH_DAYS']
+        return bool(refresh_days) and cached.generated_at < datetime.utcnow() - timedelta(days=refresh_days)
+
+    def _refresh_in_background(self, key, goal):
+        # At most one refresh per key per process; other workers may refresh the same key, the last one wins
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+        app = current_app._get_current_object()
+        threading.Thread(target=self._refresh, args=(app, key, goal), name='routine-refresh', daemon=True).start()
+
+    def _refresh(self, app, key, goal):
+        try:
+            with app.app_context():
+                routine = routine_generator(ROUTINE_PROMPT.format(goal=goal))
+                self.put(key, goal, routine)
+                db.session.commit()
+        except Exception as e:
+            app.logger.warning("Background refresh of routine '%s' failed: %s", key, e)
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def _configure(self):
+        with self.lock:
+            if self.entries is None:
+                self.entries = TTLCache(current_app.config['ROUTINE_CACHE_LOCAL_ENTRIES'], current_app.config['CACHE_TTL_SECONDS'])
+
+
+routine_cache = RoutineCache()
@@ -0,0 +1,124 @@
+import atexit
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_
+from sqlalchemy.exc import IntegrityError
+from config import db
+from models import SchedulerLease
+
+LEADER_LEASE_NAME = 'scheduler-leader'
+
+
+def init_scheduler(app, scheduler):
+    """
+    Starts the APScheduler instance according to SCHEDULER_MODE:
+      - 'leader'   (default) every process starts the scheduler paused and only the
+                   process holding the scheduler-leader lease row resumes it
+      - 'embedded' every process runs the jobs (the old behaviour, single-worker only)
+      - 'off'      no scheduler in this process, e.g. web workers when worker.py
+                   runs the jobs as a separate process
+    Returns the LeaderElector in leader mode, otherwise None.
+    """
+    mode = app.config['SCHEDULER_MODE']
+    if mode == 'off':
+        return None
+    if mode not in ('leader', 'embedded'):
+        raise ValueError(f"Unknown SCHEDULER_MODE '{mode}'. Use 'leader', 'embedded' or 'off'.")
+
+    scheduler.init_app(app)
+    if mode == 'embedded':
+        scheduler.start()
+        return None
+
+    scheduler.start(paused=True)
+    elector = LeaderElector(app, scheduler)
+    elector.start()
+    return elector
+
+
+class LeaderElector(threading.Thread):
+    """
+    Keeps a time-limited lease on the scheduler_leases row. The holder renews it
+    every SCHEDULER_RENEW_SECONDS; if the leader dies the lease runs out after
+    SCHEDULER_LEASE_SECONDS and the next process to poll takes over.
+    """
+
+    def __init__(self, app, scheduler):
+        super().__init__(name='scheduler-leader-elector', daemon=True)
+        self.app = app
+        self.scheduler = scheduler
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease = timedelta(seconds=app.config['SCHEDULER_LEASE_SECONDS'])
+        self.renew_interval = app.config['SCHEDULER_RENEW_SECONDS']
+        self.is_leader = False
+        self._stopped = threading.Event()
+        atexit.register(self.stop)
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                with self.app.app_context():
+                    leader = self._try_acquire()
+            except Exception as e:
+                self.app.logger.warning("Scheduler lease check failed: %s", e)
+                leader = False
+            self._set_leader(leader)
+            self._stopped.wait(self.renew_interval)
+
+    def stop(self):
+        # Give up the lease on shutdown so another process can take over immediately
+        self._stopped.set()
+        if not self.is_leader:
+            return
+        self._set_leader(False)
+        try:
+            with self.app.app_context():
+                db.session.execute(
+                    update(SchedulerLease)
+                    .where(SchedulerLease.name == LEADER_LEASE_NAME, SchedulerLease.owner == self.owner)
+                    .values(expires_at=datetime.utcnow())
+                )
+                db.session.commit()
+        except Exception as e:
+            self.app.logger.warning("Could not release scheduler lease: %s", e)
+
+    def _try_acquire(self):
+        now = datetime.utcnow()
+        # Renew our own lease or take over an expired one in a single conditional UPDATE
+        result = db.session.execute(
+            update(SchedulerLease)
+            .where(
+                SchedulerLease.name == LEADER_LEASE_NAME,
+                or_(SchedulerLease.owner == self.owner, SchedulerLease.expires_at < now)
+            )
+            .values(owner=self.owner, expires_at=now + self.lease)
+        )
+        db.session.commit()
+        if result.rowcount:
+            return True
+
+        # First election ever: create the lease row, losing gracefully if another process beats us to it
+        if db.session.get(SchedulerLease, LEADER_LEASE_NAME) is not None:
+            db.session.rollback()
+            return False
+        try:
+            db.session.add(SchedulerLease(name=LEADER_LEASE_NAME, owner=self.owner, expires_at=now + self.lease))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            return False
+
+    def _set_leader(self, leader):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        if leader:
+            self.app.logger.info("Scheduler leadership acquired by %s", self.owner)
+            self.scheduler.resume()
+        else:
+            self.app.logger.info("Scheduler leadership released by %s", self.owner)
+            self.scheduler.pause()
@@ -0,0 +1,49 @@
+import warnings
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn, CreateIndex
+from config import db
+
+
+def sync_schema(app):
+    """
+    db.create_all() only creates missing tables, so columns and indexes declared on
+    models after a table already exists never reach the database. This adds any
+    missing column that can be added in place (nullable or with a server default)
+    and creates any missing index, one statement at a time so a failure (e.g. two
+    workers racing on startup) only skips that column or index.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            if not column.nullable and column.server_default is None:
+                app.logger.warning("Cannot add NOT NULL column %s.%s without a server default", table.name, column.name)
+                continue
+            column_spec = CreateColumn(column).compile(dialect=db.engine.dialect)
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN {column_spec}'))
+                app.logger.info("Added column %s.%s", table.name, column.name)
+            except Exception as e:
+                app.logger.warning("Could not add column %s.%s: %s", table.name, column.name, e)
+
+        # Some dialects cannot reflect expression indexes, hence IF NOT EXISTS below
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+                app.logger.info("Created index %s on %s", index.name, table.name)
+            except Exception as e:
+                app.logger.warning("Could not create index %s on %s: %s", index.name, table.name, e)
@@ -0,0 +1,114 @@
+import hashlib
+import re
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+from config import db
+from models import SummaryCacheEntry
+from utils.cache import TTLCache
+from utils.gemini import SUMMARY_PROMPT_VERSION
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_report_text(text):
+    # OCR and PDF extraction differ run to run only in whitespace, so that is all we fold
+    return _WHITESPACE.sub(' ', text or '').strip()
+
+
+def text_key(text):
+    digest = hashlib.sha256(f"{SUMMARY_PROMPT_VERSION}\n{normalize_report_text(text)}".encode()).hexdigest()
+    return f"text:{digest}"
+
+
+def part_key(prompt):
+    # The prompt already holds its template and text, so it needs no version
+    return f"part:{hashlib.sha256(prompt.encode()).hexdigest()}"
+
+
+def file_key(data):
+    # Byte-identical re-uploads are recognised before OCR/PDF extraction runs at all
+    digest = hashlib.sha256(f"{SUMMARY_PROMPT_VERSION}\n".encode() + data).hexdigest()
+    return f"file:{digest}"
+
+
+class SummaryCache:
+    """
+    Content-addressed report summaries: the summary_cache table, with a per-process
+    LRU of SUMMARY_CACHE_LOCAL_ENTRIES in front. Keys hash the prompt version with
+    either the uploaded bytes or the normalized extracted text, so entries never go
+    stale and need no invalidation; prune() evicts by age and by row count. The
+    partial analyses of long reports are kept here too, keyed by their prompt.
+    """
+
+    def __init__(self):
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        # Cached summary or None. Database hits are counted in the caller's transaction
+        if self.entries is None:
+            self._configure()
+        summary = self.entries.get(key)
+        if summary is not None:
+            return summary
+
+        summary = db.session.execute(select(SummaryCacheEntry.summary).where(SummaryCacheEntry.key == key)).scalar()
+        if summary is None:
+            return None
+        db.session.execute(
+            update(SummaryCacheEntry)
+            .where(SummaryCacheEntry.key == key)
+            .values(hits=SummaryCacheEntry.hits + 1, last_used_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        self.entries.set(key, summary)
+        return summary
+
+    def put(self, key, summary):
+        # Stored in the caller's transaction; a concurrent upload of the same report may have won the race
+        if self.entries is None:
+            self._configure()
+        self.entries.set(key, summary)
+        now = datetime.utcnow()
+        try:
+            with db.session.begin_nested():
+                db.session.add(SummaryCacheEntry(key=key, summary=summary, created_at=now, last_used_at=now))
+        except IntegrityError:
+            pass
+
+    def get_part(self, prompt):
+        # Partial analysis of a long report, see utils.gemini.summarize_text
+        return self.get(part_key(prompt))
+
+    def put_part(self, prompt, text):
+        self.put(part_key(prompt), text)
+
+    def prune(self):
+        # Drops rows unused for SUMMARY_CACHE_MAX_AGE_DAYS, then the least recently used beyond SUMMARY_CACHE_MAX_ROWS
+        config = current_app.config
+        cutoff = datetime.utcnow() - timedelta(days=config['SUMMARY_CACHE_MAX_AGE_DAYS'])
+        expired = db.session.execute(delete(SummaryCacheEntry).where(SummaryCacheEntry.last_used_at < cutoff)).rowcount
+
+        # last_used_at of the first row past the limit, found by walking ix_summary_cache_last_used
+        boundary = db.session.execute(
+            select(SummaryCacheEntry.last_used_at)
+            .order_by(SummaryCacheEntry.last_used_at.desc())
+            .offset(config['SUMMARY_CACHE_MAX_ROWS'])
+            .limit(1)
+        ).scalar()
+        overflow = 0
+        if boundary is not None:
+            overflow = db.session.execute(delete(SummaryCacheEntry).where(SummaryCacheEntry.last_used_at < boundary)).rowcount
+        db.session.commit()
+        return expired, overflow
+
+    def _configure(self):
+        with self.lock:
+            if self.entries is None:
+                self.entries = TTLCache(current_app.config['SUMMARY_CACHE_LOCAL_ENTRIES'], current_app.config['CACHE_TTL_SECONDS'])
+
+
+summary_cache = SummaryCache()
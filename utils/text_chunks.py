@@ -0,0 +1,54 @@
+import re
+
+# Page separator in extracted text: PDF extraction joins pages with it, and tesseract ends each page with it
+PAGE_BREAK = '\f'
+
+# Rough characters per token for English clinical text, close enough without a tokenizer
+CHARS_PER_TOKEN = 4
+
+# A blank line, or a line break before something that looks like a section heading:
+# '## Labs', 'DISCHARGE MEDICATIONS', 'Diagnosis: ...'
+_SECTION_BREAK = re.compile(
+    r'\n[ \t]*\n|\n(?=[ \t]*(?:#{1,6} |[A-Z][A-Z0-9 ,/&()-]{2,60}:?[ \t]*$|[A-Z][\w ,/&()-]{2,40}:))',
+    re.MULTILINE
+)
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_report_text(text, max_tokens):
+    """
+    Splits report text into chunks of at most max_tokens (estimated), cutting at
+    page breaks and section boundaries, falling back to line breaks and, for a
+    single overlong line, to a hard cut. Neighbouring pieces are packed together
+    so there are as few chunks as the budget allows.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces = []
+    for page in text.split(PAGE_BREAK):
+        for section in _SECTION_BREAK.split(page):
+            section = section.strip()
+            if not section:
+                continue
+            if len(section) <= max_chars:
+                pieces.append(section)
+                continue
+            lines = []
+            for line in section.splitlines():
+                lines.extend(line[start:start + max_chars] for start in range(0, len(line), max_chars))
+            pieces.extend(_pack(lines, max_chars, '\n'))
+    return _pack(pieces, max_chars, '\n\n')
+
+
+def _pack(pieces, max_chars, separator):
+    chunks, current = [], ''
+    for piece in pieces:
+        if current and len(current) + len(separator) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ''
+        current = f"{current}{separator}{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
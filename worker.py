@@ -0,0 +1,22 @@
+# Runs the APScheduler jobs and the report worker pool in a dedicated process so web workers
+# can start with SCHEDULER_MODE=off and REPORT_WORKER_MODE=off:
+#   SCHEDULER_MODE=off REPORT_WORKER_MODE=off gunicorn app:app
+#   python worker.py
+# Several worker.py processes can run side by side; the scheduler-leader lease makes sure only one runs
+# the scheduled jobs, while report jobs are shared out between all of them.
+import os
+import time
+
+os.environ['SCHEDULER_MODE'] = 'leader'
+os.environ['REPORT_WORKER_MODE'] = 'embedded'
+
+from app import app, leader_elector, report_workers
+
+if __name__ == "__main__":
+    app.logger.info("Scheduler worker %s started", leader_elector.owner)
+    try:
+        while leader_elector.is_alive() and report_workers.is_alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        leader_elector.stop()
+        report_workers.stop()